@@ -0,0 +1,138 @@
+"""Async read-only flight endpoints for ASGI servers.
+
+They return the same data as the ``FlightViewSet`` list, retrieve and
+``seats`` actions. They use the async ORM, so one event loop can serve many
+concurrent searches without holding a worker thread per request.
+"""
+import base64
+import binascii
+import functools
+
+from django.db.models import Q
+from django.http import HttpResponse, JsonResponse
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.http import require_GET
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotAuthenticated, NotFound
+from rest_framework_simplejwt.exceptions import TokenError
+
+from airport.filters import flight_search_params
+from airport.models import Flight, FlightSearchIndex
+from airport.pagination import FlightCursorPagination
+from airport.seat_map import aget_seat_map
+from airport.serializers import FlightDetailSerializer, SeatMapSerializer
+from airport.views import FlightViewSet
+from user.authentication import CachedJWTAuthentication
+
+
+async def authenticate(request):
+    """Return the user of the request's JWT access token, like ``CachedJWTAuthentication`` does."""
+    authentication = CachedJWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = authentication.get_raw_token(header) if header is not None else None
+    if raw_token is None:
+        raise NotAuthenticated()
+    return await authentication.aget_user(authentication.get_validated_token(raw_token))
+
+
+def async_api_view(view):
+    """Authenticate the request and turn DRF exceptions into JSON error responses."""
+
+    @require_GET
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            request.user = await authenticate(request)
+            return await view(request, *args, **kwargs)
+        except TokenError as error:
+            return JsonResponse({"detail": str(error)}, status=status.HTTP_401_UNAUTHORIZED)
+        except APIException as error:
+            data = error.detail if isinstance(error.detail, (list, dict)) else {"detail": error.detail}
+            response = JsonResponse(data, status=error.status_code, safe=False)
+            if error.status_code == status.HTTP_401_UNAUTHORIZED:
+                response.headers["WWW-Authenticate"] = 'Bearer realm="api"'
+            return response
+
+    return wrapper
+
+
+def encode_cursor(departure_time, flight_id):
+    position = f"{departure_time.isoformat()}|{flight_id}"
+    return base64.urlsafe_b64encode(position.encode()).decode("ascii")
+
+
+def decode_cursor(cursor):
+    try:
+        departure_time, flight_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        departure_time, flight_id = parse_datetime(departure_time), int(flight_id)
+    except (binascii.Error, UnicodeError, ValueError):
+        departure_time = None
+    if departure_time is None:
+        raise NotFound("Invalid cursor")
+    return departure_time, flight_id
+
+
+def page_size(request):
+    try:
+        size = int(request.GET[FlightCursorPagination.page_size_query_param])
+    except (KeyError, ValueError):
+        return FlightCursorPagination.page_size
+    return max(1, min(size, FlightCursorPagination.max_page_size))
+
+
+@async_api_view
+async def flight_list(request):
+    """Flight search with keyset pagination on ``(departure_time, id)``; only forward cursors are returned."""
+    row_serializer = FlightViewSet.row_serializer
+    queryset = FlightSearchIndex.objects.search(**flight_search_params(request.GET)).values(*row_serializer.columns)
+    cursor = request.GET.get("cursor")
+    if cursor:
+        departure_time, flight_id = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(departure_time__gt=departure_time) | Q(departure_time=departure_time, id__gt=flight_id)
+        )
+    size = page_size(request)
+    flights = [flight async for flight in queryset[:size + 1]]
+
+    next_url = None
+    if len(flights) > size:
+        flights = flights[:size]
+        query = request.GET.copy()
+        query["cursor"] = encode_cursor(flights[-1]["departure_time"], flights[-1]["id"])
+        next_url = request.build_absolute_uri(f"{request.path}?{query.urlencode()}")
+    return JsonResponse({
+        "next": next_url,
+        "previous": None,
+        "results": row_serializer.serialize(flights),
+    })
+
+
+async def get_flight(queryset, pk):
+    try:
+        return await queryset.aget(pk=pk)
+    except Flight.DoesNotExist:
+        raise NotFound()
+
+
+@async_api_view
+async def flight_detail(request, pk):
+    flight = await get_flight(
+        Flight.objects.select_related(
+            "route__source", "route__destination", "airplane__airplane_type"
+        ).with_occupancy(),
+        pk,
+    )
+    return JsonResponse(FlightDetailSerializer(flight).data)
+
+
+@async_api_view
+async def flight_seats(request, pk):
+    """Seat grid of the flight; ``?format=bitmap`` or ``Accept: application/octet-stream`` returns the bitmap."""
+    seat_map = await aget_seat_map(await get_flight(Flight.objects.select_related("airplane"), pk))
+    if request.GET.get("format") == "bitmap" or "application/octet-stream" in request.headers.get("Accept", ""):
+        return HttpResponse(
+            seat_map.to_bytes(),
+            content_type="application/octet-stream",
+            headers={"X-Seat-Rows": seat_map.rows, "X-Seats-In-Row": seat_map.seats_in_row},
+        )
+    return JsonResponse(SeatMapSerializer(seat_map).data)
@@ -0,0 +1,79 @@
+import re
+import unicodedata
+from bisect import bisect_left
+
+from airport.local_cache import ProcessLocalCache
+from airport.models import Airport
+
+AUTOCOMPLETE_FIELDS = ("id", "name", "closest_big_city", "latitude", "longitude")
+# match kinds, best first
+CITY_PREFIX, NAME_PREFIX, WORD_PREFIX = range(3)
+
+_separators = re.compile(r"[\W_]+")
+
+
+def normalize(text):
+    """Fold case and accents and collapse punctuation: ``"Zürich-Kloten"`` -> ``"zurich kloten"``."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(character for character in decomposed if not unicodedata.combining(character))
+    return _separators.sub(" ", stripped.casefold()).strip()
+
+
+class AirportPrefixIndex:
+    """Type-ahead over airport names and cities with sorted arrays of normalized terms.
+
+    There is one array of whole cities, one of whole names and one of the
+    words in both, each sorted by ``(term, name, id)``. Bisection finds the
+    range of terms starting with the query, which is already in result
+    order, so a query reads at most a few more than ``limit`` entries per
+    array. City matches rank before name matches before word matches.
+    """
+
+    def __init__(self, airports):
+        self.airports = []
+        self.words = []
+        cities, names, words = [], [], []
+        for airport in airports:
+            index = len(self.airports)
+            self.airports.append(airport)
+            city, name = normalize(airport["closest_big_city"]), normalize(airport["name"])
+            airport_words = set(city.split() + name.split())
+            self.words.append(airport_words)
+            cities.append((city, name, index))
+            names.append((name, name, index))
+            words.extend((word, name, index) for word in airport_words)
+        self.arrays = []
+        for entries in (cities, names, words):
+            entries.sort()
+            self.arrays.append(([term for term, _, _ in entries], [index for _, _, index in entries]))
+
+    @classmethod
+    def load(cls):
+        return cls(Airport.objects.order_by("id").values(*AUTOCOMPLETE_FIELDS))
+
+    def search(self, query, limit=10):
+        """Return up to ``limit`` airports as ``AirportSerializer`` data, best match first."""
+        query = normalize(query)
+        if not query:
+            return []
+        first, *rest = query.split()
+        found = []
+        seen = set()
+        for kind, (terms, indexes) in enumerate(self.arrays):
+            # whole cities and names match the whole query, words its first word plus the others anywhere
+            prefix = first if kind == WORD_PREFIX else query
+            position = bisect_left(terms, prefix)
+            while len(found) < limit and position < len(terms) and terms[position].startswith(prefix):
+                index = indexes[position]
+                position += 1
+                if index in seen or (kind == WORD_PREFIX and not self.matches_rest(index, rest)):
+                    continue
+                seen.add(index)
+                found.append(self.airports[index])
+        return found
+
+    def matches_rest(self, index, rest):
+        return all(any(word.startswith(part) for word in self.words[index]) for part in rest)
+
+
+autocomplete_index = ProcessLocalCache("airport_autocomplete", AirportPrefixIndex.load)
@@ -0,0 +1,350 @@
+"""Batch create, update and delete of flights and tickets.
+
+A batch is validated as a whole before anything is written: items are
+parsed, the rows they refer to are loaded with one query per model into
+lookup maps, and errors are collected per item. A batch with any invalid
+item is rejected with ``{"errors": [...]}`` holding one entry per item, ``{}``
+for the valid ones. Valid batches are written with ``bulk_create()``,
+``bulk_update()`` or a single ``DELETE`` in one transaction, followed by the
+``*_bulk_*`` signals that keep the derived tables and caches in sync.
+"""
+import copy
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+
+from airport.models import Airplane, Crew, Flight, Order, Route, Ticket
+from airport.occupancy import sold_tickets_by_flight
+from airport.scheduling import airplane_swap_error, overlapping, stranded_tickets, sweep
+from airport.signals import (flights_bulk_created, flights_bulk_deleted, flights_bulk_updated, tickets_bulk_created,
+                             tickets_bulk_deleted, tickets_bulk_updated)
+
+MAX_BATCH_SIZE = 1000
+FLIGHT_FIELDS = ("route", "airplane", "departure_time", "arrival_time")
+TICKET_FIELDS = ("flight", "order", "row", "seat")
+
+
+class FlightBatchItemSerializer(serializers.Serializer):
+    id = serializers.IntegerField(required=False)
+    route = serializers.IntegerField()
+    airplane = serializers.IntegerField()
+    departure_time = serializers.DateTimeField()
+    arrival_time = serializers.DateTimeField()
+
+
+class TicketBatchItemSerializer(serializers.Serializer):
+    id = serializers.IntegerField(required=False)
+    flight = serializers.IntegerField()
+    order = serializers.IntegerField()
+    row = serializers.IntegerField()
+    seat = serializers.IntegerField()
+
+
+class Batch:
+    """Validation state of one batch: the parsed items and one error dict per item."""
+
+    def __init__(self, items, item_serializer=None, update=False):
+        if not isinstance(items, list) or not items:
+            raise ValidationError({"errors": ["Expected a non-empty list."]})
+        if len(items) > MAX_BATCH_SIZE:
+            raise ValidationError({"errors": [f"Expected at most {MAX_BATCH_SIZE} items, got {len(items)}."]})
+        self.items = []
+        self.errors = []
+        for item in items:
+            if item_serializer is None:
+                # deletes take plain ids
+                self.items.append({"id": item} if isinstance(item, int) and not isinstance(item, bool) else None)
+                self.errors.append({} if self.items[-1] else {"id": "Expected an integer id."})
+                continue
+            serializer = item_serializer(data=item, partial=update)
+            if serializer.is_valid():
+                self.items.append(dict(serializer.validated_data))
+                self.errors.append({})
+            else:
+                self.items.append(None)
+                self.errors.append(dict(serializer.errors))
+        if update or item_serializer is None:
+            self.require_ids()
+
+    def valid(self):
+        """Yield ``(position, item)`` for items without errors so far."""
+        for position, item in enumerate(self.items):
+            if item is not None and not self.errors[position]:
+                yield position, item
+
+    def add_error(self, position, field, message):
+        self.errors[position].setdefault(field, message)
+
+    def require_ids(self):
+        seen = {}
+        for position, item in self.valid():
+            if "id" not in item:
+                self.add_error(position, "id", "This field is required.")
+            elif item["id"] in seen:
+                self.add_error(position, "id", f"Duplicate of item {seen[item['id']]}.")
+            else:
+                seen[item["id"]] = position
+
+    def load(self, model):
+        """Lock and load the rows the valid items refer to by id; unknown ids become item errors."""
+        ids = {item["id"] for _, item in self.valid()}
+        rows = model.objects.select_for_update().in_bulk(ids)
+        for position, item in self.valid():
+            if item["id"] not in rows:
+                self.add_error(position, "id", f"{model.__name__} {item['id']} does not exist.")
+        return rows
+
+    def check_references(self, field, model):
+        ids = {item[field] for _, item in self.valid() if field in item}
+        existing = set(model.objects.filter(id__in=ids).values_list("id", flat=True))
+        for position, item in self.valid():
+            if field in item and item[field] not in existing:
+                self.add_error(position, field, f"{model.__name__} {item[field]} does not exist.")
+
+    def raise_errors(self):
+        if any(self.errors):
+            raise ValidationError({"errors": self.errors})
+
+
+def merged(item, row, fields):
+    """Values of ``fields`` after the update: the item's where given, the stored row's otherwise."""
+    return {
+        field: item[field] if field in item else getattr(row, row._meta.get_field(field).attname) for field in fields
+    }
+
+
+def check_airplane_schedules(batch, flights_by_position):
+    """Reject items whose airplane flies another flight of the batch or the database at the same time."""
+    airplane_ids = {flight.airplane_id for flight in flights_by_position.values()}
+    if not airplane_ids:
+        return
+    # serialize schedule changes of the same airplanes, as single flight writes do
+    Airplane.objects.select_for_update().filter(id__in=airplane_ids).exists()
+    updated_ids = {flight.id for flight in flights_by_position.values() if flight.id}
+    stored = overlapping(
+        Flight.objects.filter(airplane_id__in=airplane_ids).exclude(id__in=updated_ids),
+        min(flight.departure_time for flight in flights_by_position.values()),
+        max(flight.arrival_time for flight in flights_by_position.values()),
+    ).values_list("airplane_id", "id", "departure_time", "arrival_time")
+
+    intervals = defaultdict(list)
+    for airplane_id, flight_id, departure_time, arrival_time in stored:
+        intervals[airplane_id].append((("flight", flight_id), departure_time, arrival_time))
+    for position, flight in flights_by_position.items():
+        intervals[flight.airplane_id].append((("item", position), flight.departure_time, flight.arrival_time))
+    for airplane_intervals in intervals.values():
+        airplane_intervals.sort(key=lambda interval: interval[1])
+        for first, second, _, _ in sweep(airplane_intervals):
+            for (kind, position), (other_kind, other) in ((first, second), (second, first)):
+                if kind == "item":
+                    batch.add_error(
+                        position, "airplane", f"The airplane is already assigned to {other_kind} {other} at that time."
+                    )
+
+
+def check_crew_schedules(batch, flights_by_position, stored):
+    """Reject retimed items whose crew members fly another flight of the batch or the database at the same time."""
+    retimed = {
+        position: flight for position, flight in flights_by_position.items()
+        if (flight.departure_time, flight.arrival_time)
+        != (stored[flight.id].departure_time, stored[flight.id].arrival_time)
+    }
+    if not retimed:
+        return
+    positions = {flight.id: position for position, flight in retimed.items()}
+    crew_flights = Crew.flight.through.objects
+    assignments = list(crew_flights.filter(flight_id__in=positions).values_list("crew_id", "flight_id"))
+    if not assignments:
+        return
+    stored_flights = crew_flights.filter(
+        crew_id__in={crew_id for crew_id, _ in assignments},
+        flight__departure_time__lt=max(flight.arrival_time for flight in retimed.values()),
+        flight__arrival_time__gt=min(flight.departure_time for flight in retimed.values()),
+    ).exclude(flight_id__in=positions).values_list(
+        "crew_id", "flight_id", "flight__departure_time", "flight__arrival_time"
+    )
+
+    intervals = defaultdict(list)
+    for crew_id, flight_id, departure_time, arrival_time in stored_flights:
+        intervals[crew_id].append((("flight", flight_id), departure_time, arrival_time))
+    for crew_id, flight_id in assignments:
+        flight = retimed[positions[flight_id]]
+        intervals[crew_id].append((("item", positions[flight_id]), flight.departure_time, flight.arrival_time))
+    for crew_id, crew_intervals in intervals.items():
+        crew_intervals.sort(key=lambda interval: interval[1])
+        for first, second, _, _ in sweep(crew_intervals):
+            for (kind, position), (other_kind, other) in ((first, second), (second, first)):
+                if kind == "item":
+                    batch.add_error(
+                        position, "crew",
+                        f"Crew member {crew_id} is already assigned to {other_kind} {other} at that time.",
+                    )
+
+
+def check_airplane_swaps(batch, flights_by_position, stored):
+    """Reject items that move a flight to an airplane without seats for some of its sold tickets."""
+    swapped = {
+        position: flight for position, flight in flights_by_position.items()
+        if flight.airplane_id != stored[flight.id].airplane_id
+    }
+    airplanes = Airplane.objects.in_bulk({flight.airplane_id for flight in swapped.values()})
+    stranded = stranded_tickets({flight.id: airplanes[flight.airplane_id] for flight in swapped.values()})
+    for position, flight in swapped.items():
+        ticket_ids = stranded.get(flight.id)
+        if ticket_ids:
+            batch.add_error(position, "airplane", airplane_swap_error(airplanes[flight.airplane_id], ticket_ids))
+
+
+def validate_flights(batch, stored=None):
+    """Build the flights of the valid items and check routes, airplanes, seats, times and schedules."""
+    batch.check_references("route", Route)
+    batch.check_references("airplane", Airplane)
+    flights = {}
+    for position, item in batch.valid():
+        values = merged(item, stored[item["id"]], FLIGHT_FIELDS) if stored is not None else item
+        if values["arrival_time"] <= values["departure_time"]:
+            batch.add_error(position, "arrival_time", "Arrival must be after departure.")
+            continue
+        flight = copy.copy(stored[item["id"]]) if stored is not None else Flight()
+        flight.route_id, flight.airplane_id = values["route"], values["airplane"]
+        flight.departure_time, flight.arrival_time = values["departure_time"], values["arrival_time"]
+        flights[position] = flight
+    if stored is not None:
+        check_airplane_swaps(batch, flights, stored)
+        check_crew_schedules(batch, flights, stored)
+    check_airplane_schedules(batch, flights)
+    batch.raise_errors()
+    return [flights[position] for position in sorted(flights)]
+
+
+@transaction.atomic
+def create_flights(items):
+    batch = Batch(items, FlightBatchItemSerializer)
+    flights = Flight.objects.bulk_create(validate_flights(batch))
+    flights_bulk_created.send(sender=Flight, flights=flights)
+    return flights
+
+
+@transaction.atomic
+def update_flights(items):
+    batch = Batch(items, FlightBatchItemSerializer, update=True)
+    stored = batch.load(Flight)
+    flights = validate_flights(batch, stored)
+    changed = {field for _, item in batch.valid() for field in item}
+    fields = [field for field in FLIGHT_FIELDS if field in changed]
+    if fields:
+        Flight.objects.bulk_update(flights, fields)
+        flights_bulk_updated.send(
+            sender=Flight, flights=flights, previous={flight.id: stored[flight.id] for flight in flights}
+        )
+    return flights
+
+
+@transaction.atomic
+def delete_flights(items):
+    """Delete flights with their tickets and crew assignments without loading the tickets."""
+    batch = Batch(items)
+    stored = batch.load(Flight)
+    batch.raise_errors()
+    flights = [stored[item["id"]] for _, item in batch.valid()]
+    flight_ids = [flight.id for flight in flights]
+    tickets_sold = sold_tickets_by_flight(flight_ids)
+    tickets = Ticket.objects.filter(flight_id__in=flight_ids)
+    # the rows only reference flights, flights_bulk_deleted accounts for them and deletes the search index rows;
+    # BatchWriteTestCase.test_deletes_leave_no_references fails when a new relation would be left dangling
+    tickets._raw_delete(tickets.db)
+    assignments = Crew.flight.through.objects.filter(flight_id__in=flight_ids)
+    assignments._raw_delete(assignments.db)
+    flights_bulk_deleted.send(sender=Flight, flights=flights, tickets_sold=tickets_sold)
+    deleted = Flight.objects.filter(id__in=flight_ids)
+    deleted._raw_delete(deleted.db)
+    return flight_ids
+
+
+def validate_tickets(batch, stored=None):
+    """Build the tickets of the valid items and check flights, orders, seat ranges and taken seats."""
+    batch.check_references("order", Order)
+    tickets = {}
+    for position, item in batch.valid():
+        values = merged(item, stored[item["id"]], TICKET_FIELDS) if stored is not None else item
+        ticket = copy.copy(stored[item["id"]]) if stored is not None else Ticket()
+        ticket.flight_id, ticket.order_id = values["flight"], values["order"]
+        ticket.row, ticket.seat = values["row"], values["seat"]
+        tickets[position] = ticket
+
+    flights = Flight.objects.select_related("airplane").in_bulk({ticket.flight_id for ticket in tickets.values()})
+    updated_ids = {ticket.id for ticket in tickets.values() if ticket.id}
+    taken = set(
+        Ticket.objects.filter(
+            flight_id__in=flights,
+            row__in={ticket.row for ticket in tickets.values()},
+            seat__in={ticket.seat for ticket in tickets.values()},
+        ).exclude(id__in=updated_ids).values_list("flight_id", "row", "seat")
+    )
+    claimed = {}
+    for position, ticket in tickets.items():
+        flight = flights.get(ticket.flight_id)
+        if flight is None:
+            batch.add_error(position, "flight", f"Flight {ticket.flight_id} does not exist.")
+            continue
+        seat_errors = Ticket.seat_errors(ticket.row, ticket.seat, flight.airplane)
+        if seat_errors:
+            batch.errors[position].update(seat_errors)
+            continue
+        seat = (ticket.flight_id, ticket.row, ticket.seat)
+        if seat in taken:
+            batch.add_error(position, "seat", "This seat is already taken.")
+        elif seat in claimed:
+            batch.add_error(position, "seat", f"This seat is also taken by item {claimed[seat]}.")
+        else:
+            claimed[seat] = position
+    batch.raise_errors()
+    return [tickets[position] for position in sorted(tickets)]
+
+
+def write_tickets(write):
+    try:
+        with transaction.atomic():
+            return write()
+    except IntegrityError:
+        # a seat was taken by a concurrent request, or a batch swaps seats between its tickets
+        raise ValidationError({"errors": ["A seat of this batch is already taken, nothing was written."]})
+
+
+def create_tickets(items):
+    def write():
+        tickets = Ticket.objects.bulk_create(validate_tickets(Batch(items, TicketBatchItemSerializer)))
+        tickets_bulk_created.send(sender=Ticket, tickets=tickets)
+        return tickets
+
+    return write_tickets(write)
+
+
+def update_tickets(items):
+    def write():
+        batch = Batch(items, TicketBatchItemSerializer, update=True)
+        stored = batch.load(Ticket)
+        tickets = validate_tickets(batch, stored)
+        Ticket.objects.bulk_update(tickets, ["flight", "order", "row", "seat"])
+        tickets_bulk_updated.send(
+            sender=Ticket, tickets=tickets, previous={ticket.id: stored[ticket.id] for ticket in tickets}
+        )
+        return tickets
+
+    return write_tickets(write)
+
+
+@transaction.atomic
+def delete_tickets(items):
+    batch = Batch(items)
+    stored = batch.load(Ticket)
+    batch.raise_errors()
+    tickets = [stored[item["id"]] for _, item in batch.valid()]
+    deleted = Ticket.objects.filter(id__in=[ticket.id for ticket in tickets])
+    # tickets have no dependent rows (see test_deletes_leave_no_references); tickets_bulk_deleted replaces the
+    # per-ticket post_delete signal
+    deleted._raw_delete(deleted.db)
+    tickets_bulk_deleted.send(sender=Ticket, tickets=tickets)
+    return [ticket.id for ticket in tickets]
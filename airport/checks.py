@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+PROCESS_LOCAL_CACHES = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+
+@register(deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """Invalidations of seat maps, cached responses and cached users only reach processes sharing the cache."""
+    backend = settings.CACHES["default"]["BACKEND"]
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [
+        Warning(
+            f"The default cache ({backend}) is not shared between processes.",
+            hint="Seat maps, reference responses and users cached by one worker are not invalidated by writes "
+                 "handled in another. Set CACHE_BACKEND to a shared cache such as Redis or Memcached.",
+            id="airport.W001",
+        )
+    ]
@@ -0,0 +1,110 @@
+import csv
+import datetime
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Exists, OuterRef
+from rest_framework.exceptions import ValidationError
+
+from airport.models import Flight, Order, Ticket
+
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_FORMATS = ("ndjson", "csv")
+
+# output column -> lookup, kept flat so rows come straight from values_list()
+EXPORT_COLUMNS = {
+    "tickets": {
+        "id": "id",
+        "row": "row",
+        "seat": "seat",
+        "flight": "flight_id",
+        "order": "order_id",
+        "departure_time": "flight__departure_time",
+        "created_at": "order__created_at",
+        "customer": "order__user__email",
+    },
+    "orders": {
+        "id": "id",
+        "created_at": "created_at",
+        "user": "user_id",
+        "customer": "user__email",
+    },
+    "flights": {
+        "id": "id",
+        "route": "route_id",
+        "source": "route__source_id",
+        "destination": "route__destination_id",
+        "airplane": "airplane_id",
+        "departure_time": "departure_time",
+        "arrival_time": "arrival_time",
+    },
+}
+
+
+def _export_queryset(kind, departure_after=None, departure_before=None, since_id=None, since=None):
+    if kind == "tickets":
+        queryset = Ticket.objects.all()
+        departure_lookup, created_lookup = "flight__departure_time", "order__created_at"
+    elif kind == "orders":
+        queryset = Order.objects.all()
+        departure_lookup, created_lookup = None, "created_at"
+        tickets = Ticket.objects.filter(order=OuterRef("pk"))
+        if departure_after is not None:
+            tickets = tickets.filter(flight__departure_time__gte=departure_after)
+        if departure_before is not None:
+            tickets = tickets.filter(flight__departure_time__lt=departure_before)
+        if departure_after is not None or departure_before is not None:
+            queryset = queryset.filter(Exists(tickets))
+    else:
+        queryset = Flight.objects.all()
+        departure_lookup, created_lookup = "departure_time", None
+        if since is not None:
+            raise ValidationError({"since": "Flights have no creation time, use since_id instead."})
+
+    if departure_lookup and departure_after is not None:
+        queryset = queryset.filter(**{f"{departure_lookup}__gte": departure_after})
+    if departure_lookup and departure_before is not None:
+        queryset = queryset.filter(**{f"{departure_lookup}__lt": departure_before})
+    if since_id is not None:
+        queryset = queryset.filter(id__gt=since_id)
+    if created_lookup and since is not None:
+        queryset = queryset.filter(**{f"{created_lookup}__gte": since})
+    return queryset.order_by("id").values_list(*EXPORT_COLUMNS[kind].values())
+
+
+def export_rows(kind, **params):
+    """Iterate over flat export rows of ``kind`` with a server-side cursor, in ``id`` order.
+
+    Rows are tuples in the column order of ``EXPORT_COLUMNS[kind]``.
+    """
+    return _export_queryset(kind, **params).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def _plain(row):
+    # full microsecond precision, so "since" filters can be fed straight back from an export
+    return [value.isoformat() if isinstance(value, datetime.datetime) else value for value in row]
+
+
+def ndjson_lines(kind, rows):
+    columns = tuple(EXPORT_COLUMNS[kind])
+    for row in rows:
+        yield json.dumps(dict(zip(columns, _plain(row))), cls=DjangoJSONEncoder) + "\n"
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def csv_lines(kind, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_COLUMNS[kind])
+    for row in rows:
+        yield writer.writerow(_plain(row))
+
+
+def export_lines(kind, output_format, **params):
+    rows = export_rows(kind, **params)
+    if output_format == "csv":
+        return csv_lines(kind, rows)
+    return ndjson_lines(kind, rows)
@@ -0,0 +1,200 @@
+"""Sparse fieldsets and expanded relations, e.g. ``?fields=id,route&expand=route.source``.
+
+``expand`` replaces the id of a relation with the related object, dotted
+paths expand further down. ``fields`` keeps only the named fields, dotted
+names pick the fields of a nested object. Serializers opt in with
+``ExpandableFieldsMixin`` and name the relations they can expand in
+``expandable_fields``. ``plan_queryset`` walks the resulting serializer and
+builds ``select_related()``, ``prefetch_related()`` and ``only()`` from it,
+so the query loads just the relations and columns that are serialized.
+"""
+from functools import cached_property
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+
+from airport.filters import fieldset_params
+from airport.pagination import ordering_columns
+
+
+class FieldSet:
+    """The fields and expansions requested for one serializer; ``fields`` is ``None`` for all of them."""
+
+    def __init__(self, fields=None, expand=None, path=""):
+        self.fields = fields
+        self.expand = expand or {}
+        self.path = path
+
+    def child(self, name):
+        fields = self.fields.get(name) if self.fields is not None else None
+        return FieldSet(fields or None, self.expand.get(name), f"{self.path}{name}.")
+
+    def is_flat(self):
+        """Whether only top-level fields are picked, so the serializer output has no nested objects to add."""
+        return not self.expand and not any((self.fields or {}).values())
+
+
+class ExpandableFieldsMixin:
+    """Drop the fields that were not requested and nest ``expandable_fields`` that were expanded.
+
+    ``expandable_fields`` maps a relation to the serializer of the related
+    model; to-many relations are nested with ``many=True``. Expanding a field
+    that is already nested only passes the dotted rest on to it.
+    """
+
+    expandable_fields = {}
+
+    def __init__(self, *args, fieldset=None, **kwargs):
+        self._fieldset = fieldset
+        super().__init__(*args, **kwargs)
+
+    @property
+    def fieldset(self):
+        if self._fieldset is not None:
+            return self._fieldset
+        field = self.parent if isinstance(self.parent, serializers.ListSerializer) else self
+        parent_fieldset = getattr(field.parent, "fieldset", None)
+        return parent_fieldset.child(field.field_name) if parent_fieldset is not None else None
+
+    def get_fields(self):
+        fields = super().get_fields()
+        fieldset = self.fieldset
+        if fieldset is None:
+            return fields
+        for name in fieldset.expand:
+            if name in self.expandable_fields:
+                relation = self.Meta.model._meta.get_field(name)
+                fields[name] = self.expandable_fields[name](
+                    read_only=True,
+                    many=relation.many_to_many or relation.one_to_many,
+                    fieldset=fieldset.child(name),
+                )
+            elif not isinstance(fields.get(name), serializers.BaseSerializer):
+                raise ValidationError({"expand": f"{fieldset.path}{name} cannot be expanded."})
+        if fieldset.fields is not None:
+            for name, subfields in fieldset.fields.items():
+                if name not in fields:
+                    raise ValidationError({"fields": f"Unknown field {fieldset.path}{name}."})
+                if subfields and not isinstance(fields[name], serializers.BaseSerializer):
+                    raise ValidationError({"fields": f"Expand {fieldset.path}{name} to pick its fields."})
+            fields = {name: field for name, field in fields.items() if name in fieldset.fields}
+        return fields
+
+
+def _model_field(model, name):
+    try:
+        return model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return None
+
+
+def _all_columns(model):
+    return [field.name for field in model._meta.concrete_fields]
+
+
+def query_plan(serializer, model, annotations=()):
+    """Return ``(select_related, prefetch_related, only)`` lookups for what ``serializer`` reads from ``model``.
+
+    Fields read from model properties, unless named in the serializer's
+    ``annotation_fields``, could read any column, so they load all columns
+    of their model. Related objects whose serializer annotates its queryset
+    with ``annotate_queryset()`` are prefetched, as a join cannot annotate them.
+    """
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    select_related, prefetch_related, only = [], [], [model._meta.pk.name]
+    for name, field in serializer.fields.items():
+        if field.write_only or name in getattr(serializer, "annotation_fields", ()):
+            continue
+        if field.source == "*":
+            only += _all_columns(model)
+            continue
+        first, *rest = field.source_attrs
+        model_field = _model_field(model, first)
+        if model_field is None:
+            if first not in annotations:
+                only += _all_columns(model)
+            continue
+        nested = isinstance(field, (serializers.BaseSerializer, serializers.ManyRelatedField))
+        if not model_field.is_relation or not (nested or rest):
+            only.append(model_field.name)
+            continue
+
+        related_model = model_field.related_model
+        if model_field.many_to_many or model_field.one_to_many:
+            if isinstance(field, serializers.ManyRelatedField):
+                queryset = related_model._default_manager.only(related_model._meta.pk.name)
+            else:
+                # the reverse foreign key is read to attach the prefetched rows to their parent
+                remote = (model_field.remote_field.name,) if model_field.one_to_many else ()
+                queryset = plan_queryset(related_model._default_manager.all(), field, remote)
+            prefetch_related.append(Prefetch(model_field.name, queryset=queryset))
+            continue
+
+        only.append(model_field.name)
+        if nested and hasattr(field, "annotate_queryset"):
+            prefetch_related.append(
+                Prefetch(model_field.name, queryset=plan_queryset(related_model._default_manager.all(), field))
+            )
+            continue
+        select_related.append(model_field.name)
+        if nested:
+            nested_select, nested_prefetch, nested_only = query_plan(field, related_model)
+        else:
+            # a dotted source such as ``user.email``
+            column = _model_field(related_model, rest[0])
+            nested_select, nested_prefetch = [], []
+            nested_only = [column.name] if column is not None and not column.is_relation else []
+        select_related += [f"{model_field.name}__{lookup}" for lookup in nested_select]
+        prefetch_related += [
+            Prefetch(f"{model_field.name}__{prefetch.prefetch_through}", queryset=prefetch.queryset)
+            for prefetch in nested_prefetch
+        ]
+        only += [f"{model_field.name}__{column}" for column in nested_only]
+    return select_related, prefetch_related, only
+
+
+def plan_queryset(queryset, serializer, columns=()):
+    """Replace the related lookups and loaded columns of ``queryset`` with those ``serializer`` needs.
+
+    ``columns`` are loaded as well, e.g. the ones a cursor paginator reads.
+    """
+    child = serializer.child if isinstance(serializer, serializers.ListSerializer) else serializer
+    if hasattr(child, "annotate_queryset") and set(child.annotation_fields) & set(child.fields):
+        queryset = child.annotate_queryset(queryset)
+    select_related, prefetch_related, only = query_plan(serializer, queryset.model, queryset.query.annotations)
+    queryset = queryset.select_related(None).prefetch_related(None)
+    if select_related:
+        queryset = queryset.select_related(*select_related)
+    if prefetch_related:
+        queryset = queryset.prefetch_related(*prefetch_related)
+    return queryset.only(*dict.fromkeys([*only, *columns]))
+
+
+class FieldSetMixin:
+    """Serve ``?fields=`` and ``?expand=`` on list and retrieve with a query planned from the serializer."""
+
+    @cached_property
+    def fieldset(self):
+        if getattr(self, "request", None) is None or self.action not in ("list", "retrieve"):
+            return None
+        params = fieldset_params(self.request.query_params)
+        return FieldSet(**params) if params is not None else None
+
+    def get_serializer(self, *args, **kwargs):
+        if self.fieldset is not None:
+            kwargs.setdefault("fieldset", self.fieldset)
+        return super().get_serializer(*args, **kwargs)
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.fieldset is None:
+            return queryset
+        serializer = self.get_serializer()
+        # querysets of other models, such as the flight search index, are served as rows
+        if queryset.model is serializer.Meta.model:
+            columns = ordering_columns(self.paginator) if self.action == "list" else ()
+            queryset = plan_queryset(queryset, serializer, columns)
+        return queryset
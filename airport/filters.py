@@ -0,0 +1,211 @@
+import datetime
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+
+
+def _parse_int(query_params, name):
+    value = query_params.get(name)
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValidationError({name: f"Expected an integer id, got {value!r}."})
+
+
+def _parse_moment(query_params, name, end_of_day=False):
+    value = query_params.get(name)
+    if not value:
+        return None
+    try:
+        day = parse_date(value)
+        if day is not None:
+            if end_of_day:
+                day += datetime.timedelta(days=1)
+            moment = datetime.datetime.combine(day, datetime.time.min)
+        else:
+            moment = parse_datetime(value)
+            if moment is None:
+                raise ValueError
+    except ValueError:
+        raise ValidationError({name: f"Expected a date or datetime in ISO 8601 format, got {value!r}."})
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def flight_search_params(query_params):
+    """Turn flight search query parameters into keyword arguments for ``FlightQuerySet.search``.
+
+    ``departure_before`` given as a plain date includes the whole day.
+    """
+    return {
+        "source": _parse_int(query_params, "source"),
+        "destination": _parse_int(query_params, "destination"),
+        "source_city": query_params.get("source_city") or None,
+        "destination_city": query_params.get("destination_city") or None,
+        "departure_after": _parse_moment(query_params, "departure_after"),
+        "departure_before": _parse_moment(query_params, "departure_before", end_of_day=True),
+    }
+
+
+def _parse_bounded_int(query_params, name, default, minimum, maximum):
+    value = _parse_int(query_params, name)
+    if value is None:
+        return default
+    if not minimum <= value <= maximum:
+        raise ValidationError({name: f"Expected a value between {minimum} and {maximum}, got {value}."})
+    return value
+
+
+def itinerary_search_params(query_params):
+    """Turn itinerary query parameters into keyword arguments for ``find_itineraries``.
+
+    Without a departure window the search covers the next 24 hours.
+    """
+    params = {
+        "source": _parse_int(query_params, "source"),
+        "destination": _parse_int(query_params, "destination"),
+    }
+    missing = {name: "This parameter is required." for name, value in params.items() if value is None}
+    if missing:
+        raise ValidationError(missing)
+    departure_after = _parse_moment(query_params, "departure_after") or timezone.now()
+    departure_before = _parse_moment(query_params, "departure_before", end_of_day=True)
+    sort = query_params.get("sort", "distance")
+    if sort not in ("distance", "duration"):
+        raise ValidationError({"sort": "Expected 'distance' or 'duration'."})
+    params.update(
+        departure_after=departure_after,
+        departure_before=departure_before or departure_after + datetime.timedelta(days=1),
+        max_legs=_parse_bounded_int(query_params, "max_legs", 3, 1, 3),
+        min_connection=datetime.timedelta(
+            minutes=_parse_bounded_int(query_params, "min_connection", 45, 0, 24 * 60)
+        ),
+        sort=sort,
+        limit=_parse_bounded_int(query_params, "limit", 10, 1, 50),
+    )
+    return params
+
+
+def export_params(query_params):
+    """Turn export query parameters (or command options) into keyword arguments for ``export_rows``."""
+    return {
+        "departure_after": _parse_moment(query_params, "departure_after"),
+        "departure_before": _parse_moment(query_params, "departure_before", end_of_day=True),
+        "since_id": _parse_int(query_params, "since_id"),
+        "since": _parse_moment(query_params, "since"),
+    }
+
+
+def _parse_date(query_params, name):
+    value = query_params.get(name)
+    if not value:
+        return None
+    try:
+        day = parse_date(value)
+    except ValueError:
+        day = None
+    if day is None:
+        raise ValidationError({name: f"Expected a date in ISO 8601 format, got {value!r}."})
+    return day
+
+
+def occupancy_report_params(query_params):
+    """Turn route occupancy report query parameters into filters for ``RouteDailyOccupancy``; dates are inclusive."""
+    filters = {
+        "route_id": _parse_int(query_params, "route"),
+        "route__source_id": _parse_int(query_params, "source"),
+        "route__destination_id": _parse_int(query_params, "destination"),
+        "date__gte": _parse_date(query_params, "date_after"),
+        "date__lte": _parse_date(query_params, "date_before"),
+    }
+    return {lookup: value for lookup, value in filters.items() if value is not None}
+
+
+def _parse_float(query_params, name, minimum, maximum):
+    value = query_params.get(name)
+    if not value:
+        return None
+    try:
+        number = float(value)
+    except ValueError:
+        raise ValidationError({name: f"Expected a number, got {value!r}."})
+    if not minimum <= number <= maximum:
+        raise ValidationError({name: f"Expected a value between {minimum} and {maximum}, got {value}."})
+    return number
+
+
+def nearest_airports_params(query_params):
+    """Turn nearest airport query parameters into keyword arguments for ``AirportGrid.nearest``."""
+    params = {
+        "latitude": _parse_float(query_params, "latitude", -90, 90),
+        "longitude": _parse_float(query_params, "longitude", -180, 180),
+    }
+    missing = {name: "This parameter is required." for name, value in params.items() if value is None}
+    if missing:
+        raise ValidationError(missing)
+    params.update(
+        limit=_parse_bounded_int(query_params, "limit", 10, 1, 100),
+        max_distance=_parse_float(query_params, "max_distance", 0, 20040),
+    )
+    return params
+
+
+def autocomplete_params(query_params):
+    """Turn autocomplete query parameters into keyword arguments for ``AirportPrefixIndex.search``."""
+    return {
+        "query": query_params.get("q", ""),
+        "limit": _parse_bounded_int(query_params, "limit", 10, 1, 50),
+    }
+
+
+def schedule_conflict_params(query_params):
+    """Turn conflict report query parameters into keyword arguments for ``find_conflicts``.
+
+    Without a window the report covers the next 7 days; it lists at most
+    ``limit`` conflicts.
+    """
+    departure_after = _parse_moment(query_params, "departure_after") or timezone.now()
+    departure_before = _parse_moment(query_params, "departure_before", end_of_day=True)
+    if departure_before is None:
+        departure_before = departure_after + datetime.timedelta(days=7)
+    if departure_before <= departure_after:
+        raise ValidationError({"departure_before": "Expected a moment after departure_after."})
+    kind = query_params.get("kind")
+    if kind not in (None, "", "airplane", "crew"):
+        raise ValidationError({"kind": "Expected 'airplane' or 'crew'."})
+    return {
+        "departure_after": departure_after,
+        "departure_before": departure_before,
+        "kinds": (kind,) if kind else ("airplane", "crew"),
+        "limit": _parse_bounded_int(query_params, "limit", 100, 1, 1000),
+    }
+
+
+def _parse_paths(query_params, name):
+    """``"id,route.source,route.distance"`` -> ``{"id": {}, "route": {"source": {}, "distance": {}}}``."""
+    value = query_params.get(name)
+    if not value:
+        return None
+    tree = {}
+    for path in value.split(","):
+        path = path.strip()
+        if not path:
+            continue
+        node = tree
+        for part in path.split("."):
+            if not part:
+                raise ValidationError({name: f"Invalid field path {path!r}."})
+            node = node.setdefault(part, {})
+    return tree
+
+
+def fieldset_params(query_params):
+    """Turn ``fields`` and ``expand`` into keyword arguments for ``FieldSet``; ``None`` when neither is given."""
+    fields, expand = _parse_paths(query_params, "fields"), _parse_paths(query_params, "expand")
+    if fields is None and expand is None:
+        return None
+    return {"fields": fields, "expand": expand}
@@ -0,0 +1,142 @@
+import itertools
+import math
+from collections import defaultdict
+
+import numpy as np
+
+from airport.local_cache import ProcessLocalCache
+from airport.models import Airport, Route
+
+EARTH_RADIUS_KM = 6371.0088
+# edge of a grid cell in chord units of the unit sphere, about 127 km on the surface
+CELL_SIZE = 0.02
+
+
+def haversine_km(latitude1, longitude1, latitude2, longitude2):
+    """Great-circle distance in kilometres; takes scalars or NumPy arrays of degrees."""
+    latitude1, longitude1, latitude2, longitude2 = map(np.radians, (latitude1, longitude1, latitude2, longitude2))
+    a = (
+        np.sin((latitude2 - latitude1) / 2) ** 2
+        + np.cos(latitude1) * np.cos(latitude2) * np.sin((longitude2 - longitude1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def unit_vectors(latitudes, longitudes):
+    """Points on the unit sphere, shape ``(n, 3)``; chord length between them grows with surface distance."""
+    latitudes, longitudes = np.radians(latitudes), np.radians(longitudes)
+    return np.column_stack(
+        (np.cos(latitudes) * np.cos(longitudes), np.cos(latitudes) * np.sin(longitudes), np.sin(latitudes))
+    )
+
+
+def chord_to_km(chords):
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(chords / 2, 0, 1))
+
+
+def route_distances():
+    """Return ``(route ids, distances in km)`` for every route whose airports both have coordinates."""
+    rows = np.array(
+        Route.objects.filter(
+            source__latitude__isnull=False, source__longitude__isnull=False,
+            destination__latitude__isnull=False, destination__longitude__isnull=False,
+        ).order_by("id").values_list(
+            "id", "source__latitude", "source__longitude", "destination__latitude", "destination__longitude"
+        ),
+        dtype=float,
+    ).reshape(-1, 5)
+    distances = np.rint(haversine_km(rows[:, 1], rows[:, 2], rows[:, 3], rows[:, 4])).astype(int)
+    return rows[:, 0].astype(int), distances
+
+
+def update_route_distances(batch_size=5000):
+    """Store the great-circle distance of every route that has one; returns ``(computed, changed)``.
+
+    ``bulk_update()`` sends no signals, so callers drop the caches built from routes.
+    """
+    route_ids, distances = route_distances()
+    computed = dict(zip(route_ids.tolist(), distances.tolist()))
+    changed = [
+        Route(id=route_id, distance=computed[route_id])
+        for route_id, distance in Route.objects.filter(id__in=computed).values_list("id", "distance").iterator()
+        if distance != computed[route_id]
+    ]
+    Route.objects.bulk_update(changed, ["distance"], batch_size=batch_size)
+    return len(computed), len(changed)
+
+
+class AirportGrid:
+    """Nearest-airport lookup over a uniform grid of airport positions on the unit sphere.
+
+    Cells are searched in growing cubic shells around the cell of the query
+    point. Every point outside the first ``r`` shells is at least
+    ``r * CELL_SIZE`` away in chord length, so the search stops as soon as
+    the ``limit``-th nearest candidate is closer than that.
+    """
+
+    def __init__(self, airports):
+        rows = np.array(list(airports), dtype=float).reshape(-1, 3)
+        self.ids = rows[:, 0].astype(int)
+        self.points = unit_vectors(rows[:, 1], rows[:, 2])
+        cells = defaultdict(list)
+        for index, cell in enumerate(map(tuple, np.floor(self.points / CELL_SIZE).astype(int).tolist())):
+            cells[cell].append(index)
+        self.cells = {cell: np.array(indexes) for cell, indexes in cells.items()}
+
+    @classmethod
+    def load(cls):
+        return cls(
+            Airport.objects.filter(latitude__isnull=False, longitude__isnull=False).values_list(
+                "id", "latitude", "longitude"
+            )
+        )
+
+    @staticmethod
+    def shell(center, radius):
+        """Cells whose largest index offset from ``center`` is exactly ``radius``."""
+        x, y, z = center
+        for dx, dy in itertools.product(range(-radius, radius + 1), repeat=2):
+            if max(abs(dx), abs(dy)) == radius:
+                offsets = range(-radius, radius + 1)
+            else:
+                offsets = (-radius, radius) if radius else (0,)
+            for dz in offsets:
+                yield x + dx, y + dy, z + dz
+
+    def nearest(self, latitude, longitude, limit=10, max_distance=None):
+        """Return up to ``limit`` ``(airport id, distance in km)`` pairs, nearest first.
+
+        ``max_distance`` in kilometres drops airports further away.
+        """
+        if not len(self.ids):
+            return []
+        point = unit_vectors(latitude, longitude)[0]
+        max_chord = 2.0 if max_distance is None else 2 * math.sin(min(max_distance / EARTH_RADIUS_KM, math.pi) / 2)
+        center = tuple(np.floor(point / CELL_SIZE).astype(int).tolist())
+        # beyond this many shells the whole sphere is covered
+        max_radius = int(2 / CELL_SIZE) + 2
+        found = []
+        chords = np.empty(0)
+        for radius in range(max_radius + 1):
+            if (2 * radius + 1) ** 3 > 8 * len(self.cells):
+                # sparse data: checking every occupied cell is cheaper than walking further shells
+                found = [np.arange(len(self.ids))]
+                chords = np.linalg.norm(self.points - point, axis=1)
+                break
+            shell = [self.cells[cell] for cell in self.shell(center, radius) if cell in self.cells]
+            if shell:
+                indexes = np.concatenate(shell)
+                found.append(indexes)
+                chords = np.concatenate((chords, np.linalg.norm(self.points[indexes] - point, axis=1)))
+            searched = radius * CELL_SIZE
+            if searched >= max_chord or (
+                len(chords) >= limit and np.partition(chords, limit - 1)[limit - 1] <= searched
+            ):
+                break
+        indexes = np.concatenate(found) if found else np.empty(0, dtype=int)
+        order = np.argsort(chords, kind="stable")
+        order = order[chords[order] <= max_chord][:limit]
+        return list(zip(self.ids[indexes[order]].tolist(), chord_to_km(chords[order]).tolist()))
+
+
+airport_grid = ProcessLocalCache("airport_grid", AirportGrid.load)
@@ -0,0 +1,190 @@
+import datetime
+import hashlib
+import json
+import time
+from functools import partial
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.response import Response
+
+from airport.models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+# seconds a key and its response are kept
+IDEMPOTENCY_KEY_TTL = getattr(settings, "IDEMPOTENCY_KEY_TTL", 24 * 60 * 60)
+# seconds a retry waits for the original request to finish before it is rejected
+IDEMPOTENCY_WAIT = getattr(settings, "IDEMPOTENCY_WAIT", 5)
+# seconds after which the claim of a request that never answered is taken over by its retries
+IDEMPOTENCY_LOCK_TIMEOUT = getattr(settings, "IDEMPOTENCY_LOCK_TIMEOUT", 60)
+IDEMPOTENCY_POLL_INTERVAL = 0.05
+
+
+class IdempotencyKeyInUse(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "A request with this Idempotency-Key is still being processed, retry later."
+    default_code = "idempotency_key_in_use"
+
+
+class IdempotencyKeyMismatch(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = "This Idempotency-Key was already used for a different request."
+    default_code = "idempotency_key_mismatch"
+
+
+class FingerprintEncoder(DjangoJSONEncoder):
+    """Encodes uploaded files by their name and a hash of their content."""
+
+    def default(self, o):
+        if isinstance(o, UploadedFile):
+            digest = hashlib.sha256()
+            for chunk in o.chunks():
+                digest.update(chunk)
+            o.seek(0)
+            return [o.name, digest.hexdigest()]
+        return super().default(o)
+
+
+def request_fingerprint(request):
+    data = request.data
+    if hasattr(data, "lists"):
+        data = {name: values for name, values in data.lists()}
+    payload = json.dumps([request.method, request.path, data], cls=FingerprintEncoder, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def claim_key(request, key, fingerprint):
+    """Store the key for this request.
+
+    Returns ``(claim, None)`` with a queryset of the claimed row, or
+    ``(None, existing)`` with the row of an earlier request. A row whose
+    request never answered within ``IDEMPOTENCY_LOCK_TIMEOUT`` seconds is
+    taken over, so a retry can run after its worker died.
+    """
+    now = timezone.now()
+    claim = IdempotencyKey.objects.filter(user=request.user, key=key, locked_at=now)
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                IdempotencyKey.objects.create(
+                    user=request.user,
+                    key=key,
+                    method=request.method,
+                    path=request.path,
+                    fingerprint=fingerprint,
+                    locked_at=now,
+                    expires_at=now + datetime.timedelta(seconds=IDEMPOTENCY_KEY_TTL),
+                )
+            return claim, None
+        except IntegrityError:
+            existing = IdempotencyKey.objects.filter(user=request.user, key=key).first()
+            if existing is None or existing.expires_at <= now:
+                # the earlier request failed or its key expired; it can be reused
+                IdempotencyKey.objects.filter(user=request.user, key=key, expires_at__lte=now).delete()
+                continue
+            if is_stale(existing, now):
+                # only one retry wins the row; the others see it locked again
+                if IdempotencyKey.objects.filter(
+                    pk=existing.pk, status_code__isnull=True, locked_at=existing.locked_at
+                ).update(
+                    method=request.method, path=request.path, fingerprint=fingerprint, locked_at=now,
+                    expires_at=now + datetime.timedelta(seconds=IDEMPOTENCY_KEY_TTL),
+                ):
+                    return claim, None
+                continue
+            return None, existing
+    raise IdempotencyKeyInUse()
+
+
+def is_stale(existing, now):
+    """Whether the request that claimed the row has not answered within ``IDEMPOTENCY_LOCK_TIMEOUT`` seconds."""
+    return (
+        existing.status_code is None
+        and existing.locked_at <= now - datetime.timedelta(seconds=IDEMPOTENCY_LOCK_TIMEOUT)
+    )
+
+
+def wait_for_response(existing):
+    """Poll the row of a running request until it has a response, for at most ``IDEMPOTENCY_WAIT`` seconds."""
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT
+    while existing is not None and existing.status_code is None:
+        if is_stale(existing, timezone.now()):
+            # the retry that follows takes the key over
+            raise IdempotencyKeyInUse("The original request with this Idempotency-Key did not finish, retry it.")
+        if time.monotonic() >= deadline:
+            raise IdempotencyKeyInUse()
+        time.sleep(IDEMPOTENCY_POLL_INTERVAL)
+        existing = IdempotencyKey.objects.filter(pk=existing.pk).first()
+    if existing is None:
+        # the original request failed and released its key
+        raise IdempotencyKeyInUse("The original request with this Idempotency-Key failed, retry it.")
+    return existing
+
+
+class IdempotencyMixin:
+    """Replay the stored response of an unsafe request retried with the same ``Idempotency-Key``.
+
+    Every POST, PUT, PATCH and DELETE handler of the view is covered,
+    including extra actions like batch writes.
+
+    The first request with a key claims it by inserting an ``IdempotencyKey``
+    row and stores its response there. Retries get the stored response
+    without running the action again. A retry that arrives while the first
+    request is running waits up to ``IDEMPOTENCY_WAIT`` seconds and then gets
+    409. A request that raises or answers with a 5xx code releases its key,
+    so it can be retried; one that has not answered after
+    ``IDEMPOTENCY_LOCK_TIMEOUT`` seconds loses it to the next retry, and its
+    late response is not stored.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # dispatch() looks the handler up after initial(), so the wrapped one runs
+        method = request.method.lower()
+        if request.method not in SAFE_METHODS and hasattr(self, method):
+            setattr(self, method, partial(self.idempotent, getattr(self, method)))
+
+    def idempotent(self, handler, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return handler(request, *args, **kwargs)
+        if len(key) > IdempotencyKey._meta.get_field("key").max_length:
+            raise ValidationError({IDEMPOTENCY_HEADER: "Ensure this header has no more than 255 characters."})
+
+        fingerprint = request_fingerprint(request)
+        claimed, existing = claim_key(request, key, fingerprint)
+        if existing is not None:
+            if existing.fingerprint != fingerprint:
+                raise IdempotencyKeyMismatch()
+            existing = wait_for_response(existing)
+            return Response(
+                existing.response_body, status=existing.status_code, headers={"Idempotent-Replayed": "true"}
+            )
+
+        try:
+            response = handler(request, *args, **kwargs)
+        except Exception:
+            claimed.delete()
+            raise
+        if response.status_code >= 500:
+            claimed.delete()
+        else:
+            claimed.update(status_code=response.status_code, response_body=response.data)
+        return response
+
+
+def sweep_expired_keys(batch_size=1000):
+    """Delete expired keys in batches of ``batch_size`` rows; returns the number deleted."""
+    now = timezone.now()
+    deleted = 0
+    while True:
+        batch = list(IdempotencyKey.objects.filter(expires_at__lte=now).values_list("id", flat=True)[:batch_size])
+        if not batch:
+            return deleted
+        deleted += IdempotencyKey.objects.filter(id__in=batch).delete()[0]
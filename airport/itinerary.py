@@ -0,0 +1,164 @@
+import datetime
+import heapq
+import math
+from bisect import bisect_left
+from collections import defaultdict
+from itertools import count
+
+from airport.local_cache import ProcessLocalCache
+from airport.models import Flight, Route
+
+MAX_FLIGHT_DURATION = datetime.timedelta(hours=20)
+# partial itineraries a search expands at most, so a dense schedule cannot tie up a request
+MAX_SEARCH_EXPANSIONS = 20000
+
+
+class RouteGraph:
+    def __init__(self, routes):
+        self.adjacency = defaultdict(list)
+        self.reverse = defaultdict(list)
+        for route_id, source_id, destination_id, distance in routes:
+            self.adjacency[source_id].append((distance, destination_id, route_id))
+            self.reverse[destination_id].append((distance, source_id, route_id))
+
+    @classmethod
+    def load(cls):
+        return cls(Route.objects.values_list("id", "source_id", "destination_id", "distance"))
+
+    def distances_to(self, destination_id, max_legs):
+        """Return ``remaining`` where ``remaining[legs][airport]`` is the shortest distance to the destination.
+
+        Only airports that reach the destination with at most ``legs`` legs
+        are present. The distances ignore revisited airports, so they never
+        overestimate the distance of a loop-free itinerary.
+        """
+        remaining = [{destination_id: 0}]
+        for _ in range(max_legs):
+            previous = remaining[-1]
+            current = dict(previous)
+            for airport, distance in previous.items():
+                for leg_distance, source_id, _ in self.reverse.get(airport, ()):
+                    if distance + leg_distance < current.get(source_id, math.inf):
+                        current[source_id] = distance + leg_distance
+            remaining.append(current)
+        return remaining
+
+    def routes_between(self, source_id, destination_id, remaining):
+        """Return the ids of the routes some itinerary from the source to the destination can use."""
+        route_ids = set()
+        airports = {source_id}
+        for legs_left in range(len(remaining) - 2, -1, -1):
+            next_airports = set()
+            for airport in airports:
+                for _, next_airport, route_id in self.adjacency.get(airport, ()):
+                    if next_airport in remaining[legs_left]:
+                        route_ids.add(route_id)
+                        next_airports.add(next_airport)
+            airports = next_airports - {destination_id}
+        return route_ids
+
+
+route_graph = ProcessLocalCache("route_graph", RouteGraph.load)
+
+
+class Itinerary:
+    def __init__(self, legs, distance):
+        self.legs = legs
+        self.distance = distance
+
+    @property
+    def departure_time(self):
+        return self.legs[0].departure_time
+
+    @property
+    def arrival_time(self):
+        return self.legs[-1].arrival_time
+
+    @property
+    def duration(self):
+        return self.arrival_time - self.departure_time
+
+
+def _search(graph, flights_by_route, source, destination, remaining, departure_before, min_connection,
+            max_connection, sort):
+    """Yield ``(legs, distance)`` itineraries best first.
+
+    A best-first search over partial itineraries keyed by ``(duration,
+    distance)`` or ``(distance, duration)``, then departure. Neither duration
+    nor distance shrinks when a leg is added, and the distance part adds the
+    shortest distance still to go, so complete itineraries come out in the
+    exact sort order and a search stops after the first ``limit`` of them.
+    """
+    max_legs = len(remaining) - 1
+    tie_breaker = count()
+    heap = []
+
+    def push(legs, airports, distance):
+        flight = legs[-1]
+        estimate = distance + remaining[max_legs - len(legs)][airports[-1]]
+        duration = flight.arrival_time - legs[0].departure_time
+        key = (duration, estimate) if sort == "duration" else (estimate, duration)
+        heapq.heappush(heap, (key, legs[0].departure_time, next(tie_breaker), legs, airports, distance))
+
+    for leg_distance, next_airport, route_id in graph.adjacency.get(source, ()):
+        if next_airport not in remaining[max_legs - 1]:
+            continue
+        for flight in flights_by_route.get(route_id, ((), ()))[1]:
+            if flight.departure_time >= departure_before:
+                break
+            push((flight,), (source, next_airport), leg_distance)
+
+    expansions = 0
+    while heap and expansions < MAX_SEARCH_EXPANSIONS:
+        _, _, _, legs, airports, distance = heapq.heappop(heap)
+        if airports[-1] == destination:
+            yield legs, distance
+            continue
+        expansions += 1
+        legs_left = max_legs - len(legs)
+        earliest = legs[-1].arrival_time + min_connection
+        latest = legs[-1].arrival_time + max_connection
+        for leg_distance, next_airport, route_id in graph.adjacency.get(airports[-1], ()):
+            if next_airport in airports or next_airport not in remaining[legs_left - 1]:
+                continue
+            departures, flights = flights_by_route.get(route_id, ((), ()))
+            for flight in flights[bisect_left(departures, earliest):]:
+                if flight.departure_time > latest:
+                    break
+                push(legs + (flight,), airports + (next_airport,), distance + leg_distance)
+
+
+def find_itineraries(source, destination, departure_after, departure_before, max_legs=3,
+                     min_connection=datetime.timedelta(minutes=45), max_connection=datetime.timedelta(hours=24),
+                     sort="distance", limit=10):
+    """Return the best flight connections between two airports with at most ``max_legs`` legs.
+
+    The route graph gives the routes any itinerary can use; their flights
+    are loaded with a single query and chained in memory by ``_search``.
+    """
+    graph = route_graph.get()
+    remaining = graph.distances_to(destination, max_legs)
+    if source not in remaining[max_legs] or source == destination:
+        return []
+    window_end = departure_before + (max_legs - 1) * (max_connection + MAX_FLIGHT_DURATION)
+    flights = Flight.objects.filter(
+        route_id__in=graph.routes_between(source, destination, remaining),
+        departure_time__gte=departure_after,
+        departure_time__lt=window_end,
+    ).select_related("route").order_by("departure_time", "id")
+
+    flights_by_route = defaultdict(lambda: ([], []))
+    for flight in flights:
+        departures, route_flights = flights_by_route[flight.route_id]
+        departures.append(flight.departure_time)
+        route_flights.append(flight)
+
+    itineraries = []
+    for legs, distance in _search(
+        graph, flights_by_route, source, destination, remaining, departure_before, min_connection,
+        max_connection, sort,
+    ):
+        itineraries.append(Itinerary(list(legs), distance))
+        if len(itineraries) == limit:
+            break
+    return itineraries
@@ -0,0 +1,38 @@
+import threading
+import uuid
+
+from django.core.cache import cache
+
+
+class ProcessLocalCache:
+    """A value built once per process and rebuilt lazily after ``invalidate()``.
+
+    A generation token kept in the Django cache lets processes that share a
+    cache backend notice invalidations made by other processes.
+    """
+
+    def __init__(self, name, build):
+        self.key = f"airport:local_cache:{name}"
+        self.build = build
+        self._lock = threading.Lock()
+        self._value = None
+        self._generation = None
+
+    def get(self):
+        generation = cache.get(self.key)
+        value, built_generation = self._value, self._generation
+        if value is not None and generation is not None and generation == built_generation:
+            return value
+        with self._lock:
+            if generation is None:
+                cache.add(self.key, uuid.uuid4().hex, None)
+                generation = cache.get(self.key)
+            if self._value is None or self._generation != generation:
+                self._value = self.build()
+                self._generation = generation
+            return self._value
+
+    def invalidate(self):
+        with self._lock:
+            self._value = None
+        cache.set(self.key, uuid.uuid4().hex, None)
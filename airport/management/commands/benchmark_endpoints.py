@@ -0,0 +1,176 @@
+import json
+import statistics
+import time
+import tracemalloc
+from urllib.parse import quote
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from airport.management.commands.seed_airport import BENCHMARK_EMAIL, BENCHMARK_PASSWORD
+from airport.models import Airport, Route
+from airport.urls import router
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive every airport router endpoint and the user token endpoints in-process and report "
+        "p50/p95/p99 latency, SQL queries per request and peak memory as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=50, help="Measured requests per endpoint.")
+        parser.add_argument("--warmup", type=int, default=5, help="Unmeasured requests per endpoint.")
+        parser.add_argument("--email", default=BENCHMARK_EMAIL, help="User to authenticate as.")
+        parser.add_argument("--output", default="benchmark.json")
+        parser.add_argument("--baseline", help="Earlier results to compare p95 latency and query counts with.")
+        parser.add_argument(
+            "--threshold", type=float, default=1.2, help="Allowed p95 growth against the baseline, 1.2 = +20%%."
+        )
+        parser.add_argument("--include-writes", action="store_true", help="Also benchmark user registration.")
+
+    def handle(self, *args, **options):
+        user = get_user_model().objects.filter(email=options["email"]).first()
+        if user is None:
+            raise CommandError(f"User {options['email']} does not exist, run seed_airport first.")
+        client = APIClient(SERVER_NAME="localhost")
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(user).access_token}")
+
+        results = []
+        for name, method, path, data in self.endpoints(user, options["include_writes"]):
+            status = self.request(client, method, path, data, 0).status_code
+            if status >= 400:
+                # an error response says nothing about the latency of the endpoint
+                self.stderr.write(f"{name:<40} skipped, {method.upper()} {path} returned {status}")
+                continue
+            results.append(self.measure(client, name, method, path, data, options["requests"], options["warmup"]))
+            self.stdout.write(
+                "{name:<40} p50 {p50_ms:8.2f} ms  p95 {p95_ms:8.2f} ms  p99 {p99_ms:8.2f} ms  "
+                "{queries:4d} queries  {peak_memory_kb:10.1f} KiB".format(**results[-1])
+            )
+
+        report = {"created_at": timezone.now().isoformat(), "requests": options["requests"], "endpoints": results}
+        with open(options["output"], "w") as output:
+            json.dump(report, output, indent=2)
+        self.stdout.write(f"Results written to {options['output']}")
+
+        if options["baseline"]:
+            self.compare(results, options["baseline"], options["threshold"])
+
+    def endpoints(self, user, include_writes):
+        """Yield ``(name, method, path, data)`` for every router list/detail route and extra action."""
+        for prefix, viewset, basename in router.registry:
+            obj = viewset.queryset.model.objects.order_by("pk").first()
+            yield f"{prefix}-list", "get", reverse(f"airport:{basename}-list"), None
+            if obj is not None:
+                yield f"{prefix}-detail", "get", reverse(f"airport:{basename}-detail", args=(obj.pk,)), None
+            for extra_action in viewset.get_extra_actions():
+                if "get" not in extra_action.mapping:
+                    continue
+                if extra_action.detail and obj is not None:
+                    path = reverse(f"airport:{basename}-{extra_action.url_name}", args=(obj.pk,))
+                elif not extra_action.detail:
+                    path = reverse(f"airport:{basename}-{extra_action.url_name}")
+                else:
+                    continue
+                path += self.action_query(viewset.queryset.model, extra_action.url_name)
+                yield f"{prefix}-{extra_action.url_name}", "get", path, None
+
+        route = Route.objects.order_by("pk").first()
+        if route is not None:
+            yield (
+                "itineraries", "get",
+                f"{reverse('airport:itineraries')}?source={route.source_id}&destination={route.destination_id}"
+                f"&departure_before=2100-01-01",
+                None,
+            )
+
+        credentials = {"email": user.email, "password": BENCHMARK_PASSWORD}
+        yield "token_obtain_pair", "post", reverse("token_obtain_pair"), credentials
+        refresh = RefreshToken.for_user(user)
+        yield "token_refresh", "post", reverse("token_refresh"), {"refresh": str(refresh)}
+        yield "token_verify", "post", reverse("token_verify"), {"token": str(refresh.access_token)}
+        if include_writes:
+            yield "register", "post", reverse("register"), lambda number: {
+                "email": f"benchmark-{time.time_ns()}-{number}@airport.local", "password": BENCHMARK_PASSWORD
+            }
+
+    def action_query(self, model, url_name):
+        """Return the query string an extra action needs to answer with results rather than a 400."""
+        if model is not Airport:
+            return ""
+        airport = Airport.objects.exclude(latitude=None).exclude(longitude=None).order_by("pk").first()
+        if url_name == "nearest":
+            latitude, longitude = (airport.latitude, airport.longitude) if airport is not None else (0, 0)
+            return f"?latitude={latitude}&longitude={longitude}"
+        if url_name == "autocomplete":
+            airport = airport or Airport.objects.order_by("pk").first()
+            return f"?q={quote(airport.name[:3])}" if airport is not None else ""
+        return ""
+
+    def request(self, client, method, path, data, number):
+        if callable(data):
+            data = data(number)
+        response = getattr(client, method)(path, data, format="json")
+        if response.streaming:
+            b"".join(response.streaming_content)
+        return response
+
+    def measure(self, client, name, method, path, data, requests, warmup):
+        for number in range(warmup):
+            self.request(client, method, path, data, number)
+
+        timings = []
+        for number in range(requests):
+            started = time.perf_counter()
+            response = self.request(client, method, path, data, warmup + number)
+            timings.append((time.perf_counter() - started) * 1000)
+
+        # queries and memory are measured on separate requests, as both slow the request down
+        queries = []
+
+        def count_query(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count_query):
+            self.request(client, method, path, data, warmup + requests)
+        tracemalloc.start()
+        self.request(client, method, path, data, warmup + requests + 1)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        percentiles = statistics.quantiles(timings, n=100, method="inclusive") if len(timings) > 1 else timings * 99
+        return {
+            "name": name,
+            "method": method.upper(),
+            "path": path,
+            "status": response.status_code,
+            "p50_ms": round(percentiles[49], 3),
+            "p95_ms": round(percentiles[94], 3),
+            "p99_ms": round(percentiles[98], 3),
+            "mean_ms": round(statistics.fmean(timings), 3),
+            "queries": len(queries),
+            "peak_memory_kb": round(peak_memory / 1024, 1),
+        }
+
+    def compare(self, results, baseline_path, threshold):
+        with open(baseline_path) as baseline_file:
+            baseline = {endpoint["name"]: endpoint for endpoint in json.load(baseline_file)["endpoints"]}
+        regressions = []
+        for endpoint in results:
+            previous = baseline.get(endpoint["name"])
+            if previous is None:
+                continue
+            if endpoint["p95_ms"] > previous["p95_ms"] * threshold:
+                regressions.append(f"{endpoint['name']}: p95 {previous['p95_ms']} ms -> {endpoint['p95_ms']} ms")
+            if endpoint["queries"] > previous["queries"]:
+                regressions.append(f"{endpoint['name']}: {previous['queries']} -> {endpoint['queries']} queries")
+        if regressions:
+            raise CommandError("Regressions against the baseline:\n" + "\n".join(regressions))
+        self.stdout.write(self.style.SUCCESS("No regressions against the baseline."))
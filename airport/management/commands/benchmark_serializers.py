@@ -0,0 +1,79 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from airport.models import Flight, Ticket
+from airport.renderers import ORJSONRenderer, orjson
+from airport.views import FlightViewSet, TicketViewSet
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare rows per second of the model serializer list path with the values() row path "
+        "for tickets and flights, and check that both render the same bytes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=10000, help="Rows per list.")
+        parser.add_argument("--repeat", type=int, default=5, help="Timed runs, the best one is reported.")
+        parser.add_argument("--output", default="benchmark_serializers.json")
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            self.stderr.write("orjson is not installed, the row path renders with JSONRenderer.")
+        lists = (
+            ("tickets", TicketViewSet, Ticket.objects.order_by("id")),
+            ("flights", FlightViewSet, Flight.objects.with_occupancy().order_by("departure_time", "id")),
+        )
+        results = []
+        for name, viewset, queryset in lists:
+            queryset = queryset[:options["rows"]]
+            row_serializer = viewset.row_serializer
+            serializer_class = row_serializer.serializer_class
+
+            def before():
+                return JSONRenderer().render(serializer_class(queryset.all(), many=True).data)
+
+            def after():
+                return ORJSONRenderer().render(row_serializer.serialize(queryset.values(*row_serializer.columns)))
+
+            rows = queryset.count()
+            if not rows:
+                raise CommandError(f"There are no {name}, run seed_airport first.")
+            before_output, before_seconds = self.measure(before, options["repeat"])
+            after_output, after_seconds = self.measure(after, options["repeat"])
+            results.append({
+                "name": name,
+                "rows": rows,
+                "before_rows_per_second": round(rows / before_seconds),
+                "after_rows_per_second": round(rows / after_seconds),
+                "speedup": round(before_seconds / after_seconds, 2),
+                "identical_output": before_output == after_output,
+            })
+            self.stdout.write(
+                "{name:<8} {rows:7d} rows  before {before_rows_per_second:9d} rows/s  "
+                "after {after_rows_per_second:9d} rows/s  x{speedup:<6} identical: {identical_output}".format(
+                    **results[-1]
+                )
+            )
+
+        report = {"created_at": timezone.now().isoformat(), "orjson": orjson is not None, "lists": results}
+        with open(options["output"], "w") as output:
+            json.dump(report, output, indent=2)
+        self.stdout.write(f"Results written to {options['output']}")
+        if not all(result["identical_output"] for result in results):
+            raise CommandError("The row path renders different output than the serializers.")
+
+    @staticmethod
+    def measure(function, repeat):
+        """Return the output and the best time of ``repeat`` runs, queries included."""
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            output = function()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return output, best
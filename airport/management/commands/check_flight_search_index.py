@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from airport.search_index import check_index
+
+
+class Command(BaseCommand):
+    help = "Compare the flight search index with the source tables and report missing, stale and orphaned rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--fix", action="store_true", help="Rewrite the rows that differ.")
+
+    def handle(self, *args, fix, **options):
+        missing, stale, orphaned = check_index(fix=fix)
+        for name, flight_ids in (("missing", missing), ("stale", stale), ("orphaned", orphaned)):
+            self.stdout.write(f"{name}: {len(flight_ids)}" + (f" (flights {flight_ids[:20]})" if flight_ids else ""))
+        if (missing or stale or orphaned) and not fix:
+            raise CommandError("The flight search index is out of sync, run with --fix.")
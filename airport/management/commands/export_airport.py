@@ -0,0 +1,35 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+
+from airport.exports import EXPORT_COLUMNS, EXPORT_FORMATS, export_lines
+from airport.filters import export_params
+
+
+class Command(BaseCommand):
+    help = "Stream tickets, orders or flights as NDJSON or CSV with constant memory use."
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=tuple(EXPORT_COLUMNS))
+        parser.add_argument("--format", dest="output_format", choices=EXPORT_FORMATS, default="ndjson")
+        parser.add_argument("--output", help="File to write to, stdout by default.")
+        parser.add_argument("--departure-after", help="Earliest flight departure, date or datetime.")
+        parser.add_argument("--departure-before", help="Latest flight departure, a date includes the whole day.")
+        parser.add_argument("--since-id", help="Only export rows with a greater id.")
+        parser.add_argument("--since", help="Only export orders/tickets created from this moment.")
+
+    def handle(self, *args, kind, output_format, output, **options):
+        try:
+            params = export_params({name: value for name, value in options.items() if value is not None})
+            lines = export_lines(kind, output_format, **params)
+        except ValidationError as error:
+            raise CommandError(error.detail)
+
+        stream = open(output, "w", newline="", encoding="utf-8") if output else sys.stdout
+        try:
+            for line in lines:
+                stream.write(line)
+        finally:
+            if output:
+                stream.close()
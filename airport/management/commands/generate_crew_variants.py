@@ -0,0 +1,42 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.core.management.base import BaseCommand
+
+from airport.models import Crew
+from airport.thumbnails import THUMBNAIL_WORKERS, generate_variants, has_picture
+
+
+class Command(BaseCommand):
+    help = "Generate the resized WebP/JPEG variants of crew pictures that do not have them yet, in parallel."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=max(THUMBNAIL_WORKERS, 4))
+        parser.add_argument("--force", action="store_true", help="Regenerate existing variants too.")
+
+    def handle(self, *args, workers, force, **options):
+        crew_ids = [
+            crew.pk
+            for crew in Crew.objects.only("picture_member", "picture_variants").iterator(chunk_size=2000)
+            if has_picture(crew) and (force or crew.picture_variants.get("source") != crew.picture_member.name)
+        ]
+        self.generated = self.failed = 0
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="thumbnails") as executor:
+            # a few pictures per worker are queued at a time, not all of them at once
+            futures = {}
+            for crew_id in crew_ids:
+                if len(futures) >= workers * 2:
+                    self.collect(futures, wait(futures, return_when=FIRST_COMPLETED).done)
+                futures[executor.submit(generate_variants, crew_id)] = crew_id
+            self.collect(futures, wait(futures).done)
+        self.stdout.write(
+            f"Generated variants for {self.generated} of {len(crew_ids)} crew pictures, {self.failed} failed."
+        )
+
+    def collect(self, futures, done):
+        for future in done:
+            crew_id = futures.pop(future)
+            try:
+                self.generated += future.result()
+            except Exception as error:
+                self.failed += 1
+                self.stderr.write(f"Crew {crew_id}: {error}")
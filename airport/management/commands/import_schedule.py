@@ -0,0 +1,30 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from airport.schedule_import import IMPORT_FORMATS, ScheduleImporter, find_encoding_error
+
+
+class Command(BaseCommand):
+    help = "Import a flight schedule from a CSV or NDJSON file, reporting invalid rows by line number."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--format", dest="import_format", choices=IMPORT_FORMATS, help="Guessed from the extension.")
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--dry-run", action="store_true", help="Only validate the rows.")
+
+    def handle(self, *args, path, import_format, batch_size, dry_run, **options):
+        import_format = import_format or ("csv" if os.path.splitext(path)[1].lower() == ".csv" else "ndjson")
+        with open(path, "rb") as binary:
+            line_number = find_encoding_error(iter(lambda: binary.read(1 << 16), b""))
+        if line_number is not None:
+            raise CommandError(f"Line {line_number} of {path} is not valid UTF-8.")
+        importer = ScheduleImporter(batch_size=batch_size, dry_run=dry_run)
+        with open(path, newline="", encoding="utf-8") as stream:
+            importer.run(importer.read_rows(stream, import_format))
+
+        for error in importer.errors:
+            self.stderr.write(f"line {error['line']}: {error['errors']}")
+        verb = "Validated" if dry_run else "Imported"
+        self.stdout.write(f"{verb} {importer.created} flights, {len(importer.errors)} invalid rows.")
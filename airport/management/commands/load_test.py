@@ -0,0 +1,151 @@
+import asyncio
+import json
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+
+from airport.management.commands.seed_airport import BENCHMARK_EMAIL
+from airport.models import Flight
+
+# (name, WSGI path, ASGI path); {flight} is replaced with a flight id
+ENDPOINTS = (
+    ("flight-list", "/airport/flights/", "/airport/async/flights/"),
+    ("flight-detail", "/airport/flights/{flight}/", "/airport/async/flights/{flight}/"),
+    ("flight-seats", "/airport/flights/{flight}/seats/", "/airport/async/flights/{flight}/seats/"),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the throughput of the synchronous flight endpoints on a WSGI server with the async ones "
+        "on an ASGI server at high concurrency, e.g. gunicorn on :8000 and uvicorn on :8001."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--wsgi-url", default="http://127.0.0.1:8000")
+        parser.add_argument("--asgi-url", default="http://127.0.0.1:8001")
+        parser.add_argument("--concurrency", type=int, default=200, help="Open connections per run.")
+        parser.add_argument("--requests", type=int, default=5000, help="Requests per endpoint and server.")
+        parser.add_argument("--timeout", type=float, default=30, help="Seconds to wait for one response.")
+        parser.add_argument("--email", default=BENCHMARK_EMAIL, help="User to authenticate as.")
+        parser.add_argument("--output", default="load_test.json")
+
+    def handle(self, *args, **options):
+        user = get_user_model().objects.filter(email=options["email"]).first()
+        if user is None:
+            raise CommandError(f"User {options['email']} does not exist, run seed_airport first.")
+        flight = Flight.objects.order_by("pk").values_list("pk", flat=True).first()
+        if flight is None:
+            raise CommandError("There are no flights, run seed_airport first.")
+        token = str(AccessToken.for_user(user))
+
+        results = []
+        for name, wsgi_path, asgi_path in ENDPOINTS:
+            for server, base_url, path in (("wsgi", options["wsgi_url"], wsgi_path),
+                                           ("asgi", options["asgi_url"], asgi_path)):
+                result = asyncio.run(LoadTest(
+                    base_url, path.format(flight=flight), token, options["concurrency"], options["timeout"]
+                ).run(options["requests"]))
+                results.append({"name": name, "server": server, **result})
+                self.stdout.write(
+                    "{name:<14} {server}  {requests_per_second:9.1f} req/s  p50 {p50_ms:8.2f} ms  "
+                    "p95 {p95_ms:8.2f} ms  p99 {p99_ms:8.2f} ms  {errors} errors".format(**results[-1])
+                )
+
+        report = {
+            "created_at": timezone.now().isoformat(),
+            "concurrency": options["concurrency"],
+            "requests": options["requests"],
+            "endpoints": results,
+        }
+        with open(options["output"], "w") as output:
+            json.dump(report, output, indent=2)
+        self.stdout.write(f"Results written to {options['output']}")
+
+
+class LoadTest:
+    """Minimal HTTP/1.1 keep-alive client: ``concurrency`` connections share a fixed number of GET requests."""
+
+    def __init__(self, base_url, path, token, concurrency, timeout):
+        url = urlsplit(base_url)
+        self.host = url.hostname
+        self.port = url.port or 80
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.request = (
+            f"GET {url.path.rstrip('/')}{path} HTTP/1.1\r\n"
+            f"Host: {url.netloc}\r\n"
+            f"Authorization: Bearer {token}\r\n"
+            f"Accept: application/json\r\n"
+            f"Connection: keep-alive\r\n\r\n"
+        ).encode()
+
+    async def run(self, requests):
+        self.remaining = requests
+        self.timings = []
+        self.errors = 0
+        started = time.perf_counter()
+        await asyncio.gather(*(self.worker() for _ in range(min(self.concurrency, requests))))
+        elapsed = time.perf_counter() - started
+
+        timings = self.timings or [0.0]
+        percentiles = statistics.quantiles(timings, n=100, method="inclusive") if len(timings) > 1 else timings * 99
+        return {
+            "path": self.request.split(b" ")[1].decode(),
+            "requests_per_second": round(len(self.timings) / elapsed, 1),
+            "p50_ms": round(percentiles[49], 3),
+            "p95_ms": round(percentiles[94], 3),
+            "p99_ms": round(percentiles[98], 3),
+            "errors": self.errors,
+        }
+
+    async def worker(self):
+        reader = writer = None
+        while self.remaining > 0:
+            self.remaining -= 1
+            started = time.perf_counter()
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.open_connection(self.host, self.port)
+                writer.write(self.request)
+                status, keep_alive = await asyncio.wait_for(self.read_response(reader), self.timeout)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+                status, keep_alive = None, False
+            if status == 200:
+                self.timings.append((time.perf_counter() - started) * 1000)
+            else:
+                self.errors += 1
+            if not keep_alive and writer is not None:
+                writer.close()
+                reader = writer = None
+        if writer is not None:
+            writer.close()
+
+    @staticmethod
+    async def read_response(reader):
+        """Read one response, return its status code and whether the connection can be reused."""
+        head = await reader.readuntil(b"\r\n\r\n")
+        status_line, *header_lines = head.decode("latin-1").split("\r\n")
+        headers = {}
+        for line in header_lines:
+            if line:
+                key, _, value = line.partition(":")
+                headers[key.strip().lower()] = value.strip().lower()
+
+        if headers.get("transfer-encoding") == "chunked":
+            while True:
+                size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                await reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        elif "content-length" in headers:
+            await reader.readexactly(int(headers["content-length"]))
+        else:
+            await reader.read()
+            return int(status_line.split()[1]), False
+        return int(status_line.split()[1]), headers.get("connection") != "close"
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from airport.search_index import rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Recompute the flight search index from flights, routes, airports, airplanes and tickets."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=2000)
+
+    def handle(self, *args, batch_size, **options):
+        rows = rebuild_index(batch_size=batch_size)
+        self.stdout.write(f"FlightSearchIndex: {rows}")
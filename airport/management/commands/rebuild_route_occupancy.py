@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from airport.occupancy import rebuild_occupancy
+
+
+class Command(BaseCommand):
+    help = "Recompute the route/day occupancy table from flights and tickets."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, batch_size, **options):
+        rows = rebuild_occupancy(batch_size=batch_size)
+        self.stdout.write(f"RouteDailyOccupancy: {rows}")
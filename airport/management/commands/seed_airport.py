@@ -0,0 +1,216 @@
+import datetime
+import heapq
+import random
+from operator import attrgetter
+
+import numpy as np
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from airport.autocomplete import autocomplete_index
+from airport.geo import airport_grid, haversine_km
+from airport.itinerary import route_graph
+from airport.models import Airport, Route, AirplaneType, Airplane, Order, Ticket, Flight, Crew
+from airport.occupancy import rebuild_occupancy
+from airport.response_cache import invalidate_reference_cache
+from airport.search_index import rebuild_index
+
+CITIES = (
+    "London", "Paris", "Berlin", "Madrid", "Rome", "Warsaw", "Kyiv", "Vienna", "Prague", "Budapest",
+    "Amsterdam", "Brussels", "Lisbon", "Dublin", "Oslo", "Stockholm", "Helsinki", "Copenhagen", "Athens",
+    "Istanbul", "Dubai", "Doha", "Cairo", "Nairobi", "Johannesburg", "New York", "Chicago", "Toronto",
+    "Mexico City", "Sao Paulo", "Buenos Aires", "Tokyo", "Seoul", "Beijing", "Shanghai", "Singapore",
+    "Bangkok", "Delhi", "Mumbai", "Sydney",
+)
+AIRPLANE_TYPES = ("Airbus A320", "Airbus A321", "Airbus A330", "Boeing 737", "Boeing 777", "Boeing 787", "Embraer 190")
+FIRST_NAMES = ("Anna", "Boris", "Chloe", "Daniel", "Elena", "Felix", "Grace", "Hugo", "Iryna", "Jonas")
+LAST_NAMES = ("Smith", "Kowalski", "Müller", "Dubois", "Rossi", "Garcia", "Novak", "Tkachenko", "Berg", "Silva")
+# time an airplane spends on the ground between two flights
+TURNAROUND = datetime.timedelta(minutes=45)
+BENCHMARK_EMAIL = "benchmark@airport.local"
+BENCHMARK_PASSWORD = "benchmark"
+
+
+class Command(BaseCommand):
+    help = "Fill the database with synthetic airports, routes, airplanes, flights, crews, orders and tickets."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--airports", type=int, default=200)
+        parser.add_argument("--routes-per-airport", type=int, default=10)
+        parser.add_argument("--airplanes", type=int, default=300)
+        parser.add_argument("--flights", type=int, default=20000)
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--crews", type=int, default=500)
+        parser.add_argument("--load-factor", type=float, default=0.6, help="Average share of sold seats per flight.")
+        parser.add_argument("--days", type=int, default=90, help="Length of the generated schedule.")
+        parser.add_argument("--batch-size", type=int, default=10000)
+        parser.add_argument("--seed", type=int, default=None, help="Random seed for reproducible data.")
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        with transaction.atomic():
+            airports = self.create_airports(options["airports"])
+            routes = self.create_routes(airports, options["routes_per_airport"])
+            airplanes = self.create_airplanes(options["airplanes"])
+            flights = self.create_flights(routes, airplanes, options["flights"], options["days"])
+            self.create_crews(flights, options["crews"])
+        users = self.create_users(options["users"])
+        self.create_orders_and_tickets(flights, airplanes, users, options["load_factor"])
+
+        # bulk_create() sends no signals, so drop what the running services cached
+        for model in (Airport, Route, AirplaneType, Airplane):
+            invalidate_reference_cache(model)
+        route_graph.invalidate()
+        airport_grid.invalidate()
+        autocomplete_index.invalidate()
+        self.stdout.write(f"RouteDailyOccupancy: {rebuild_occupancy(self.batch_size)}")
+        self.stdout.write(f"FlightSearchIndex: {rebuild_index(self.batch_size)}")
+
+    def bulk_create(self, model, objects):
+        created = []
+        for start in range(0, len(objects), self.batch_size):
+            created += model.objects.bulk_create(objects[start:start + self.batch_size])
+        self.stdout.write(f"{model.__name__}: {len(created)}")
+        return created
+
+    def create_airports(self, count):
+        # synthetic positions: every city gets a random centre and its airports lie within about 100 km of it
+        centres = [(self.random.uniform(-60, 70), self.random.uniform(-179, 179)) for _ in CITIES]
+        airports = []
+        for number in range(count):
+            city = number % len(CITIES)
+            latitude, longitude = centres[city]
+            airports.append(Airport(
+                name=f"{CITIES[city]} Airport {number // len(CITIES) + 1}",
+                closest_big_city=CITIES[city],
+                latitude=round(latitude + self.random.uniform(-1, 1), 6),
+                longitude=round(longitude + self.random.uniform(-1, 1), 6),
+            ))
+        return self.bulk_create(Airport, airports)
+
+    def create_routes(self, airports, routes_per_airport):
+        pairs = {
+            (source.id, destination.id)
+            for source in airports
+            for destination in self.random.sample(airports, min(routes_per_airport + 1, len(airports)))
+            if source.id != destination.id
+        }
+        positions = {airport.id: (airport.latitude, airport.longitude) for airport in airports}
+        pairs = sorted(pairs)
+        distances = haversine_km(
+            *np.array([positions[source] + positions[destination] for source, destination in pairs]).reshape(-1, 4).T
+        )
+        return self.bulk_create(Route, [
+            Route(source_id=source, destination_id=destination, distance=max(round(distance), 1))
+            for (source, destination), distance in zip(pairs, distances.tolist())
+        ])
+
+    def create_airplanes(self, count):
+        airplane_types = self.bulk_create(AirplaneType, [AirplaneType(name=name) for name in AIRPLANE_TYPES])
+        return self.bulk_create(Airplane, [
+            Airplane(
+                name=f"{self.random.choice('ABCDEFGHJKLMNPRSTUVWXYZ')}-{number:04d}",
+                rows=self.random.randint(15, 60),
+                seats_in_row=self.random.choice((4, 6, 6, 8, 9, 10)),
+                airplane_type=self.random.choice(airplane_types),
+            )
+            for number in range(count)
+        ])
+
+    def create_flights(self, routes, airplanes, count, days):
+        """Schedule flights at random times, each on the airplane that has been idle longest.
+
+        A flight departs when its airplane is back and turned around at the
+        latest, so no airplane flies two flights at once.
+        """
+        start = timezone.now().replace(minute=0, second=0, microsecond=0)
+        departures = sorted(
+            start + datetime.timedelta(minutes=5 * self.random.randrange(days * 24 * 12)) for _ in range(count)
+        )
+        # (moment the airplane is available, position in airplanes)
+        available = [(start, position) for position in range(len(airplanes))]
+        flights = []
+        for departure_time in departures:
+            available_at, position = heapq.heappop(available)
+            departure_time = max(departure_time, available_at)
+            route = self.random.choice(routes)
+            # roughly 800 km/h plus taxiing
+            arrival_time = departure_time + datetime.timedelta(minutes=30 + route.distance * 60 // 800)
+            flights.append(Flight(
+                route=route, airplane=airplanes[position], departure_time=departure_time, arrival_time=arrival_time
+            ))
+            heapq.heappush(available, (arrival_time + TURNAROUND, position))
+        return self.bulk_create(Flight, flights)
+
+    def create_crews(self, flights, count):
+        crews = self.bulk_create(Crew, [
+            Crew(first_name=self.random.choice(FIRST_NAMES), last_name=self.random.choice(LAST_NAMES))
+            for _ in range(count)
+        ])
+        self.bulk_create(Crew.flight.through, [
+            Crew.flight.through(crew_id=crew.id, flight_id=flight.id)
+            for crew in crews
+            for flight in self.crew_schedule(flights)
+        ])
+
+    def crew_schedule(self, flights, size=5):
+        """Pick up to ``size`` random flights that do not overlap."""
+        schedule = []
+        candidates = self.random.sample(flights, min(size * 2, len(flights)))
+        for flight in sorted(candidates, key=attrgetter("departure_time")):
+            if len(schedule) < size and (not schedule or schedule[-1].arrival_time <= flight.departure_time):
+                schedule.append(flight)
+        return schedule
+
+    def create_users(self, count):
+        User = get_user_model()
+        password = make_password(BENCHMARK_PASSWORD)
+        benchmark_user = User.objects.filter(email=BENCHMARK_EMAIL).first()
+        if benchmark_user is None:
+            benchmark_user = User.objects.create_user(BENCHMARK_EMAIL, BENCHMARK_PASSWORD, is_staff=True)
+        first_id = (User.objects.order_by("-id").values_list("id", flat=True).first() or 0) + 1
+        return [benchmark_user] + self.bulk_create(User, [
+            User(email=f"passenger{first_id + number}@airport.local", password=password)
+            for number in range(count)
+        ])
+
+    def create_orders_and_tickets(self, flights, airplanes, users, load_factor):
+        """Sell seats flight by flight in batches, so memory stays bounded for millions of tickets."""
+        airplanes_by_id = {airplane.id: airplane for airplane in airplanes}
+        orders_created = tickets_created = pending_tickets = 0
+        pending = []
+        for flight in flights:
+            airplane = airplanes_by_id[flight.airplane_id]
+            capacity = airplane.rows * airplane.seats_in_row
+            sold = min(capacity, max(0, round(self.random.gauss(load_factor, 0.2) * capacity)))
+            seats = self.random.sample(range(capacity), sold)
+            start = 0
+            while start < sold:
+                size = self.random.randint(1, 4)
+                pending.append((flight.id, airplane.seats_in_row, seats[start:start + size]))
+                start += size
+            pending_tickets += sold
+            if pending_tickets >= self.batch_size or flight is flights[-1]:
+                orders, tickets = self.flush_orders(pending, users)
+                orders_created, tickets_created = orders_created + orders, tickets_created + tickets
+                pending, pending_tickets = [], 0
+        self.stdout.write(f"Order: {orders_created}")
+        self.stdout.write(f"Ticket: {tickets_created}")
+
+    @transaction.atomic
+    def flush_orders(self, pending, users):
+        orders = Order.objects.bulk_create(
+            [Order(user=self.random.choice(users)) for _ in pending], batch_size=self.batch_size
+        )
+        tickets = [
+            Ticket(flight_id=flight_id, order_id=order.id, row=seat // seats_in_row + 1, seat=seat % seats_in_row + 1)
+            for order, (flight_id, seats_in_row, group) in zip(orders, pending)
+            for seat in group
+        ]
+        Ticket.objects.bulk_create(tickets, batch_size=self.batch_size)
+        return len(orders), len(tickets)
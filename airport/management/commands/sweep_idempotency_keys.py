@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from airport.idempotency import sweep_expired_keys
+
+
+class Command(BaseCommand):
+    help = "Delete expired idempotency keys in batches; meant to run periodically, e.g. from cron."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, batch_size, **options):
+        self.stdout.write(f"Deleted {sweep_expired_keys(batch_size)} expired idempotency keys.")
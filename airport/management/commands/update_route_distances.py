@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from airport.geo import update_route_distances
+from airport.itinerary import route_graph
+from airport.models import Route
+from airport.response_cache import invalidate_reference_cache
+
+
+class Command(BaseCommand):
+    help = "Recompute Route.distance as the great-circle distance between the airports' coordinates."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, batch_size, **options):
+        started = time.perf_counter()
+        with transaction.atomic():
+            computed, changed = update_route_distances(batch_size)
+        # bulk_update() sends no signals
+        invalidate_reference_cache(Route)
+        route_graph.invalidate()
+        self.stdout.write(
+            f"Computed {computed} route distances, updated {changed} in {time.perf_counter() - started:.2f}s."
+        )
+        skipped = Route.objects.count() - computed
+        if skipped:
+            self.stdout.write(f"{skipped} routes kept their distance, their airports have no coordinates.")
@@ -0,0 +1,23 @@
+# Generated by Django 5.1 on 2026-10-18 17:07
+
+import airport.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airport', '0003_alter_airplane_airplane_type_alter_flight_airplane_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='crew',
+            name='picture_member',
+            field=models.ImageField(default='not exist yet', upload_to=airport.models.member_picture_file_path),
+        ),
+        migrations.AddConstraint(
+            model_name='ticket',
+            constraint=models.UniqueConstraint(fields=('flight', 'row', 'seat'), name='unique_ticket_seat_per_flight'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.1 on 2026-10-18 17:08
+
+import django.db.models.deletion
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airport', '0004_ticket_unique_seat'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='flight',
+            name='route',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='flights', to='airport.route'),
+        ),
+        migrations.AlterField(
+            model_name='route',
+            name='source',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='routes_from', to='airport.airport'),
+        ),
+        migrations.AddIndex(
+            model_name='airport',
+            index=models.Index(django.db.models.functions.text.Upper('closest_big_city'), name='airport_city_upper_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='flight',
+            index=models.Index(fields=['route', 'departure_time'], name='flight_route_departure_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='flight',
+            index=models.Index(fields=['departure_time', 'id'], name='flight_departure_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='route',
+            index=models.Index(fields=['source', 'destination'], name='route_source_destination_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1 on 2026-10-18 17:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airport', '0006_crew_picture_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteDailyOccupancy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('flights', models.IntegerField(default=0)),
+                ('capacity', models.IntegerField(default=0)),
+                ('tickets_sold', models.IntegerField(default=0)),
+                ('route', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='daily_occupancy', to='airport.route')),
+            ],
+            options={
+                'verbose_name_plural': 'route daily occupancy',
+                'indexes': [models.Index(fields=['date', 'route'], name='route_occupancy_date_idx')],
+                'constraints': [models.UniqueConstraint(fields=('route', 'date'), name='unique_route_daily_occupancy')],
+            },
+        ),
+    ]
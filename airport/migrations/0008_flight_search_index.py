@@ -0,0 +1,76 @@
+# Generated by Django 5.1 on 2026-10-18 17:34
+
+import django.db.models.deletion
+import django.db.models.functions.text
+from django.db import migrations, models
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def index_existing_flights(apps, schema_editor):
+    Flight = apps.get_model("airport", "Flight")
+    FlightSearchIndex = apps.get_model("airport", "FlightSearchIndex")
+    Ticket = apps.get_model("airport", "Ticket")
+    tickets_sold = Ticket.objects.filter(flight=OuterRef("pk")).order_by().values("flight").annotate(
+        count=Count("id")
+    ).values("count")
+    rows = Flight.objects.order_by("id").values(
+        "departure_time",
+        "arrival_time",
+        "route_id",
+        "airplane_id",
+        flight_id=F("id"),
+        source_id=F("route__source_id"),
+        source_name=F("route__source__name"),
+        source_city=F("route__source__closest_big_city"),
+        destination_id=F("route__destination_id"),
+        destination_name=F("route__destination__name"),
+        destination_city=F("route__destination__closest_big_city"),
+        airplane_name=F("airplane__name"),
+        airplane_type_id=F("airplane__airplane_type_id"),
+        airplane_type_name=F("airplane__airplane_type__name"),
+        capacity=F("airplane__rows") * F("airplane__seats_in_row"),
+        tickets_sold=Coalesce(Subquery(tickets_sold), Value(0)),
+    )
+    batch = []
+    for row in rows.iterator(chunk_size=2000):
+        batch.append(FlightSearchIndex(**row))
+        if len(batch) == 2000:
+            FlightSearchIndex.objects.bulk_create(batch)
+            batch = []
+    FlightSearchIndex.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airport', '0007_route_daily_occupancy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FlightSearchIndex',
+            fields=[
+                ('flight', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_index', serialize=False, to='airport.flight')),
+                ('source_name', models.CharField(max_length=255)),
+                ('source_city', models.CharField(max_length=255)),
+                ('destination_name', models.CharField(max_length=255)),
+                ('destination_city', models.CharField(max_length=255)),
+                ('departure_time', models.DateTimeField()),
+                ('arrival_time', models.DateTimeField()),
+                ('airplane_name', models.CharField(max_length=255)),
+                ('airplane_type_name', models.CharField(max_length=255)),
+                ('capacity', models.IntegerField()),
+                ('tickets_sold', models.IntegerField(default=0)),
+                ('airplane', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='airport.airplane')),
+                ('airplane_type', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='airport.airplanetype')),
+                ('destination', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='airport.airport')),
+                ('route', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='airport.route')),
+                ('source', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='airport.airport')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['departure_time', 'flight'], name='search_departure_idx'), models.Index(fields=['source', 'destination', 'departure_time'], name='search_airports_idx'), models.Index(fields=['destination', 'departure_time'], name='search_destination_idx'), models.Index(django.db.models.functions.text.Upper('source_city'), models.F('departure_time'), name='search_source_city_idx'), models.Index(django.db.models.functions.text.Upper('destination_city'), models.F('departure_time'), name='search_destination_city_idx'), models.Index(fields=['route'], name='search_route_idx'), models.Index(fields=['airplane'], name='search_airplane_idx'), models.Index(fields=['airplane_type'], name='search_airplane_type_idx')],
+            },
+        ),
+        migrations.RunPython(index_existing_flights, migrations.RunPython.noop),
+    ]
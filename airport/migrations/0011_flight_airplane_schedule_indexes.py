@@ -0,0 +1,27 @@
+# Generated by Django 5.1 on 2026-10-18 17:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airport', '0010_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='flight',
+            name='airplane',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='flights', to='airport.airplane'),
+        ),
+        migrations.AddIndex(
+            model_name='flight',
+            index=models.Index(fields=['airplane', 'departure_time'], name='flight_airplane_departure_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='flight',
+            index=models.Index(fields=['airplane', 'arrival_time'], name='flight_airplane_arrival_idx'),
+        ),
+    ]
@@ -2,7 +2,12 @@ import os
 import uuid
 
 from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Upper
+from django.utils import timezone
 from django.utils.text import slugify
 
 from airport_service import settings
@@ -11,16 +16,32 @@ from airport_service import settings
 class Airport(models.Model):
     name = models.CharField(max_length=255)
     closest_big_city = models.CharField(max_length=255)
+    latitude = models.FloatField(
+        null=True, blank=True, validators=[MinValueValidator(-90), MaxValueValidator(90)]
+    )
+    longitude = models.FloatField(
+        null=True, blank=True, validators=[MinValueValidator(-180), MaxValueValidator(180)]
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(Upper("closest_big_city"), name="airport_city_upper_idx"),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.closest_big_city})"
 
 
 class Route(models.Model):
-    source = models.ForeignKey(Airport, on_delete=models.CASCADE, related_name='routes_from')
+    source = models.ForeignKey(Airport, on_delete=models.CASCADE, related_name='routes_from', db_index=False)
     destination = models.ForeignKey(Airport, on_delete=models.CASCADE, related_name='routes_to')
     distance = models.IntegerField()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["source", "destination"], name="route_source_destination_idx"),
+        ]
+
     def __str__(self):
         return f"{self.source.name} - {self.destination.name} {self.destination}"
 
@@ -56,16 +77,83 @@ class Ticket(models.Model):
     flight = models.ForeignKey("Flight", on_delete=models.CASCADE, related_name='tickets')
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='tickets')
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["flight", "row", "seat"], name="unique_ticket_seat_per_flight"),
+        ]
+
+    @staticmethod
+    def seat_errors(row, seat, airplane):
+        """Return ``{field: message}`` for a row or seat outside of ``airplane``, empty when the seat exists."""
+        return {
+            name: f"{name} must be in range [1, {count}], not {value}"
+            for value, count, name in ((row, airplane.rows, "row"), (seat, airplane.seats_in_row, "seat"))
+            if not 1 <= value <= count
+        }
+
+
+class FlightQuerySet(models.QuerySet):
+    def with_occupancy(self):
+        """Annotate ``capacity`` and ``tickets_sold`` in the same query.
+
+        Tickets are counted in a correlated subquery on the (flight, row, seat)
+        index rather than a GROUP BY over the joined tables, so only the rows
+        of the requested page are counted.
+        """
+        tickets_sold = Ticket.objects.filter(flight=OuterRef("pk")).order_by().values("flight").annotate(
+            count=Count("id")
+        ).values("count")
+        return self.annotate(
+            capacity=F("airplane__rows") * F("airplane__seats_in_row"),
+            tickets_sold=Coalesce(Subquery(tickets_sold), Value(0)),
+        )
+
+    def search(self, source=None, destination=None, source_city=None, destination_city=None,
+               departure_after=None, departure_before=None):
+        filters = {}
+        if source is not None:
+            filters["route__source_id"] = source
+        if destination is not None:
+            filters["route__destination_id"] = destination
+        if source_city:
+            filters["route__source__closest_big_city__iexact"] = source_city
+        if destination_city:
+            filters["route__destination__closest_big_city__iexact"] = destination_city
+        if departure_after is not None:
+            filters["departure_time__gte"] = departure_after
+        if departure_before is not None:
+            filters["departure_time__lt"] = departure_before
+        return self.filter(**filters).order_by("departure_time", "id")
+
 
 class Flight(models.Model):
-    route = models.ForeignKey(Route, on_delete=models.CASCADE, related_name='flights')
-    airplane = models.ForeignKey(Airplane, on_delete=models.CASCADE, related_name='flights')
+    route = models.ForeignKey(Route, on_delete=models.CASCADE, related_name='flights', db_index=False)
+    airplane = models.ForeignKey(Airplane, on_delete=models.CASCADE, related_name='flights', db_index=False)
     departure_time = models.DateTimeField()
     arrival_time = models.DateTimeField()
 
+    objects = FlightQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["route", "departure_time"], name="flight_route_departure_idx"),
+            models.Index(fields=["departure_time", "id"], name="flight_departure_idx"),
+            # airplane schedules: the conflict report walks departures, overlap checks look for later arrivals
+            models.Index(fields=["airplane", "departure_time"], name="flight_airplane_departure_idx"),
+            models.Index(fields=["airplane", "arrival_time"], name="flight_airplane_arrival_idx"),
+        ]
+
     def __str__(self):
         return f"{self.route.__str__()} - {self.airplane.name} time ({self.departure_time} - {self.arrival_time})"
 
+    @property
+    def tickets_available(self):
+        return self.capacity - self.tickets_sold
+
+    @property
+    def load_factor(self):
+        return self.tickets_sold / self.capacity if self.capacity else None
+
 
 def member_picture_file_path(instance, filename):
     _, extension = os.path.splitext(filename)
@@ -77,4 +165,118 @@ class Crew(models.Model):
     first_name = models.CharField(max_length=255)
     last_name = models.CharField(max_length=255)
     picture_member = models.ImageField(upload_to=member_picture_file_path, default="not exist yet")
+    # names of the resized copies written by airport.thumbnails, {"source": ..., "files": {variant: {format: name}}}
+    picture_variants = models.JSONField(default=dict, blank=True, editable=False)
     flight = models.ManyToManyField(Flight)
+
+
+class RouteDailyOccupancy(models.Model):
+    """Flights, seats and sold tickets per route and departure day, kept up to date by ``airport.occupancy``."""
+
+    route = models.ForeignKey(Route, on_delete=models.CASCADE, related_name="daily_occupancy", db_index=False)
+    date = models.DateField()
+    # plain integers, so a drifted row never blocks a delete; rebuild_route_occupancy fixes drift
+    flights = models.IntegerField(default=0)
+    capacity = models.IntegerField(default=0)
+    tickets_sold = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["route", "date"], name="unique_route_daily_occupancy"),
+        ]
+        indexes = [
+            models.Index(fields=["date", "route"], name="route_occupancy_date_idx"),
+        ]
+        verbose_name_plural = "route daily occupancy"
+
+    def __str__(self):
+        return f"{self.route_id} {self.date}: {self.tickets_sold}/{self.capacity}"
+
+    @property
+    def load_factor(self):
+        return self.tickets_sold / self.capacity if self.capacity else None
+
+
+class FlightSearchIndexQuerySet(models.QuerySet):
+    def search(self, source=None, destination=None, source_city=None, destination_city=None,
+               departure_after=None, departure_before=None):
+        """Same filters as ``FlightQuerySet.search``, without any join; ``id`` is the flight id."""
+        filters = {}
+        if source is not None:
+            filters["source_id"] = source
+        if destination is not None:
+            filters["destination_id"] = destination
+        if source_city:
+            filters["source_city__iexact"] = source_city
+        if destination_city:
+            filters["destination_city__iexact"] = destination_city
+        if departure_after is not None:
+            filters["departure_time__gte"] = departure_after
+        if departure_before is not None:
+            filters["departure_time__lt"] = departure_before
+        return self.filter(**filters).annotate(id=F("flight_id")).order_by("departure_time", "flight_id")
+
+
+class FlightSearchIndex(models.Model):
+    """One read-only row per flight with everything a search result shows, kept in sync by ``airport.search_index``."""
+
+    flight = models.OneToOneField(Flight, on_delete=models.CASCADE, primary_key=True, related_name="search_index")
+    route = models.ForeignKey(Route, on_delete=models.CASCADE, related_name="+", db_index=False)
+    source = models.ForeignKey(Airport, on_delete=models.CASCADE, related_name="+", db_index=False)
+    source_name = models.CharField(max_length=255)
+    source_city = models.CharField(max_length=255)
+    destination = models.ForeignKey(Airport, on_delete=models.CASCADE, related_name="+", db_index=False)
+    destination_name = models.CharField(max_length=255)
+    destination_city = models.CharField(max_length=255)
+    departure_time = models.DateTimeField()
+    arrival_time = models.DateTimeField()
+    airplane = models.ForeignKey(Airplane, on_delete=models.CASCADE, related_name="+", db_index=False)
+    airplane_name = models.CharField(max_length=255)
+    airplane_type = models.ForeignKey(AirplaneType, on_delete=models.CASCADE, related_name="+", db_index=False)
+    airplane_type_name = models.CharField(max_length=255)
+    capacity = models.IntegerField()
+    tickets_sold = models.IntegerField(default=0)
+
+    objects = FlightSearchIndexQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["departure_time", "flight"], name="search_departure_idx"),
+            models.Index(fields=["source", "destination", "departure_time"], name="search_airports_idx"),
+            models.Index(fields=["destination", "departure_time"], name="search_destination_idx"),
+            models.Index(Upper("source_city"), "departure_time", name="search_source_city_idx"),
+            models.Index(Upper("destination_city"), "departure_time", name="search_destination_city_idx"),
+            models.Index(fields=["route"], name="search_route_idx"),
+            models.Index(fields=["airplane"], name="search_airplane_idx"),
+            models.Index(fields=["airplane_type"], name="search_airplane_type_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.source_name} - {self.destination_name} ({self.departure_time})"
+
+
+class IdempotencyKey(models.Model):
+    """An ``Idempotency-Key`` sent with an unsafe request and the response to replay for its retries.
+
+    ``status_code`` is empty while the original request is still running;
+    ``locked_at`` is when that request claimed the key.
+    """
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+")
+    key = models.CharField(max_length=255)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    locked_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "key"], name="unique_user_idempotency_key"),
+        ]
+
+    def __str__(self):
+        return f"{self.key} ({self.method} {self.path})"
@@ -0,0 +1,262 @@
+"""Incremental maintenance of ``RouteDailyOccupancy``.
+
+Writes to tickets and flights turn into deltas of ``[flights, capacity,
+tickets_sold]`` per ``(route id, departure date)``. The deltas are applied
+with one ``INSERT ... ON CONFLICT DO UPDATE SET x = x + delta`` per batch,
+in the same transaction as the write, so the report never drifts from the
+ticket table it summarizes.
+``rebuild_occupancy`` recomputes the whole table from scratch.
+"""
+import threading
+from collections import defaultdict
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from airport.models import Airplane, Flight, RouteDailyOccupancy, Ticket
+
+# ids of flights being deleted, whose tickets were already subtracted with the flight
+_deleting = threading.local()
+
+
+def occupancy_date(departure_time):
+    return timezone.localdate(departure_time)
+
+
+def new_deltas():
+    return defaultdict(lambda: [0, 0, 0])
+
+
+def capacities(airplane_ids):
+    return {
+        airplane_id: rows * seats_in_row
+        for airplane_id, rows, seats_in_row in Airplane.objects.filter(id__in=set(airplane_ids)).values_list(
+            "id", "rows", "seats_in_row"
+        )
+    }
+
+
+def apply_deltas(deltas, batch_size=1000):
+    """Add the deltas to their rows with one upsert per batch, creating missing rows.
+
+    Rows are written in ``(route, date)`` order, so concurrent transactions
+    lock the rows they share in the same order and cannot deadlock on them.
+    """
+    changes = sorted(
+        (route_id, date, *delta) for (route_id, date), delta in deltas.items() if any(delta)
+    )
+    if connection.vendor not in ("postgresql", "sqlite"):
+        for change in changes:
+            _apply_delta(*change)
+        return
+    quote = connection.ops.quote_name
+    table = quote(RouteDailyOccupancy._meta.db_table)
+    counters = ("flights", "capacity", "tickets_sold")
+    with connection.cursor() as cursor:
+        for start in range(0, len(changes), batch_size):
+            batch = changes[start:start + batch_size]
+            cursor.execute(
+                f"INSERT INTO {table} ({', '.join(map(quote, ('route_id', 'date') + counters))}) "
+                f"VALUES {', '.join(['(%s, %s, %s, %s, %s)'] * len(batch))} "
+                f"ON CONFLICT ({quote('route_id')}, {quote('date')}) DO UPDATE SET "
+                + ", ".join(f"{quote(name)} = {table}.{quote(name)} + EXCLUDED.{quote(name)}" for name in counters),
+                [
+                    value
+                    for route_id, date, *delta in batch
+                    for value in (route_id, connection.ops.adapt_datefield_value(date), *delta)
+                ],
+            )
+
+
+def _apply_delta(route_id, date, flights, capacity, tickets_sold):
+    rows = RouteDailyOccupancy.objects.filter(route_id=route_id, date=date)
+    changes = {
+        "flights": F("flights") + flights,
+        "capacity": F("capacity") + capacity,
+        "tickets_sold": F("tickets_sold") + tickets_sold,
+    }
+    if rows.update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            RouteDailyOccupancy.objects.create(
+                route_id=route_id, date=date, flights=flights, capacity=capacity, tickets_sold=tickets_sold
+            )
+    except IntegrityError:
+        # another transaction created the row first
+        rows.update(**changes)
+
+
+def record_tickets(tickets, sign=1):
+    """Count created (``sign=1``) or deleted (``sign=-1``) tickets; one query finds their flights."""
+    per_flight = defaultdict(int)
+    for ticket in tickets:
+        per_flight[ticket.flight_id] += sign
+    record_ticket_changes(per_flight)
+
+
+def record_ticket_moves(tickets, previous_flight_ids):
+    """Move tickets from the flights in ``previous_flight_ids`` (by ticket id) to their current ones."""
+    per_flight = defaultdict(int)
+    for ticket in tickets:
+        per_flight[previous_flight_ids[ticket.id]] -= 1
+        per_flight[ticket.flight_id] += 1
+    record_ticket_changes(per_flight)
+
+
+def record_ticket_changes(per_flight):
+    deleting = getattr(_deleting, "flights", set())
+    per_flight = {flight_id: change for flight_id, change in per_flight.items() if change and flight_id not in deleting}
+    if not per_flight:
+        return
+    deltas = new_deltas()
+    for flight_id, route_id, departure_time in Flight.objects.filter(id__in=per_flight).values_list(
+        "id", "route_id", "departure_time"
+    ):
+        deltas[route_id, occupancy_date(departure_time)][2] += per_flight[flight_id]
+    apply_deltas(deltas)
+
+
+def record_flights(flights, sign=1, tickets_sold=None):
+    """Count created (``sign=1``) or removed (``sign=-1``) flights with their seats.
+
+    ``tickets_sold`` maps flight ids to sold tickets that move with the flight.
+    """
+    seats = capacities(flight.airplane_id for flight in flights)
+    deltas = new_deltas()
+    for flight in flights:
+        delta = deltas[flight.route_id, occupancy_date(flight.departure_time)]
+        delta[0] += sign
+        delta[1] += sign * seats.get(flight.airplane_id, 0)
+        delta[2] += sign * (tickets_sold or {}).get(flight.id, 0)
+    apply_deltas(deltas)
+
+
+def sold_tickets(flight_id):
+    return Ticket.objects.filter(flight_id=flight_id).count()
+
+
+def sold_tickets_by_flight(flight_ids):
+    return dict(
+        Ticket.objects.filter(flight_id__in=flight_ids).order_by().values("flight_id").annotate(
+            count=Count("id")
+        ).values_list("flight_id", "count")
+    )
+
+
+def remember_previous_flight(flight):
+    """Keep the stored route, departure and airplane of a flight about to be saved."""
+    flight._occupancy_previous = (
+        Flight.objects.filter(pk=flight.pk).only("route_id", "departure_time", "airplane_id").first()
+        if flight.pk else None
+    )
+
+
+def record_flight_save(flight, created):
+    previous = getattr(flight, "_occupancy_previous", None)
+    if created or previous is None:
+        record_flights([flight])
+        return
+    moved = (
+        previous.route_id != flight.route_id
+        or occupancy_date(previous.departure_time) != occupancy_date(flight.departure_time)
+        or previous.airplane_id != flight.airplane_id
+    )
+    if moved:
+        tickets_sold = {flight.id: sold_tickets(flight.id)}
+        record_flights([previous], -1, tickets_sold)
+        record_flights([flight], 1, tickets_sold)
+
+
+def record_flight_moves(flights, previous):
+    """Move updated flights with their tickets from the ``previous`` flights (by id) to their current schedule."""
+    def counted_as(flight):
+        return flight.route_id, occupancy_date(flight.departure_time), flight.airplane_id
+
+    moved = [flight for flight in flights if counted_as(previous[flight.id]) != counted_as(flight)]
+    if moved:
+        tickets_sold = sold_tickets_by_flight([flight.id for flight in moved])
+        record_flights([previous[flight.id] for flight in moved], -1, tickets_sold)
+        record_flights(moved, 1, tickets_sold)
+
+
+def start_flight_delete(flight):
+    """Subtract a flight with its tickets before the delete cascades to them."""
+    record_flights([flight], -1, {flight.id: sold_tickets(flight.id)})
+    if not hasattr(_deleting, "flights"):
+        _deleting.flights = set()
+    _deleting.flights.add(flight.id)
+
+
+def finish_flight_delete(flight):
+    getattr(_deleting, "flights", set()).discard(flight.id)
+
+
+def remember_previous_ticket(ticket):
+    ticket._previous_flight_id = (
+        Ticket.objects.filter(pk=ticket.pk).values_list("flight_id", flat=True).first() if ticket.pk else None
+    )
+
+
+def record_ticket_save(ticket, created):
+    previous_flight_id = getattr(ticket, "_previous_flight_id", None)
+    if created:
+        record_tickets([ticket])
+    elif previous_flight_id is not None and previous_flight_id != ticket.flight_id:
+        record_tickets([Ticket(flight_id=previous_flight_id)], -1)
+        record_tickets([ticket])
+
+
+def remember_previous_airplane(airplane):
+    airplane._occupancy_previous_capacity = (
+        Airplane.objects.filter(pk=airplane.pk).values_list(F("rows") * F("seats_in_row"), flat=True).first()
+        if airplane.pk else None
+    )
+
+
+def record_airplane_save(airplane):
+    """Resizing an airplane changes the capacity of every day its flights depart on."""
+    previous = getattr(airplane, "_occupancy_previous_capacity", None)
+    change = airplane.rows * airplane.seats_in_row - previous if previous is not None else 0
+    if not change:
+        return
+    deltas = new_deltas()
+    days = Flight.objects.filter(airplane=airplane).values_list("route_id", "departure_time")
+    for route_id, departure_time in days.iterator(chunk_size=5000):
+        deltas[route_id, occupancy_date(departure_time)][1] += change
+    apply_deltas(deltas)
+
+
+def occupancy_totals(flights):
+    """Compute ``{(route id, date): [flights, capacity, tickets_sold]}`` for a flight queryset."""
+    totals = new_deltas()
+    per_day = flights.values("route_id", date=TruncDate("departure_time")).order_by().annotate(
+        flight_count=Count("id"), seats=Sum(F("airplane__rows") * F("airplane__seats_in_row"))
+    )
+    for row in per_day.iterator(chunk_size=5000):
+        totals[row["route_id"], row["date"]][:2] = [row["flight_count"], row["seats"]]
+    tickets = Ticket.objects.filter(flight__in=flights).values(
+        route_id=F("flight__route_id"), date=TruncDate("flight__departure_time")
+    ).order_by().annotate(sold=Count("id"))
+    for row in tickets.iterator(chunk_size=5000):
+        totals[row["route_id"], row["date"]][2] = row["sold"]
+    return totals
+
+
+@transaction.atomic
+def rebuild_occupancy(batch_size=5000):
+    """Replace the table with totals computed from flights and tickets; returns the number of rows."""
+    totals = occupancy_totals(Flight.objects.all())
+    RouteDailyOccupancy.objects.all().delete()
+    RouteDailyOccupancy.objects.bulk_create(
+        [
+            RouteDailyOccupancy(
+                route_id=route_id, date=date, flights=flights, capacity=capacity, tickets_sold=tickets_sold
+            )
+            for (route_id, date), (flights, capacity, tickets_sold) in totals.items()
+        ],
+        batch_size=batch_size,
+    )
+    return len(totals)
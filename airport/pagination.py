@@ -0,0 +1,126 @@
+import json
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, LimitOffsetPagination
+
+
+def _reverse_ordering(ordering):
+    return tuple(name[1:] if name.startswith("-") else f"-{name}" for name in ordering)
+
+
+class IdCursorPagination(CursorPagination):
+    """Keyset pagination on ``id``, or on ``ordering`` ending with ``id``.
+
+    The cursor holds the values of every ordering column of the row it
+    points at and a page continues strictly after them, so rows are neither
+    repeated nor skipped between pages. A row whose ordering values change
+    in the meantime moves to where its new values put it.
+
+    Staff users may pass ``offset``/``limit`` instead to get limit/offset
+    pagination, e.g. to jump to an arbitrary page from admin tooling.
+    """
+
+    page_size = 100
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+    ordering = "id"
+
+    def __init__(self):
+        super().__init__()
+        self.offset_paginator = None
+
+    def use_offset_pagination(self, request):
+        return LimitOffsetPagination.offset_query_param in request.query_params and request.user.is_staff
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_offset_pagination(request):
+            self.offset_paginator = LimitOffsetPagination()
+            self.offset_paginator.default_limit = self.page_size
+            self.offset_paginator.max_limit = self.max_page_size
+            ordering = (self.ordering,) if isinstance(self.ordering, str) else self.ordering
+            return self.offset_paginator.paginate_queryset(queryset.order_by(*ordering), request, view)
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        # positions are unique, so the offset DRF keeps for repeated positions is always 0
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is not None:
+            self.cursor = self.cursor._replace(offset=0)
+        reverse = self.cursor is not None and self.cursor.reverse
+        position = self.cursor.position if self.cursor is not None else None
+
+        ordering = _reverse_ordering(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            try:
+                queryset = queryset.filter(self.after_position(ordering, position))
+            except (DjangoValidationError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        following = (
+            self._get_position_from_instance(results[-1], self.ordering) if len(results) > self.page_size else None
+        )
+
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.next_position = position is not None, position
+            self.has_previous, self.previous_position = following is not None, following
+        else:
+            self.has_next, self.next_position = following is not None, following
+            self.has_previous, self.previous_position = position is not None, position
+        self.display_page_controls = self.has_next or self.has_previous
+        return self.page
+
+    def after_position(self, ordering, position):
+        """Return a filter for the rows after ``position`` in ``ordering``."""
+        try:
+            values = json.loads(position)
+        except ValueError:
+            values = None
+        if not isinstance(values, list) or len(values) != len(ordering):
+            raise NotFound(self.invalid_cursor_message)
+        condition = Q()
+        equal = Q()
+        for name, value in zip(ordering, values):
+            lookup = "lt" if name.startswith("-") else "gt"
+            condition |= equal & Q(**{f"{name.lstrip('-')}__{lookup}": value})
+            equal &= Q(**{name.lstrip("-"): value})
+        return condition
+
+    def _get_position_from_instance(self, instance, ordering):
+        values = [
+            instance[name.lstrip("-")] if isinstance(instance, dict) else getattr(instance, name.lstrip("-"))
+            for name in ordering
+        ]
+        return json.dumps([str(value) for value in values], separators=(",", ":"))
+
+    def get_paginated_response(self, data):
+        if self.offset_paginator is not None:
+            return self.offset_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_schema_operation_parameters(self, view):
+        return (
+            super().get_schema_operation_parameters(view)
+            + LimitOffsetPagination().get_schema_operation_parameters(view)
+        )
+
+
+class FlightCursorPagination(IdCursorPagination):
+    ordering = ("departure_time", "id")
+
+
+class OccupancyCursorPagination(IdCursorPagination):
+    ordering = ("date", "id")
+
+
+def ordering_columns(paginator):
+    """Columns a cursor paginator reads from the last row of a page to build the next cursor."""
+    ordering = getattr(paginator, "ordering", None) or ()
+    ordering = (ordering,) if isinstance(ordering, str) else ordering
+    return [name.lstrip("-") for name in ordering]
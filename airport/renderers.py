@@ -0,0 +1,41 @@
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class SeatMapRenderer(BaseRenderer):
+    """Send the packed seat bitmap as raw bytes (``Accept: application/octet-stream`` or ``?format=bitmap``)."""
+
+    media_type = "application/octet-stream"
+    format = "bitmap"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return data
+
+
+class ORJSONRenderer(JSONRenderer):
+    """``JSONRenderer`` that encodes with orjson when it is installed.
+
+    The output is the same as ``JSONRenderer``'s compact output, except for
+    floats that ``json`` writes with an exponent, below 1e-4 or from 1e16 up,
+    which orjson writes differently. Indented output and a missing orjson
+    fall back to ``JSONRenderer``.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None or data is None or not self.compact or self.ensure_ascii
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # like JSONRenderer, keep the output a strict JavaScript subset
+        return ret.replace("\u2028".encode(), b"\\u2028").replace("\u2029".encode(), b"\\u2029")
@@ -0,0 +1,74 @@
+import hashlib
+import json
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+REFERENCE_CACHE_TIMEOUT = getattr(settings, "REFERENCE_CACHE_TIMEOUT", 60 * 60)
+
+
+def reference_cache():
+    return caches[getattr(settings, "REFERENCE_CACHE_ALIAS", "default")]
+
+
+def _version_key(model):
+    return f"airport:reference:version:{model._meta.label_lower}"
+
+
+def invalidate_reference_cache(model):
+    """Drop every cached response that contains rows of ``model``."""
+    reference_cache().set(_version_key(model), uuid.uuid4().hex, None)
+
+
+class ReferenceCacheMixin:
+    """Cache list and retrieve responses of rarely changing reference data.
+
+    ``cache_models`` names every model whose rows end up in the response; a
+    change to any of them invalidates the cached responses of the viewset.
+    Responses carry a strong ``ETag`` and ``If-None-Match`` is answered with 304.
+    """
+
+    cache_models = ()
+
+    def _cache_key(self, request):
+        cache = reference_cache()
+        version_keys = [_version_key(model) for model in self.cache_models]
+        versions = cache.get_many(version_keys)
+        for version_key in version_keys:
+            if version_key not in versions:
+                cache.add(version_key, uuid.uuid4().hex, None)
+                versions[version_key] = cache.get(version_key)
+        parts = [type(self).__name__, self.action, request.build_absolute_uri()]
+        parts += [versions[version_key] for version_key in version_keys]
+        return "airport:reference:" + hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+    def _cached_response(self, request, build_response):
+        cache = reference_cache()
+        key = self._cache_key(request)
+        entry = cache.get(key)
+        if entry is None:
+            response = build_response()
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            body = json.dumps(response.data, cls=DjangoJSONEncoder, sort_keys=True).encode()
+            entry = (f'"{hashlib.sha256(body).hexdigest()}"', response.data)
+            cache.set(key, entry, REFERENCE_CACHE_TIMEOUT)
+
+        etag, data = entry
+        if_none_match = parse_etags(request.headers.get("If-None-Match", ""))
+        if etag in if_none_match or "*" in if_none_match:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        return Response(data, headers={"ETag": etag})
+
+    def list(self, request, *args, **kwargs):
+        return self._cached_response(request, lambda: super(ReferenceCacheMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._cached_response(
+            request, lambda: super(ReferenceCacheMixin, self).retrieve(request, *args, **kwargs)
+        )
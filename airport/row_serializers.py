@@ -0,0 +1,120 @@
+from functools import cached_property
+
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from airport.pagination import ordering_columns
+from airport.renderers import ORJSONRenderer
+
+# fields whose to_representation() returns database values unchanged
+PASSTHROUGH_FIELDS = (serializers.IntegerField, serializers.CharField, serializers.BooleanField)
+
+
+class RowView(dict):
+    """A ``values()`` row that model properties can read attributes from."""
+
+    __slots__ = ()
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class RowSerializer:
+    """Serialize ``values()`` rows with the fields of a read-only ``ModelSerializer``.
+
+    Every field is compiled once into ``(name, column, getter, mapper)``.
+    The mapper is ``None`` where the field would return the database value
+    unchanged. ``computed`` names fields backed by model properties, which
+    are evaluated against the row, so the output is the same as the
+    serializer's for the same rows. ``names`` restricts the output to some
+    of the fields, see ``restricted()``.
+    """
+
+    def __init__(self, serializer_class, computed=(), names=None):
+        self.serializer_class = serializer_class
+        self.computed = computed
+        self.names = names
+        self._restricted = {}
+
+    def restricted(self, names):
+        """The row serializer for the ``names`` fields only, e.g. those picked with ``?fields=``."""
+        names = frozenset(names)
+        if names not in self._restricted:
+            self._restricted[names] = RowSerializer(self.serializer_class, self.computed, names)
+        return self._restricted[names]
+
+    @cached_property
+    def fields(self):
+        model = self.serializer_class.Meta.model
+        compiled = []
+        for name, field in self.serializer_class().fields.items():
+            if field.write_only or (self.names is not None and name not in self.names):
+                continue
+            mapper = None if isinstance(field, PASSTHROUGH_FIELDS) else field.to_representation
+            if name in self.computed:
+                compiled.append((name, None, getattr(model, name).fget, mapper))
+            else:
+                compiled.append((name, field.source, None, mapper))
+        return compiled
+
+    @cached_property
+    def columns(self):
+        if self.names is not None and any(getter is not None for _, _, getter, _ in self.fields):
+            # model properties may read any column
+            return RowSerializer(self.serializer_class, self.computed).columns
+        return [column for _, column, getter, _ in self.fields if getter is None]
+
+    def serialize(self, rows):
+        fields = self.fields
+        data = []
+        for row in rows:
+            if self.computed:
+                row = RowView(row)
+            item = {}
+            for name, column, getter, mapper in fields:
+                value = row[column] if getter is None else getter(row)
+                item[name] = value if value is None or mapper is None else mapper(value)
+            data.append(item)
+        return data
+
+
+class RowListMixin:
+    """Serve ``list`` from ``values()`` rows through ``row_serializer`` instead of model instances.
+
+    The queryset of the list action must not use ``prefetch_related()``.
+    Lists with expanded relations (``FieldSetMixin``) are served from model
+    instances.
+    """
+
+    row_serializer = None
+
+    def get_row_serializer(self):
+        """``row_serializer`` narrowed to ``?fields=``, ``None`` when the fieldset nests related objects."""
+        fieldset = getattr(self, "fieldset", None)
+        if fieldset is None:
+            return self.row_serializer
+        if not fieldset.is_flat():
+            return None
+        # the serializer rejects unknown names
+        return self.row_serializer.restricted(self.get_serializer().fields)
+
+    def list(self, request, *args, **kwargs):
+        row_serializer = self.get_row_serializer()
+        if row_serializer is None:
+            return super().list(request, *args, **kwargs)
+        columns = dict.fromkeys([*row_serializer.columns, *ordering_columns(self.paginator)])
+        queryset = self.filter_queryset(self.get_queryset()).values(*columns)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(row_serializer.serialize(page))
+        return Response(row_serializer.serialize(queryset))
+
+    def get_renderers(self):
+        renderers = super().get_renderers()
+        if self.action == "list":
+            renderers = [ORJSONRenderer() if type(renderer) is JSONRenderer else renderer for renderer in renderers]
+        return renderers
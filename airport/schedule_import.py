@@ -0,0 +1,231 @@
+import codecs
+import csv
+import io
+import json
+from bisect import bisect_left
+from itertools import chain
+
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from airport.models import Airport, Route, Airplane, Flight
+from airport.signals import flights_bulk_created
+
+IMPORT_FORMATS = ("csv", "ndjson")
+
+
+class ScheduleImporter:
+    """Import flights from CSV or NDJSON rows.
+
+    Each row names ``source`` and ``destination`` airports (id or exact name)
+    or a ``route`` id, an ``airplane`` (id or exact name) and ISO 8601
+    ``departure_time``/``arrival_time``. Airports, routes and airplanes are
+    loaded once into lookup maps; valid rows are inserted in batches with
+    PostgreSQL ``COPY`` where available and ``bulk_create`` otherwise. Invalid
+    rows, including flights whose airplane flies another flight meanwhile,
+    are collected in ``errors`` with their line numbers.
+    """
+
+    def __init__(self, batch_size=5000, dry_run=False):
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.created = 0
+        self.errors = []
+        self.airports = self._lookup(Airport.objects.values_list("id", "name"))
+        self.airplanes = self._lookup(Airplane.objects.values_list("id", "name"))
+        self.routes = {
+            (source_id, destination_id): route_id
+            for route_id, source_id, destination_id in Route.objects.values_list("id", "source_id", "destination_id")
+        }
+        self.route_ids = set(self.routes.values())
+        # airplane id -> (departure, arrival, name) of the flights a dry run accepted
+        self.accepted = {}
+
+    @staticmethod
+    def _lookup(rows):
+        """Map ids and names to ids; names shared by several rows map to None."""
+        lookup = {}
+        for pk, name in rows:
+            lookup[str(pk)] = pk
+            lookup[name] = None if name in lookup and lookup[name] != pk else pk
+        return lookup
+
+    @staticmethod
+    def read_rows(stream, import_format):
+        """Yield ``(line number, row)`` pairs; unparsable NDJSON lines are yielded as ``None`` rows."""
+        if import_format == "csv":
+            reader = csv.DictReader(stream)
+            for row in reader:
+                yield reader.line_num, row
+            return
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_number, row if isinstance(row, dict) else None
+
+    def _resolve(self, lookup, value, name, errors):
+        key = str(value).strip() if value is not None else ""
+        if not key:
+            errors[name] = "This field is required."
+            return None
+        if key not in lookup:
+            errors[name] = f"{key!r} does not exist."
+        elif lookup[key] is None:
+            errors[name] = f"{key!r} matches several rows, use the id."
+        return lookup.get(key)
+
+    def _parse_time(self, row, name, errors):
+        value = row.get(name)
+        try:
+            moment = parse_datetime(str(value).strip()) if value else None
+        except ValueError:
+            moment = None
+        if moment is None:
+            errors[name] = "Expected an ISO 8601 datetime."
+        elif timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        return moment
+
+    def validate(self, row):
+        """Return ``(flight, errors)`` for one input row."""
+        if row is None:
+            return None, {"row": "Expected a JSON object."}
+        errors = {}
+        if row.get("route"):
+            try:
+                route_id = int(row["route"])
+            except (TypeError, ValueError):
+                route_id = None
+            if route_id not in self.route_ids:
+                errors["route"] = f"{row['route']!r} does not exist."
+        else:
+            source_id = self._resolve(self.airports, row.get("source"), "source", errors)
+            destination_id = self._resolve(self.airports, row.get("destination"), "destination", errors)
+            route_id = self.routes.get((source_id, destination_id))
+            if source_id and destination_id and route_id is None:
+                errors["route"] = f"There is no route from {row['source']!r} to {row['destination']!r}."
+        airplane_id = self._resolve(self.airplanes, row.get("airplane"), "airplane", errors)
+        departure_time = self._parse_time(row, "departure_time", errors)
+        arrival_time = self._parse_time(row, "arrival_time", errors)
+        if departure_time and arrival_time and arrival_time <= departure_time:
+            errors["arrival_time"] = "Arrival must be after departure."
+        if errors:
+            return None, errors
+        return Flight(
+            route_id=route_id, airplane_id=airplane_id, departure_time=departure_time, arrival_time=arrival_time
+        ), None
+
+    def run(self, rows):
+        batch = []
+        for line_number, row in rows:
+            flight, errors = self.validate(row)
+            if errors:
+                self.errors.append({"line": line_number, "errors": errors})
+                continue
+            batch.append((line_number, flight))
+            if len(batch) >= self.batch_size:
+                self.flush(batch)
+                batch = []
+        if batch:
+            self.flush(batch)
+        self.errors.sort(key=lambda error: error["line"])
+        return self
+
+    def _load_schedules(self, batch):
+        """Return the schedules of the batch's airplanes during the batch, as ``schedule()`` reads them.
+
+        A dry run writes nothing, so the flights it accepted from earlier
+        batches are added from ``self.accepted``.
+        """
+        airplane_ids = {flight.airplane_id for _, flight in batch}
+        start = min(flight.departure_time for _, flight in batch)
+        end = max(flight.arrival_time for _, flight in batch)
+        intervals = {airplane_id: [] for airplane_id in airplane_ids}
+        flights = Flight.objects.filter(
+            airplane_id__in=airplane_ids, departure_time__lt=end, arrival_time__gt=start
+        ).values_list("airplane_id", "departure_time", "arrival_time", "id")
+        for airplane_id, departure_time, arrival_time, flight_id in flights:
+            intervals[airplane_id].append((departure_time, arrival_time, f"flight {flight_id}"))
+        for airplane_id in airplane_ids:
+            intervals[airplane_id] += self.accepted.get(airplane_id, ())
+        return {
+            airplane_id: tuple(map(list, zip(*sorted(airplane_intervals)))) if airplane_intervals else ([], [], [])
+            for airplane_id, airplane_intervals in intervals.items()
+        }
+
+    @staticmethod
+    def schedule(schedules, line_number, flight):
+        """Add the flight to its airplane's schedule, or return the error when the airplane is busy.
+
+        ``schedules`` map airplane ids to the departures, arrivals and names of
+        their flights, sorted by departure. Flights in a schedule do not
+        overlap, so the latest one departing before the new flight arrives is
+        the only one to check.
+        """
+        departures, arrivals, names = schedules[flight.airplane_id]
+        index = bisect_left(departures, flight.arrival_time)
+        if index and arrivals[index - 1] > flight.departure_time:
+            return {"airplane": f"The airplane is already assigned to {names[index - 1]} at that time."}
+        departures.insert(index, flight.departure_time)
+        arrivals.insert(index, flight.arrival_time)
+        names.insert(index, f"the flight on line {line_number}")
+        return None
+
+    def flush(self, batch):
+        with transaction.atomic():
+            # locking the airplanes serializes the import with other schedule changes, like FlightSerializer.save
+            airplane_ids = sorted({flight.airplane_id for _, flight in batch})
+            list(Airplane.objects.select_for_update().filter(pk__in=airplane_ids).order_by("pk").values_list("pk"))
+            schedules = self._load_schedules(batch)
+            flights = []
+            for line_number, flight in batch:
+                errors = self.schedule(schedules, line_number, flight)
+                if errors:
+                    self.errors.append({"line": line_number, "errors": errors})
+                    continue
+                flights.append(flight)
+                if self.dry_run:
+                    self.accepted.setdefault(flight.airplane_id, []).append(
+                        (flight.departure_time, flight.arrival_time, f"the flight on line {line_number}")
+                    )
+            if flights and not self.dry_run:
+                if connection.vendor == "postgresql":
+                    self._copy(flights)
+                else:
+                    flights = Flight.objects.bulk_create(flights)
+                flights_bulk_created.send(sender=Flight, flights=flights)
+        self.created += len(flights)
+
+    @staticmethod
+    def _copy(flights):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for flight in flights:
+            writer.writerow(
+                (flight.route_id, flight.airplane_id, flight.departure_time.isoformat(), flight.arrival_time.isoformat())
+            )
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY {Flight._meta.db_table} (route_id, airplane_id, departure_time, arrival_time) "
+                f"FROM STDIN WITH (FORMAT csv)",
+                buffer,
+            )
+
+
+def find_encoding_error(chunks, encoding="utf-8"):
+    """Return the number of the first line of the byte ``chunks`` that does not decode, or ``None``."""
+    decoder = codecs.getincrementaldecoder(encoding)()
+    line_number = 1
+    for chunk in chain(chunks, [None]):
+        try:
+            text = decoder.decode(chunk or b"", final=chunk is None)
+        except UnicodeDecodeError as error:
+            return line_number + error.object[:error.start].count(b"\n")
+        line_number += text.count("\n")
+    return None
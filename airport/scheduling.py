@@ -0,0 +1,131 @@
+"""Double-booking checks for airplanes and crews.
+
+Two flights conflict when they share an airplane or a crew member and
+``departure_time < other.arrival_time and other.departure_time < arrival_time``.
+Flight writes are checked with indexed range queries on the flights of the
+airplane and of the crew members; ``find_conflicts`` reports the conflicts
+of a window with one sweep over flights sorted by departure. A flight
+moved to another airplane must also keep every sold seat.
+"""
+import heapq
+from collections import defaultdict
+from itertools import groupby
+from operator import itemgetter
+
+from django.db.models import Q
+
+from airport.models import Crew, Flight, Ticket
+
+CONFLICT_KINDS = ("airplane", "crew")
+
+
+def overlapping(flights, departure_time, arrival_time):
+    return flights.filter(departure_time__lt=arrival_time, arrival_time__gt=departure_time)
+
+
+def validate_airplane_schedule(airplane_id, departure_time, arrival_time, flight_id, error_to_raise):
+    """Raise ``error_to_raise`` when the times are reversed or the airplane flies another flight meanwhile."""
+    if arrival_time <= departure_time:
+        raise error_to_raise({"arrival_time": "Arrival must be after departure."})
+    conflict = overlapping(
+        Flight.objects.filter(airplane_id=airplane_id).exclude(pk=flight_id), departure_time, arrival_time
+    ).order_by("departure_time").values_list("id", flat=True).first()
+    if conflict is not None:
+        raise error_to_raise({"airplane": f"The airplane is already assigned to flight {conflict} at that time."})
+
+
+def validate_crew_schedule(flights, error_to_raise):
+    """Raise ``error_to_raise`` when any two of the flights a crew member is assigned to overlap."""
+    intervals = sorted((flight.id, flight.departure_time, flight.arrival_time) for flight in flights)
+    for first, second, _, _ in sweep(sorted(intervals, key=itemgetter(1))):
+        raise error_to_raise({"flight": f"Flights {first} and {second} overlap."})
+
+
+def sweep(intervals):
+    """Yield ``(earlier id, later id, overlap start, overlap end)`` for overlapping ``(id, start, end)`` intervals.
+
+    ``intervals`` must be sorted by start. Intervals still running are kept in
+    a heap ordered by end, so the pass takes O(n log n) plus the number of
+    conflicts.
+    """
+    running = []
+    for interval_id, start, end in intervals:
+        while running and running[0][0] <= start:
+            heapq.heappop(running)
+        for other_end, other_id in running:
+            yield other_id, interval_id, start, min(end, other_end)
+        heapq.heappush(running, (end, interval_id))
+
+
+def validate_flight_crew_schedule(flight_id, departure_time, arrival_time, error_to_raise):
+    """Raise ``error_to_raise`` when a crew member of the flight is assigned to another flight meanwhile."""
+    crew_flights = Crew.flight.through.objects
+    conflict = crew_flights.filter(
+        crew_id__in=crew_flights.filter(flight_id=flight_id).values("crew_id"),
+        flight__departure_time__lt=arrival_time,
+        flight__arrival_time__gt=departure_time,
+    ).exclude(flight_id=flight_id).order_by("flight__departure_time").values_list("crew_id", "flight_id").first()
+    if conflict is not None:
+        crew_id, other_flight_id = conflict
+        raise error_to_raise(
+            {"crew": f"Crew member {crew_id} is already assigned to flight {other_flight_id} at that time."}
+        )
+
+
+def stranded_tickets(airplanes_by_flight):
+    """Return ``{flight id: [ticket ids]}`` for the sold seats missing on the airplanes the flights move to."""
+    outside = Q()
+    for flight_id, airplane in airplanes_by_flight.items():
+        outside |= Q(flight_id=flight_id) & (Q(row__gt=airplane.rows) | Q(seat__gt=airplane.seats_in_row))
+    stranded = defaultdict(list)
+    if outside:
+        for flight_id, ticket_id in Ticket.objects.filter(outside).order_by("id").values_list("flight_id", "id"):
+            stranded[flight_id].append(ticket_id)
+    return stranded
+
+
+def airplane_swap_error(airplane, ticket_ids, shown=10):
+    tickets = ", ".join(map(str, ticket_ids[:shown]))
+    if len(ticket_ids) > shown:
+        tickets += f" and {len(ticket_ids) - shown} more"
+    return f"Airplane {airplane.id} has no seat for tickets {tickets}; move or cancel them first."
+
+
+def validate_airplane_swap(flight_id, airplane, error_to_raise):
+    """Raise ``error_to_raise`` when tickets sold for the flight have no seat on ``airplane``."""
+    ticket_ids = stranded_tickets({flight_id: airplane}).get(flight_id)
+    if ticket_ids:
+        raise error_to_raise({"airplane": airplane_swap_error(airplane, ticket_ids)})
+
+
+def find_conflicts(departure_after, departure_before, kinds=CONFLICT_KINDS, limit=None):
+    """Return the airplane and crew conflicts between flights in the air during the window, earliest first.
+
+    With a ``limit`` only that many conflicts are kept while sweeping.
+    """
+    flights = overlapping(Flight.objects.all(), departure_after, departure_before)
+    sources = {
+        "airplane": flights.values_list("airplane_id", "id", "departure_time", "arrival_time").order_by(
+            "airplane_id", "departure_time", "id"
+        ),
+        "crew": Crew.flight.through.objects.filter(flight__in=flights).values_list(
+            "crew_id", "flight_id", "flight__departure_time", "flight__arrival_time"
+        ).order_by("crew_id", "flight__departure_time", "flight_id"),
+    }
+    conflicts = (
+        {
+            "kind": kind,
+            "resource": resource,
+            "flight": flight,
+            "conflicting_flight": conflicting_flight,
+            "overlap_start": start,
+            "overlap_end": end,
+        }
+        for kind in kinds
+        for resource, rows in groupby(sources[kind].iterator(chunk_size=5000), key=itemgetter(0))
+        for flight, conflicting_flight, start, end in sweep(row[1:] for row in rows)
+    )
+    order = itemgetter("overlap_start", "kind", "resource")
+    if limit is None:
+        return sorted(conflicts, key=order)
+    return heapq.nsmallest(limit, conflicts, key=order)
@@ -0,0 +1,182 @@
+"""Maintenance of ``FlightSearchIndex``, the denormalized table flight search reads from.
+
+Flights are (re)indexed from one joined query and upserted. Changes to the
+airports, routes, airplanes and airplane types copied into the index are
+applied with set-based ``UPDATE`` statements, and ticket sales adjust
+``tickets_sold`` in place.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
+
+from airport.models import Flight, FlightSearchIndex, Ticket
+
+# index column -> lookup on Flight
+INDEX_COLUMNS = {
+    "route_id": "route_id",
+    "source_id": "route__source_id",
+    "source_name": "route__source__name",
+    "source_city": "route__source__closest_big_city",
+    "destination_id": "route__destination_id",
+    "destination_name": "route__destination__name",
+    "destination_city": "route__destination__closest_big_city",
+    "departure_time": "departure_time",
+    "arrival_time": "arrival_time",
+    "airplane_id": "airplane_id",
+    "airplane_name": "airplane__name",
+    "airplane_type_id": "airplane__airplane_type_id",
+    "airplane_type_name": "airplane__airplane_type__name",
+}
+COMPARED_COLUMNS = tuple(INDEX_COLUMNS) + ("capacity", "tickets_sold")
+
+
+def index_values(flights):
+    """Yield ``(flight id, {column: value})`` computed from the source tables for a flight queryset."""
+    tickets_sold = Ticket.objects.filter(flight=OuterRef("pk")).order_by().values("flight").annotate(
+        count=Count("id")
+    ).values("count")
+    rows = flights.order_by("id").values_list(
+        "id",
+        *INDEX_COLUMNS.values(),
+        F("airplane__rows") * F("airplane__seats_in_row"),
+        Coalesce(Subquery(tickets_sold), Value(0)),
+    )
+    for flight_id, *values in rows.iterator(chunk_size=2000):
+        yield flight_id, dict(zip(COMPARED_COLUMNS, values))
+
+
+def index_flights(flights, batch_size=2000):
+    """Insert or refresh the index rows of a flight queryset; returns the number of rows written."""
+    written = 0
+    batch = []
+    for flight_id, values in index_values(flights):
+        batch.append(FlightSearchIndex(flight_id=flight_id, **values))
+        if len(batch) >= batch_size:
+            written += _upsert(batch)
+            batch = []
+    if batch:
+        written += _upsert(batch)
+    return written
+
+
+def _upsert(rows):
+    FlightSearchIndex.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=["flight"],
+        update_fields=COMPARED_COLUMNS,
+    )
+    return len(rows)
+
+
+def index_bulk_created_flights(flights):
+    """Index flights created without ``post_save``; rows written with ``COPY`` have no id and are looked up."""
+    ids = [flight.id for flight in flights if flight.id is not None]
+    without_id = [flight for flight in flights if flight.id is None]
+    lookups = Q(id__in=ids) if ids else Q()
+    if without_id:
+        departures = [flight.departure_time for flight in without_id]
+        lookups |= Q(
+            route_id__in={flight.route_id for flight in without_id},
+            departure_time__range=(min(departures), max(departures)),
+            search_index__isnull=True,
+        )
+    if ids or without_id:
+        index_flights(Flight.objects.filter(lookups))
+
+
+def adjust_tickets_sold(changes):
+    """Apply ``{flight id: change}`` to ``tickets_sold`` in one ``UPDATE``."""
+    changes = {flight_id: change for flight_id, change in changes.items() if change}
+    if not changes:
+        return
+    FlightSearchIndex.objects.filter(flight_id__in=changes).update(
+        tickets_sold=F("tickets_sold") + Case(
+            *(When(flight_id=flight_id, then=Value(change)) for flight_id, change in changes.items()),
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+    )
+
+
+def record_tickets(tickets, sign=1):
+    changes = defaultdict(int)
+    for ticket in tickets:
+        changes[ticket.flight_id] += sign
+    adjust_tickets_sold(changes)
+
+
+def record_ticket_moves(tickets, previous_flight_ids):
+    changes = defaultdict(int)
+    for ticket in tickets:
+        changes[previous_flight_ids[ticket.id]] -= 1
+        changes[ticket.flight_id] += 1
+    adjust_tickets_sold(changes)
+
+
+def record_ticket_save(ticket, created):
+    previous_flight_id = getattr(ticket, "_previous_flight_id", None)
+    if created:
+        record_tickets([ticket])
+    elif previous_flight_id is not None and previous_flight_id != ticket.flight_id:
+        adjust_tickets_sold({previous_flight_id: -1, ticket.flight_id: 1})
+
+
+def update_airport(airport):
+    FlightSearchIndex.objects.filter(source_id=airport.id).update(
+        source_name=airport.name, source_city=airport.closest_big_city
+    )
+    FlightSearchIndex.objects.filter(destination_id=airport.id).update(
+        destination_name=airport.name, destination_city=airport.closest_big_city
+    )
+
+
+def update_route(route):
+    """Routes can change their airports, so their flights are reindexed."""
+    index_flights(Flight.objects.filter(route_id=route.id))
+
+
+def update_airplane(airplane):
+    FlightSearchIndex.objects.filter(airplane_id=airplane.id).update(
+        airplane_name=airplane.name,
+        airplane_type_id=airplane.airplane_type_id,
+        airplane_type_name=airplane.airplane_type.name,
+        capacity=airplane.rows * airplane.seats_in_row,
+    )
+
+
+def update_airplane_type(airplane_type):
+    FlightSearchIndex.objects.filter(airplane_type_id=airplane_type.id).update(airplane_type_name=airplane_type.name)
+
+
+def check_index(fix=False):
+    """Compare the index with the source tables; returns ``(missing, stale, orphaned)`` flight ids.
+
+    With ``fix`` missing and stale rows are rewritten and orphaned rows deleted.
+    """
+    indexed = {
+        row[0]: dict(zip(COMPARED_COLUMNS, row[1:]))
+        for row in FlightSearchIndex.objects.values_list("flight_id", *COMPARED_COLUMNS).iterator(chunk_size=2000)
+    }
+    missing, stale = [], []
+    for flight_id, values in index_values(Flight.objects.all()):
+        stored = indexed.pop(flight_id, None)
+        if stored is None:
+            missing.append(flight_id)
+        elif stored != values:
+            stale.append(flight_id)
+    orphaned = sorted(indexed)
+    if fix:
+        with transaction.atomic():
+            if missing or stale:
+                index_flights(Flight.objects.filter(id__in=missing + stale))
+            FlightSearchIndex.objects.filter(flight_id__in=orphaned).delete()
+    return missing, stale, orphaned
+
+
+@transaction.atomic
+def rebuild_index(batch_size=2000):
+    FlightSearchIndex.objects.all().delete()
+    return index_flights(Flight.objects.all(), batch_size)
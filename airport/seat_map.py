@@ -0,0 +1,134 @@
+import base64
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from airport.models import Ticket
+
+SEAT_MAP_CACHE_TIMEOUT = getattr(settings, "SEAT_MAP_CACHE_TIMEOUT", 300)
+
+
+def seat_map_version_key(flight_id):
+    return f"airport:seat_map_version:{flight_id}"
+
+
+def seat_map_cache_key(flight_id, version):
+    return f"airport:seat_map:{flight_id}:{version}"
+
+
+class SeatMap:
+    """Seat occupancy of a flight packed one bit per seat.
+
+    Seats are laid out row by row, ``(row - 1) * seats_in_row + (seat - 1)``,
+    and each byte is filled from its most significant bit.
+    """
+
+    def __init__(self, flight_id, rows, seats_in_row, bits=None):
+        self.flight_id = flight_id
+        self.rows = rows
+        self.seats_in_row = seats_in_row
+        size = (rows * seats_in_row + 7) // 8
+        self.bits = bytearray(bits) if bits is not None else bytearray(size)
+
+    @classmethod
+    def for_flight(cls, flight):
+        seat_map = cls(flight.id, flight.airplane.rows, flight.airplane.seats_in_row)
+        for row, seat in Ticket.objects.filter(flight_id=flight.id).values_list("row", "seat"):
+            if seat_map.contains(row, seat):
+                seat_map.mark(row, seat)
+        return seat_map
+
+    @classmethod
+    async def afor_flight(cls, flight):
+        seat_map = cls(flight.id, flight.airplane.rows, flight.airplane.seats_in_row)
+        async for row, seat in Ticket.objects.filter(flight_id=flight.id).values_list("row", "seat"):
+            if seat_map.contains(row, seat):
+                seat_map.mark(row, seat)
+        return seat_map
+
+    def contains(self, row, seat):
+        return 1 <= row <= self.rows and 1 <= seat <= self.seats_in_row
+
+    def _position(self, row, seat):
+        if not self.contains(row, seat):
+            raise IndexError(f"seat {row}-{seat} is outside of {self.rows}x{self.seats_in_row}")
+        index = (row - 1) * self.seats_in_row + seat - 1
+        return index >> 3, 0x80 >> (index & 7)
+
+    def is_taken(self, row, seat):
+        byte, mask = self._position(row, seat)
+        return bool(self.bits[byte] & mask)
+
+    def mark(self, row, seat, taken=True):
+        byte, mask = self._position(row, seat)
+        if taken:
+            self.bits[byte] |= mask
+        else:
+            self.bits[byte] &= ~mask
+
+    @property
+    def capacity(self):
+        return self.rows * self.seats_in_row
+
+    @property
+    def taken_count(self):
+        return int.from_bytes(self.bits, "big").bit_count()
+
+    @property
+    def available_count(self):
+        return self.capacity - self.taken_count
+
+    @property
+    def grid(self):
+        return [
+            [self.is_taken(row, seat) for seat in range(1, self.seats_in_row + 1)]
+            for row in range(1, self.rows + 1)
+        ]
+
+    def to_bytes(self):
+        return bytes(self.bits)
+
+    def to_base64(self):
+        return base64.b64encode(self.bits).decode("ascii")
+
+
+def get_seat_map(flight):
+    """Return the cached seat map of ``flight``, building it from its tickets on a miss.
+
+    Maps are cached under the flight's current version. A write moves the
+    flight to a new version instead of editing the cached map, so a map
+    built from tickets read before the write is stored under a version no
+    reader asks for anymore.
+    """
+    version_key = seat_map_version_key(flight.id)
+    version = cache.get(version_key)
+    if version is None:
+        cache.add(version_key, uuid.uuid4().hex, SEAT_MAP_CACHE_TIMEOUT)
+        version = cache.get(version_key)
+    seat_map = cache.get(seat_map_cache_key(flight.id, version))
+    airplane = flight.airplane
+    if seat_map is None or (seat_map.rows, seat_map.seats_in_row) != (airplane.rows, airplane.seats_in_row):
+        seat_map = SeatMap.for_flight(flight)
+        cache.set(seat_map_cache_key(flight.id, version), seat_map, SEAT_MAP_CACHE_TIMEOUT)
+    return seat_map
+
+
+async def aget_seat_map(flight):
+    """Async version of ``get_seat_map``."""
+    version_key = seat_map_version_key(flight.id)
+    version = await cache.aget(version_key)
+    if version is None:
+        await cache.aadd(version_key, uuid.uuid4().hex, SEAT_MAP_CACHE_TIMEOUT)
+        version = await cache.aget(version_key)
+    seat_map = await cache.aget(seat_map_cache_key(flight.id, version))
+    airplane = flight.airplane
+    if seat_map is None or (seat_map.rows, seat_map.seats_in_row) != (airplane.rows, airplane.seats_in_row):
+        seat_map = await SeatMap.afor_flight(flight)
+        await cache.aset(seat_map_cache_key(flight.id, version), seat_map, SEAT_MAP_CACHE_TIMEOUT)
+    return seat_map
+
+
+def invalidate_seat_map(flight_id):
+    """Move the flight to a new seat map version; the next read rebuilds the map from the tickets."""
+    cache.set(seat_map_version_key(flight_id), uuid.uuid4().hex, SEAT_MAP_CACHE_TIMEOUT)
@@ -1,19 +1,40 @@
+from django.db import IntegrityError, transaction
 from rest_framework import serializers
 
-from airport.models import Airport, Route, Airplane, AirplaneType, Order, Ticket, Flight, Crew
+from airport.fieldsets import ExpandableFieldsMixin
+from airport.models import Airport, Route, Airplane, AirplaneType, Order, Ticket, Flight, Crew, RouteDailyOccupancy
+from airport.scheduling import (CONFLICT_KINDS, validate_airplane_schedule, validate_airplane_swap,
+                                validate_crew_schedule, validate_flight_crew_schedule)
+from airport.signals import tickets_bulk_created
 
 
-class AirportSerializer(serializers.ModelSerializer):
+class AirportSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Airport
-        fields = ("id", "name", "closest_big_city")
+        fields = ("id", "name", "closest_big_city", "latitude", "longitude")
 
+    def validate(self, attrs):
+        latitude = attrs.get("latitude", getattr(self.instance, "latitude", None))
+        longitude = attrs.get("longitude", getattr(self.instance, "longitude", None))
+        if (latitude is None) != (longitude is None):
+            raise serializers.ValidationError("Set both latitude and longitude, or neither.")
+        return attrs
 
-class RouteListSerializer(serializers.ModelSerializer):
+
+class NearestAirportSerializer(AirportSerializer):
+    distance = serializers.FloatField(read_only=True, help_text="Great-circle distance in kilometres")
+
+    class Meta(AirportSerializer.Meta):
+        fields = AirportSerializer.Meta.fields + ("distance",)
+
+
+class RouteListSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Route
         fields = ("id", "source", "destination", "distance")
 
+    expandable_fields = {"source": AirportSerializer, "destination": AirportSerializer}
+
 
 class RouteDetailSerializer(RouteListSerializer):
     source = AirportSerializer(read_only=True)
@@ -24,19 +45,21 @@ class RouteDetailSerializer(RouteListSerializer):
         fields = ("id", "source", "destination", "distance")
 
 
-class AirplaneTypeSerializer(serializers.ModelSerializer):
+class AirplaneTypeSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = AirplaneType
         fields = ("id", "name")
 
 
-class AirplaneListSerializer(serializers.ModelSerializer):
+class AirplaneListSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Airplane
         fields = ("id", "name", "rows", "seats_in_row", "airplane_type")
 
+    expandable_fields = {"airplane_type": AirplaneTypeSerializer}
 
-class AirplaneDetailSerializer(serializers.ModelSerializer):
+
+class AirplaneDetailSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
     airplane_type = AirplaneTypeSerializer(read_only=False)
 
     class Meta:
@@ -44,7 +67,7 @@ class AirplaneDetailSerializer(serializers.ModelSerializer):
         fields = ("id", "name", "rows", "seats_in_row", "airplane_type")
 
 
-class OrderListSerializer(serializers.ModelSerializer):
+class OrderListSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
     customer = serializers.CharField(source="user.email")
 
     class Meta:
@@ -52,34 +75,124 @@ class OrderListSerializer(serializers.ModelSerializer):
         fields = ("created_at", "customer")
 
 
-class FlightListSerializer(serializers.ModelSerializer):
-    route = serializers.IntegerField(source="route.id", read_only=True)
-    airplane = serializers.IntegerField(source="airplane.id", read_only=True)
+class FlightOccupancySerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
+    # needs FlightQuerySet.with_occupancy(), querysets of nested flights are annotated with annotate_queryset()
+    capacity = serializers.IntegerField(read_only=True)
+    tickets_sold = serializers.IntegerField(read_only=True)
+    tickets_available = serializers.IntegerField(read_only=True)
+    load_factor = serializers.FloatField(read_only=True)
+    # read from the annotations only, a query plan needs no columns for them
+    annotation_fields = ("capacity", "tickets_sold", "tickets_available", "load_factor")
+
+    @staticmethod
+    def annotate_queryset(queryset):
+        return queryset if "tickets_sold" in queryset.query.annotations else queryset.with_occupancy()
+
+
+class FlightListSerializer(FlightOccupancySerializer):
+    route = serializers.IntegerField(source="route_id", read_only=True)
+    airplane = serializers.IntegerField(source="airplane_id", read_only=True)
 
     class Meta:
         model = Flight
-        fields = ("id", "route", "airplane", "departure_time", "arrival_time")
+        fields = (
+            "id", "route", "airplane", "departure_time", "arrival_time",
+            "capacity", "tickets_sold", "tickets_available", "load_factor",
+        )
 
+    expandable_fields = {"route": RouteListSerializer, "airplane": AirplaneListSerializer}
 
-class FlightDetailSerializer(serializers.ModelSerializer):
+
+class FlightDetailSerializer(FlightOccupancySerializer):
     route = RouteDetailSerializer()
     airplane = AirplaneDetailSerializer()
 
     class Meta:
         model = Flight
-        fields = ("id", "route", "airplane", "departure_time", "arrival_time")
+        fields = (
+            "id", "route", "airplane", "departure_time", "arrival_time",
+            "capacity", "tickets_sold", "tickets_available", "load_factor",
+        )
 
 
-class TicketListSerializer(serializers.ModelSerializer):
-    flight = serializers.IntegerField(source="flight.id")
-    order = serializers.IntegerField(source="order.id")
+class FlightSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Flight
+        fields = ("id", "route", "airplane", "departure_time", "arrival_time")
+
+    def save(self, **kwargs):
+        data = {**self.validated_data, **kwargs}
+        airplane = data.get("airplane") or self.instance.airplane
+        departure_time = data.get("departure_time") or self.instance.departure_time
+        arrival_time = data.get("arrival_time") or self.instance.arrival_time
+        with transaction.atomic():
+            # locking the airplane serializes concurrent schedule changes of the same airplane
+            Airplane.objects.select_for_update().filter(pk=airplane.pk).exists()
+            validate_airplane_schedule(
+                airplane.pk, departure_time, arrival_time, self.instance.pk if self.instance else None,
+                serializers.ValidationError,
+            )
+            if self.instance and airplane.pk != self.instance.airplane_id:
+                validate_airplane_swap(self.instance.pk, airplane, serializers.ValidationError)
+            # a new flight has no crew yet; a retimed one must still fit its crew members' schedules
+            if self.instance and (departure_time, arrival_time) != (
+                self.instance.departure_time, self.instance.arrival_time
+            ):
+                validate_flight_crew_schedule(
+                    self.instance.pk, departure_time, arrival_time, serializers.ValidationError
+                )
+            return super().save(**kwargs)
+
+
+class TicketListSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
+    flight = serializers.IntegerField(source="flight_id", read_only=True)
+    order = serializers.IntegerField(source="order_id", read_only=True)
 
     class Meta:
         model = Ticket
         fields = ("id", "row", "seat", "flight", "order")
 
+    expandable_fields = {"flight": FlightListSerializer, "order": OrderListSerializer}
+
 
-class TicketDetailSerializer(serializers.ModelSerializer):
+class TicketSerializer(serializers.ModelSerializer):
+    flight = serializers.PrimaryKeyRelatedField(queryset=Flight.objects.select_related("airplane"))
+    order = serializers.PrimaryKeyRelatedField(queryset=Order.objects.all())
+
+    class Meta:
+        model = Ticket
+        fields = ("id", "row", "seat", "flight", "order")
+        # seat uniqueness is checked in validate() together with the seat range
+        validators = []
+
+    def validate(self, attrs):
+        values = {
+            field: attrs[field] if field in attrs else getattr(self.instance, field)
+            for field in ("flight", "row", "seat")
+        }
+        errors = Ticket.seat_errors(values["row"], values["seat"], values["flight"].airplane)
+        if errors:
+            raise serializers.ValidationError(errors)
+        taken = Ticket.objects.filter(flight=values["flight"], row=values["row"], seat=values["seat"])
+        if self.instance is not None:
+            taken = taken.exclude(pk=self.instance.pk)
+        if taken.exists():
+            raise serializers.ValidationError({"seat": "This seat is already taken."})
+        self.taken_seat = taken
+        return attrs
+
+    def save(self, **kwargs):
+        try:
+            with transaction.atomic():
+                return super().save(**kwargs)
+        except IntegrityError:
+            # a concurrent request took the seat after validation; anything else is not a seat conflict
+            if not self.taken_seat.exists():
+                raise
+            raise serializers.ValidationError({"seat": "This seat is already taken."})
+
+
+class TicketDetailSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
     flight = FlightDetailSerializer(read_only=False)
     order = OrderListSerializer(read_only=False)
 
@@ -88,17 +201,206 @@ class TicketDetailSerializer(serializers.ModelSerializer):
         fields = ("id", "row", "seat", "flight", "order")
 
 
-class CrewListSerializer(serializers.ModelSerializer):
+class TicketSeatSerializer(serializers.ModelSerializer):
+    flight = serializers.IntegerField(source="flight_id", min_value=1)
+
+    class Meta:
+        model = Ticket
+        fields = ("id", "row", "seat", "flight")
+        # seat uniqueness is left to the database constraint instead of a query per ticket
+        validators = []
+
+
+def taken_seats(tickets):
+    """Return the ``(flight_id, row, seat)`` of ``tickets`` that are already sold."""
+    return set(
+        Ticket.objects.filter(
+            flight_id__in={ticket["flight_id"] for ticket in tickets},
+            row__in={ticket["row"] for ticket in tickets},
+            seat__in={ticket["seat"] for ticket in tickets},
+        ).values_list("flight_id", "row", "seat")
+    )
+
+
+class OrderCreateSerializer(serializers.ModelSerializer):
+    tickets = TicketSeatSerializer(many=True, allow_empty=False)
+
+    class Meta:
+        model = Order
+        fields = ("id", "created_at", "tickets")
+
+    @staticmethod
+    def seat_taken_errors(tickets, taken):
+        """One error dict per ticket: seats in ``taken`` or requested twice in the order."""
+        errors = []
+        requested = {}
+        for position, ticket in enumerate(tickets):
+            seat = (ticket["flight_id"], ticket["row"], ticket["seat"])
+            if seat in taken:
+                errors.append({"seat": "This seat is already taken."})
+            elif seat in requested:
+                errors.append({"seat": f"This seat is also requested by ticket {requested[seat]}."})
+            else:
+                requested[seat] = position
+                errors.append({})
+        return errors
+
+    def validate_tickets(self, tickets):
+        flights = Flight.objects.select_related("airplane").in_bulk({ticket["flight_id"] for ticket in tickets})
+        errors = self.seat_taken_errors(tickets, taken_seats(tickets))
+        for ticket, ticket_errors in zip(tickets, errors):
+            flight = flights.get(ticket["flight_id"])
+            if flight is None:
+                ticket_errors["flight"] = f"Flight {ticket['flight_id']} does not exist."
+            else:
+                ticket_errors.update(Ticket.seat_errors(ticket["row"], ticket["seat"], flight.airplane))
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return tickets
+
+    def create(self, validated_data):
+        tickets_data = validated_data.pop("tickets")
+        try:
+            with transaction.atomic():
+                order = Order.objects.create(**validated_data)
+                tickets = Ticket.objects.bulk_create(
+                    [Ticket(order=order, **ticket_data) for ticket_data in tickets_data]
+                )
+                tickets_bulk_created.send(sender=Ticket, tickets=tickets)
+        except IntegrityError:
+            # a concurrent order took a seat after validation; anything else is not a seat conflict
+            errors = self.seat_taken_errors(tickets_data, taken_seats(tickets_data))
+            if not any(errors):
+                raise
+            raise serializers.ValidationError({"tickets": errors})
+        return order
+
+
+class TicketFlightSerializer(serializers.ModelSerializer):
+    route = RouteDetailSerializer(read_only=True)
+
+    class Meta:
+        model = Flight
+        fields = ("id", "route", "departure_time", "arrival_time")
+
+
+class TicketHistorySerializer(serializers.ModelSerializer):
+    flight = TicketFlightSerializer(read_only=True)
+
+    class Meta:
+        model = Ticket
+        fields = ("id", "row", "seat", "flight")
+
+
+class OrderHistorySerializer(serializers.ModelSerializer):
+    tickets = TicketHistorySerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Order
+        fields = ("id", "created_at", "tickets")
+
+
+class RouteOccupancySerializer(serializers.ModelSerializer):
+    route = serializers.IntegerField(source="route_id", read_only=True)
+    load_factor = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = RouteDailyOccupancy
+        fields = ("route", "date", "flights", "capacity", "tickets_sold", "load_factor")
+
+
+class PictureVariantsField(serializers.Field):
+    """URLs of the resized copies of a crew picture, ``{variant: {format: url}}``; empty until they are generated."""
+
+    def __init__(self, **kwargs):
+        kwargs["read_only"] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        storage = Crew._meta.get_field("picture_member").storage
+        request = self.context.get("request")
+        return {
+            variant: {
+                extension: request.build_absolute_uri(storage.url(name)) if request else storage.url(name)
+                for extension, name in formats.items()
+            }
+            for variant, formats in value.get("files", {}).items()
+        }
+
+
+class CrewListSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
     flight = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+    picture_variants = PictureVariantsField()
 
     class Meta:
         model = Crew
-        fields = ("id", "first_name", "last_name", "flight", 'picture_member')
+        fields = ("id", "first_name", "last_name", "flight", 'picture_member', "picture_variants")
+
+    expandable_fields = {"flight": FlightListSerializer}
 
 
-class CrewDetailSerializer(serializers.ModelSerializer):
+class CrewSerializer(CrewListSerializer):
+    flight = serializers.PrimaryKeyRelatedField(many=True, queryset=Flight.objects.all(), required=False)
+
+    def validate(self, attrs):
+        if "flight" in attrs:
+            validate_crew_schedule(attrs["flight"], serializers.ValidationError)
+        return attrs
+
+
+class CrewDetailSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
     flight = FlightDetailSerializer(read_only=False, many=True)
+    picture_variants = PictureVariantsField()
 
     class Meta:
         model = Crew
-        fields = ("id", "first_name", "last_name", "flight", "picture_member")
+        fields = ("id", "first_name", "last_name", "flight", "picture_member", "picture_variants")
+
+
+class SeatMapSerializer(serializers.Serializer):
+    flight = serializers.IntegerField(source="flight_id")
+    rows = serializers.IntegerField()
+    seats_in_row = serializers.IntegerField()
+    capacity = serializers.IntegerField()
+    taken = serializers.IntegerField(source="taken_count")
+    available = serializers.IntegerField(source="available_count")
+    bitmap = serializers.CharField(source="to_base64")
+    seats = serializers.ListField(source="grid", child=serializers.ListField(child=serializers.BooleanField()))
+
+
+class ItineraryLegSerializer(serializers.ModelSerializer):
+    source = serializers.IntegerField(source="route.source_id")
+    destination = serializers.IntegerField(source="route.destination_id")
+
+    class Meta:
+        model = Flight
+        fields = ("id", "route", "airplane", "source", "destination", "departure_time", "arrival_time")
+
+
+class ItinerarySerializer(serializers.Serializer):
+    legs = ItineraryLegSerializer(many=True)
+    distance = serializers.IntegerField()
+    departure_time = serializers.DateTimeField()
+    arrival_time = serializers.DateTimeField()
+    duration = serializers.DurationField()
+
+
+class ScheduleImportErrorSerializer(serializers.Serializer):
+    line = serializers.IntegerField()
+    errors = serializers.DictField(child=serializers.CharField())
+
+
+class ScheduleImportSerializer(serializers.Serializer):
+    file = serializers.FileField(write_only=True)
+    format = serializers.ChoiceField(choices=("csv", "ndjson"), required=False, write_only=True)
+    created = serializers.IntegerField(read_only=True)
+    errors = ScheduleImportErrorSerializer(many=True, read_only=True)
+
+
+class ScheduleConflictSerializer(serializers.Serializer):
+    kind = serializers.ChoiceField(choices=CONFLICT_KINDS)
+    resource = serializers.IntegerField(help_text="Airplane or crew member id, depending on kind")
+    flight = serializers.IntegerField()
+    conflicting_flight = serializers.IntegerField()
+    overlap_start = serializers.DateTimeField()
+    overlap_end = serializers.DateTimeField()
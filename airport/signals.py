@@ -0,0 +1,241 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import Signal, receiver
+
+from airport import occupancy, search_index
+from airport.autocomplete import autocomplete_index
+from airport.geo import airport_grid
+from airport.itinerary import route_graph
+from airport.models import Airplane, AirplaneType, Airport, Crew, Flight, FlightSearchIndex, Route, Ticket
+from airport.response_cache import invalidate_reference_cache
+from airport.seat_map import invalidate_seat_map
+from airport.thumbnails import clear_variants, delete_variant_files, has_picture, schedule_variants
+
+# bulk_create() and COPY do not send post_save, so bulk writers send these with the created rows instead;
+# flights written with COPY have no id
+tickets_bulk_created = Signal()
+flights_bulk_created = Signal()
+# batch writes: updated rows with {id: row as it was before}, deleted rows with the tickets sold per deleted flight
+flights_bulk_updated = Signal()
+flights_bulk_deleted = Signal()
+tickets_bulk_updated = Signal()
+tickets_bulk_deleted = Signal()
+
+
+@receiver(post_save, sender=Ticket)
+def invalidate_seat_map_on_ticket_save(sender, instance, created, **kwargs):
+    # a ticket moved to another flight frees its seat on the previous one
+    for flight_id in {instance.flight_id, getattr(instance, "_previous_flight_id", None)} - {None}:
+        transaction.on_commit(partial(invalidate_seat_map, flight_id))
+
+
+@receiver(tickets_bulk_created, sender=Ticket)
+def invalidate_seat_map_on_tickets_bulk_created(sender, tickets, **kwargs):
+    for flight_id in {ticket.flight_id for ticket in tickets}:
+        transaction.on_commit(partial(invalidate_seat_map, flight_id))
+
+
+@receiver(post_delete, sender=Ticket)
+def invalidate_seat_map_on_ticket_delete(sender, instance, **kwargs):
+    transaction.on_commit(partial(invalidate_seat_map, instance.flight_id))
+
+
+@receiver(post_save, sender=Flight)
+def invalidate_seat_map_on_flight_save(sender, instance, created, **kwargs):
+    if not created:
+        transaction.on_commit(partial(invalidate_seat_map, instance.id))
+
+
+@receiver(post_delete, sender=Flight)
+def invalidate_seat_map_on_flight_delete(sender, instance, **kwargs):
+    transaction.on_commit(partial(invalidate_seat_map, instance.id))
+
+
+@receiver(post_save, sender=Route)
+@receiver(post_delete, sender=Route)
+def invalidate_route_graph(sender, **kwargs):
+    transaction.on_commit(route_graph.invalidate)
+
+
+@receiver(post_save, sender=Airport)
+@receiver(post_delete, sender=Airport)
+def invalidate_airport_indexes(sender, **kwargs):
+    transaction.on_commit(airport_grid.invalidate)
+    transaction.on_commit(autocomplete_index.invalidate)
+
+
+@receiver(post_save, sender=Airport)
+@receiver(post_delete, sender=Airport)
+@receiver(post_save, sender=AirplaneType)
+@receiver(post_delete, sender=AirplaneType)
+@receiver(post_save, sender=Airplane)
+@receiver(post_delete, sender=Airplane)
+@receiver(post_save, sender=Route)
+@receiver(post_delete, sender=Route)
+def invalidate_reference_responses(sender, **kwargs):
+    transaction.on_commit(partial(invalidate_reference_cache, sender))
+
+
+@receiver(post_save, sender=Crew)
+def generate_picture_variants_on_crew_save(sender, instance, **kwargs):
+    if not has_picture(instance):
+        # the variants of a removed picture are deleted; a replaced one's once the new variants exist
+        if instance.picture_variants:
+            transaction.on_commit(partial(clear_variants, instance.pk))
+    elif instance.picture_variants.get("source") != instance.picture_member.name:
+        transaction.on_commit(partial(schedule_variants, instance.pk))
+
+
+@receiver(post_delete, sender=Crew)
+def delete_picture_variants_on_crew_delete(sender, instance, **kwargs):
+    if instance.picture_variants:
+        transaction.on_commit(partial(delete_variant_files, instance.picture_variants))
+
+
+# route/day occupancy is updated in the same transaction as the tickets and flights it counts
+@receiver(pre_save, sender=Ticket)
+def remember_ticket_flight(sender, instance, raw=False, **kwargs):
+    if not raw:
+        occupancy.remember_previous_ticket(instance)
+
+
+@receiver(post_save, sender=Ticket)
+def update_occupancy_on_ticket_save(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        occupancy.record_ticket_save(instance, created)
+
+
+@receiver(tickets_bulk_created, sender=Ticket)
+def update_occupancy_on_tickets_bulk_created(sender, tickets, **kwargs):
+    occupancy.record_tickets(tickets)
+
+
+@receiver(post_delete, sender=Ticket)
+def update_occupancy_on_ticket_delete(sender, instance, **kwargs):
+    occupancy.record_tickets([instance], -1)
+
+
+@receiver(pre_save, sender=Flight)
+def remember_flight_schedule(sender, instance, raw=False, **kwargs):
+    if not raw:
+        occupancy.remember_previous_flight(instance)
+
+
+@receiver(post_save, sender=Flight)
+def update_occupancy_on_flight_save(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        occupancy.record_flight_save(instance, created)
+
+
+@receiver(flights_bulk_created, sender=Flight)
+def update_occupancy_on_flights_bulk_created(sender, flights, **kwargs):
+    occupancy.record_flights(flights)
+
+
+@receiver(pre_delete, sender=Flight)
+def update_occupancy_on_flight_delete(sender, instance, **kwargs):
+    occupancy.start_flight_delete(instance)
+
+
+@receiver(post_delete, sender=Flight)
+def finish_occupancy_flight_delete(sender, instance, **kwargs):
+    occupancy.finish_flight_delete(instance)
+
+
+@receiver(pre_save, sender=Airplane)
+def remember_airplane_capacity(sender, instance, raw=False, **kwargs):
+    if not raw:
+        occupancy.remember_previous_airplane(instance)
+
+
+@receiver(post_save, sender=Airplane)
+def update_occupancy_on_airplane_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        occupancy.record_airplane_save(instance)
+
+
+# the flight search index is updated in the same transaction as the rows it copies
+@receiver(post_save, sender=Flight)
+def index_flight_on_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search_index.index_flights(Flight.objects.filter(pk=instance.pk))
+
+
+@receiver(flights_bulk_created, sender=Flight)
+def index_flights_on_bulk_created(sender, flights, **kwargs):
+    search_index.index_bulk_created_flights(flights)
+
+
+@receiver(post_save, sender=Ticket)
+def update_search_index_on_ticket_save(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        search_index.record_ticket_save(instance, created)
+
+
+@receiver(tickets_bulk_created, sender=Ticket)
+def update_search_index_on_tickets_bulk_created(sender, tickets, **kwargs):
+    search_index.record_tickets(tickets)
+
+
+@receiver(post_delete, sender=Ticket)
+def update_search_index_on_ticket_delete(sender, instance, **kwargs):
+    search_index.record_tickets([instance], -1)
+
+
+@receiver(post_save, sender=Airport)
+def update_search_index_on_airport_save(sender, instance, created, raw=False, **kwargs):
+    if not raw and not created:
+        search_index.update_airport(instance)
+
+
+@receiver(post_save, sender=Route)
+def update_search_index_on_route_save(sender, instance, created, raw=False, **kwargs):
+    if not raw and not created:
+        search_index.update_route(instance)
+
+
+@receiver(post_save, sender=Airplane)
+def update_search_index_on_airplane_save(sender, instance, created, raw=False, **kwargs):
+    if not raw and not created:
+        search_index.update_airplane(instance)
+
+
+@receiver(post_save, sender=AirplaneType)
+def update_search_index_on_airplane_type_save(sender, instance, created, raw=False, **kwargs):
+    if not raw and not created:
+        search_index.update_airplane_type(instance)
+
+
+@receiver(flights_bulk_updated, sender=Flight)
+def update_derived_data_on_flights_bulk_updated(sender, flights, previous, **kwargs):
+    occupancy.record_flight_moves(flights, previous)
+    search_index.index_flights(Flight.objects.filter(id__in=[flight.id for flight in flights]))
+    for flight in flights:
+        transaction.on_commit(partial(invalidate_seat_map, flight.id))
+
+
+@receiver(flights_bulk_deleted, sender=Flight)
+def update_derived_data_on_flights_bulk_deleted(sender, flights, tickets_sold, **kwargs):
+    occupancy.record_flights(flights, -1, tickets_sold)
+    FlightSearchIndex.objects.filter(flight_id__in=[flight.id for flight in flights]).delete()
+    for flight in flights:
+        transaction.on_commit(partial(invalidate_seat_map, flight.id))
+
+
+@receiver(tickets_bulk_updated, sender=Ticket)
+def update_derived_data_on_tickets_bulk_updated(sender, tickets, previous, **kwargs):
+    previous_flight_ids = {ticket_id: ticket.flight_id for ticket_id, ticket in previous.items()}
+    occupancy.record_ticket_moves(tickets, previous_flight_ids)
+    search_index.record_ticket_moves(tickets, previous_flight_ids)
+    for flight_id in {ticket.flight_id for ticket in tickets} | set(previous_flight_ids.values()):
+        transaction.on_commit(partial(invalidate_seat_map, flight_id))
+
+
+@receiver(tickets_bulk_deleted, sender=Ticket)
+def update_derived_data_on_tickets_bulk_deleted(sender, tickets, **kwargs):
+    occupancy.record_tickets(tickets, -1)
+    search_index.record_tickets(tickets, -1)
+    for flight_id in {ticket.flight_id for ticket in tickets}:
+        transaction.on_commit(partial(invalidate_seat_map, flight_id))
@@ -0,0 +1,46 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryBudgetMixin:
+    """Asserts that a request runs the same number of SQL queries for a small and a larger data set.
+
+    Test cases override ``seed(size)`` to add ``size`` more of their rows
+    and return what ``build_request`` receives.
+    """
+
+    small_size = 1
+    large_size = 4
+
+    def seed(self, size):
+        """Override to create data; adds nothing by default."""
+        return None
+
+    def count_queries(self, method, path, data=None):
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(self.client, method)(path, data, format="json")
+            if response.streaming:
+                b"".join(response.streaming_content)
+        self.assertLess(response.status_code, 400, f"{method.upper()} {path}: {response.status_code}")
+        return response, [query["sql"] for query in context.captured_queries]
+
+    def assertConstantQueries(self, method, build_request):
+        """Seed both data set sizes in turn and compare the queries of the request built for each.
+
+        ``build_request`` receives the result of ``seed()`` and returns a path
+        or a ``(path, data)`` pair.
+        """
+        counts = []
+        for size in (self.small_size, self.large_size):
+            request = build_request(self.seed(size))
+            path, data = request if isinstance(request, tuple) else (request, None)
+            counts.append(self.count_queries(method, path, data)[1])
+        small, large = counts
+        if len(small) != len(large):
+            self.fail(
+                f"{method.upper()} {path} ran {len(small)} queries with the small data set "
+                f"and {len(large)} with the large one:\n"
+                + "\n".join(f"{number}. {sql}" for number, sql in enumerate(large, start=1))
+            )
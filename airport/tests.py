@@ -1,3 +1,1460 @@
-from django.test import TestCase
+import base64
+import datetime
+import io
+import json
+import re
+import shutil
+import tempfile
+import threading
+from concurrent.futures import Future
+from unittest import mock, skipUnless
+from urllib.parse import urlencode
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from airport.models import (Airport, Route, AirplaneType, Airplane, Order, Ticket, Flight, Crew, RouteDailyOccupancy,
+                            FlightSearchIndex, IdempotencyKey)
+from airport.geo import update_route_distances
+from airport.idempotency import sweep_expired_keys
+from airport.itinerary import find_itineraries
+from airport.occupancy import apply_deltas, occupancy_totals
+from airport.schedule_import import ScheduleImporter
+from airport.search_index import check_index
+from airport.seat_map import SeatMap, seat_map_cache_key, seat_map_version_key
+from airport.serializers import (AirplaneTypeSerializer, AirportSerializer, FlightListSerializer, RouteListSerializer,
+                                 TicketListSerializer)
+from airport.testing import QueryBudgetMixin
+from airport.thumbnails import PICTURE_VARIANTS, generate_variants, schedule_variants
+from airport_service.metrics import registry
+from user.models import User
+
+
+class AirportDataFactory:
+    """Builds a connected set of airport data; every call adds ``size`` more of each kind of row."""
+
+    def __init__(self, user):
+        self.user = user
+        self.counter = 0
+        self.start = timezone.now().replace(microsecond=0) + datetime.timedelta(days=1)
+
+    def seed(self, size):
+        flights = []
+        for _ in range(size):
+            self.counter += 1
+            source = Airport.objects.create(name=f"Airport {self.counter}a", closest_big_city=f"City {self.counter}a")
+            destination = Airport.objects.create(
+                name=f"Airport {self.counter}b", closest_big_city=f"City {self.counter}b"
+            )
+            route = Route.objects.create(source=source, destination=destination, distance=100 * self.counter)
+            airplane_type = AirplaneType.objects.create(name=f"Type {self.counter}")
+            airplane = Airplane.objects.create(
+                name=f"Airplane {self.counter}", rows=10, seats_in_row=6, airplane_type=airplane_type
+            )
+            departure_time = self.start + datetime.timedelta(hours=self.counter)
+            flight = Flight.objects.create(
+                route=route,
+                airplane=airplane,
+                departure_time=departure_time,
+                arrival_time=departure_time + datetime.timedelta(hours=2),
+            )
+            flights.append(flight)
+            order = Order.objects.create(user=self.user)
+            for seat in range(1, 4):
+                Ticket.objects.create(row=1, seat=seat, flight=flight, order=order)
+            crew = Crew.objects.create(first_name=f"Name {self.counter}", last_name="Crew")
+            crew.flight.set(Flight.objects.all())
+        return flights
+
+
+class SeatMapTestCase(APITestCase):
+    """The cached seat map follows bookings and cancellations."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("user@airport.com", "password", is_staff=True)
+        self.client.force_authenticate(self.user)
+        self.flight = AirportDataFactory(self.user).seed(1)[0]
+
+    def taken_seats(self):
+        response = self.client.get(f"/airport/flights/{self.flight.id}/seats/")
+        self.assertEqual(response.status_code, 200)
+        return {
+            (row, seat)
+            for row, seats in enumerate(response.data["seats"], start=1)
+            for seat, taken in enumerate(seats, start=1)
+            if taken
+        }
+
+    def test_booking_and_cancellation(self):
+        self.assertEqual(self.taken_seats(), {(1, 1), (1, 2), (1, 3)})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                "/airport/orders/", {"tickets": [{"flight": self.flight.id, "row": 4, "seat": 5}]}, format="json"
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.taken_seats(), {(1, 1), (1, 2), (1, 3), (4, 5)})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete(f"/airport/orders/{response.data['id']}/").status_code, 204)
+        self.assertEqual(self.taken_seats(), {(1, 1), (1, 2), (1, 3)})
+
+    def test_map_built_before_a_write_is_not_served_after_it(self):
+        self.taken_seats()
+        # a reader loads the tickets and its version, then a booking commits before the reader stores its map
+        version = cache.get(seat_map_version_key(self.flight.id))
+        stale = SeatMap.for_flight(self.flight)
+        with self.captureOnCommitCallbacks(execute=True):
+            Ticket.objects.create(row=2, seat=2, flight=self.flight, order=Order.objects.first())
+        cache.set(seat_map_cache_key(self.flight.id, version), stale)
+        self.assertIn((2, 2), self.taken_seats())
+
+
+class OrderCreateTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("user@airport.com", "password")
+        self.client.force_authenticate(self.user)
+        self.flight = AirportDataFactory(self.user).seed(1)[0]
+
+    def order(self, *seats):
+        return self.client.post(
+            "/airport/orders/",
+            {"tickets": [{"flight": self.flight.id, "row": row, "seat": seat} for row, seat in seats]},
+            format="json",
+        )
+
+    def test_seat_already_sold(self):
+        response = self.order((2, 1), (1, 1))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["tickets"], [{}, {"seat": "This seat is already taken."}])
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_seat_sold_by_a_concurrent_order(self):
+        # the seat is free when the order is validated and taken when it is written
+        with mock.patch("airport.serializers.taken_seats", side_effect=[set(), {(self.flight.id, 1, 1)}]):
+            response = self.order((1, 1))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["tickets"], [{"seat": "This seat is already taken."}])
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_same_seat_twice_in_one_order(self):
+        response = self.order((2, 1), (2, 1))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["tickets"], [{}, {"seat": "This seat is also requested by ticket 0."}])
+
+    def test_seat_outside_of_the_airplane(self):
+        response = self.order((11, 1), (1, 7), (0, 1))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.data["tickets"],
+            [
+                {"row": "row must be in range [1, 10], not 11"},
+                {"seat": "seat must be in range [1, 6], not 7"},
+                {"row": "row must be in range [1, 10], not 0"},
+            ],
+        )
+
+    def test_order_created(self):
+        response = self.order((2, 1), (2, 2))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            set(Ticket.objects.filter(order_id=response.data["id"]).values_list("row", "seat")), {(2, 1), (2, 2)}
+        )
+
+
+class FlightSearchTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("user@airport.com", "password")
+        self.client.force_authenticate(self.user)
+        self.flights = AirportDataFactory(self.user).seed(3)
+        departures = ("2030-01-01T00:00:00Z", "2030-01-01T23:30:00Z", "2030-01-02T00:00:00Z")
+        for flight, departure in zip(self.flights, departures):
+            flight.departure_time = datetime.datetime.fromisoformat(departure)
+            flight.arrival_time = flight.departure_time + datetime.timedelta(hours=2)
+            flight.save()
+
+    def search(self, query):
+        response = self.client.get(f"/airport/flights/?{query}")
+        self.assertEqual(response.status_code, 200, response.data)
+        return [flight["id"] for flight in response.data["results"]]
+
+    def test_date_bounds(self):
+        first, second, third = (flight.id for flight in self.flights)
+        # a date-only departure_before includes the whole day
+        self.assertEqual(self.search("departure_before=2030-01-01"), [first, second])
+        self.assertEqual(self.search("departure_after=2030-01-02"), [third])
+        self.assertEqual(self.search("departure_after=2030-01-01T12:00:00Z&departure_before=2030-01-01"), [second])
+        self.assertEqual(self.search("departure_before=2030-01-01T23:30:00Z"), [first])
+
+    def test_airport_and_city_filters(self):
+        flight = self.flights[1]
+        self.assertEqual(self.search(f"source={flight.route.source_id}"), [flight.id])
+        self.assertEqual(
+            self.search(f"source={flight.route.source_id}&destination={flight.route.destination_id}"), [flight.id]
+        )
+        other_destination = self.flights[0].route.destination_id
+        self.assertEqual(self.search(f"source={flight.route.source_id}&destination={other_destination}"), [])
+        self.assertEqual(self.search("source_city=CITY 2A"), [flight.id])
+        self.assertEqual(self.search("destination_city=city 3b"), [self.flights[2].id])
+
+    def test_invalid_parameters(self):
+        for name, value in (
+            ("source", "abc"),
+            ("destination", "1.5"),
+            ("departure_after", "tomorrow"),
+            ("departure_before", "2030-02-30"),
+        ):
+            with self.subTest(name):
+                response = self.client.get("/airport/flights/", {name: value})
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(list(response.data), [name])
+
+
+class ItineraryTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.start = timezone.now().replace(microsecond=0) + datetime.timedelta(days=1)
+        self.airports = {name: Airport.objects.create(name=name, closest_big_city=name) for name in "ABCD"}
+        airplane_type = AirplaneType.objects.create(name="Type")
+        self.airplane = Airplane.objects.create(name="Airplane", rows=10, seats_in_row=6, airplane_type=airplane_type)
+        self.routes = {
+            (source, destination): Route.objects.create(
+                source=self.airports[source], destination=self.airports[destination], distance=distance
+            )
+            for source, destination, distance in (
+                ("A", "B", 100), ("B", "D", 100), ("A", "C", 300), ("C", "D", 300), ("A", "D", 1000)
+            )
+        }
+
+    def flight(self, source, destination, departure_hours, duration_hours):
+        departure_time = self.start + datetime.timedelta(hours=departure_hours)
+        return Flight.objects.create(
+            route=self.routes[(source, destination)],
+            airplane=self.airplane,
+            departure_time=departure_time,
+            arrival_time=departure_time + datetime.timedelta(hours=duration_hours),
+        )
+
+    def search(self, **kwargs):
+        itineraries = find_itineraries(
+            self.airports["A"].id,
+            self.airports["D"].id,
+            self.start,
+            self.start + datetime.timedelta(hours=1),
+            **kwargs,
+        )
+        return [[leg.id for leg in itinerary.legs] for itinerary in itineraries]
+
+    def test_connection_window(self):
+        first = self.flight("A", "B", 0, 2)
+        self.flight("B", "D", 2.5, 2)  # 30 minutes after the arrival
+        connection = self.flight("B", "D", 3, 2)
+        self.flight("B", "D", 27, 2)  # 25 hours after the arrival
+        self.assertEqual(self.search(), [[first.id, connection.id]])
+        self.assertEqual(len(self.search(min_connection=datetime.timedelta(minutes=15))), 2)
+        self.assertEqual(self.search(max_connection=datetime.timedelta(minutes=30)), [])
+
+    def test_sort_order(self):
+        short = [self.flight("A", "B", 0, 2).id, self.flight("B", "D", 3, 2).id]
+        fast = [self.flight("A", "C", 0, 1).id, self.flight("C", "D", 2, 1).id]
+        direct = [self.flight("A", "D", 0, 10).id]
+        self.assertEqual(self.search(), [short, fast, direct])
+        self.assertEqual(self.search(sort="duration"), [fast, short, direct])
+        self.assertEqual(self.search(sort="duration", limit=1), [fast])
+        self.assertEqual(self.search(max_legs=1), [direct])
+
+    def test_departure_window(self):
+        self.flight("A", "D", -1, 10)
+        self.flight("A", "D", 1, 10)
+        on_time = self.flight("A", "D", 0.5, 10)
+        self.assertEqual(self.search(), [[on_time.id]])
+
+
+class CursorPaginationTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("user@airport.com", "password")
+        self.client.force_authenticate(self.user)
+        self.factory = AirportDataFactory(self.user)
+        self.flights = self.factory.seed(5)
+        # flights sharing a departure time are ordered by id
+        for flight in self.flights[2:4]:
+            flight.departure_time = self.flights[1].departure_time
+            flight.save()
+
+    def pages(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids.append([flight["id"] for flight in response.data["results"]])
+            url = response.data["next"]
+        return ids
+
+    def test_pages(self):
+        ids = [flight.id for flight in self.flights]
+        self.assertEqual(self.pages("/airport/flights/?page_size=2"), [ids[0:2], ids[2:4], ids[4:]])
+
+        response = self.client.get("/airport/flights/?page_size=2")
+        response = self.client.get(response.data["next"])
+        response = self.client.get(response.data["next"])
+        previous = self.client.get(response.data["previous"])
+        self.assertEqual([flight["id"] for flight in previous.data["results"]], ids[2:4])
+
+    def test_rows_added_before_the_cursor(self):
+        response = self.client.get("/airport/flights/?page_size=2")
+        earlier = self.factory.seed(1)[0]
+        earlier.departure_time = self.flights[0].departure_time + datetime.timedelta(minutes=30)
+        earlier.save()
+        response = self.client.get(response.data["next"])
+        self.assertEqual(
+            [flight["id"] for flight in response.data["results"]], [self.flights[2].id, self.flights[3].id]
+        )
+
+    def test_invalid_cursor(self):
+        for position in ('["x","1"]', '["1"]', "1"):
+            cursor = base64.b64encode(urlencode({"p": position}).encode()).decode()
+            self.assertEqual(self.client.get(f"/airport/flights/?cursor={cursor}").status_code, 404)
+
+    def test_offset_pagination_for_staff(self):
+        response = self.client.get("/airport/flights/?offset=1&limit=2")
+        self.assertNotIn("count", response.data)
+
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get("/airport/flights/?offset=1&limit=2")
+        self.assertEqual(response.data["count"], 5)
+        self.assertEqual(
+            [flight["id"] for flight in response.data["results"]], [self.flights[1].id, self.flights[2].id]
+        )
+
+
+class ReferenceCacheTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("user@airport.com", "password", is_staff=True)
+        self.client.force_authenticate(self.user)
+        self.route = AirportDataFactory(self.user).seed(1)[0].route
+
+    def test_etag(self):
+        response = self.client.get("/airport/airports/")
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers["ETag"]
+
+        response = self.client.get("/airport/airports/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers["ETag"], etag)
+        self.assertEqual(self.client.get("/airport/airports/", HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_invalidated_on_write(self):
+        etag = self.client.get("/airport/airports/").headers["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post("/airport/airports/", {"name": "New", "closest_big_city": "City"})
+        self.assertEqual(response.status_code, 201)
+
+        response = self.client.get("/airport/airports/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
+        self.assertIn("New", [airport["name"] for airport in response.data["results"]])
+
+    def test_invalidated_by_a_related_model(self):
+        path = f"/airport/routes/{self.route.id}/"
+        etag = self.client.get(path).headers["ETag"]
+        source = self.route.source
+        source.name = "Renamed"
+        with self.captureOnCommitCallbacks(execute=True):
+            source.save()
+
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["source"]["name"], "Renamed")
+
+
+class FlightOccupancyTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("user@airport.com", "password")
+        self.client.force_authenticate(self.user)
+        self.flights = AirportDataFactory(self.user).seed(2)
+        Ticket.objects.create(row=2, seat=1, flight=self.flights[0], order=Order.objects.first())
+        self.sold = {self.flights[0].id: 4, self.flights[1].id: 3}
+
+    def assertOccupancy(self, flights):
+        self.assertTrue(flights)
+        for flight in flights:
+            self.assertEqual(flight["capacity"], 60)
+            self.assertEqual(flight["tickets_sold"], self.sold[flight["id"]])
+            self.assertEqual(flight["tickets_available"], 60 - self.sold[flight["id"]])
+            self.assertAlmostEqual(flight["load_factor"], self.sold[flight["id"]] / 60)
+
+    def test_flights(self):
+        self.assertOccupancy(self.client.get("/airport/flights/").data["results"])
+        self.assertOccupancy(self.client.get("/airport/flights/?expand=route").data["results"])
+        self.assertOccupancy([self.client.get(f"/airport/flights/{self.flights[0].id}/").data])
+
+    def test_nested_flights(self):
+        ticket = Ticket.objects.filter(flight=self.flights[1]).first()
+        self.assertOccupancy([self.client.get(f"/airport/tickets/{ticket.id}/").data["flight"]])
+        response = self.client.get("/airport/tickets/?expand=flight")
+        self.assertOccupancy([ticket["flight"] for ticket in response.data["results"]])
+
+        crew = Crew.objects.last()
+        self.assertOccupancy(self.client.get(f"/airport/crews/{crew.id}/").data["flight"])
+        response = self.client.get("/airport/crews/?expand=flight")
+        self.assertOccupancy([flight for crew in response.data["results"] for flight in crew["flight"]])
+
+
+class OrderHistoryTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("user@airport.com", "password")
+        self.other_user = User.objects.create_user("other@airport.com", "password")
+        AirportDataFactory(self.user).seed(2)
+        AirportDataFactory(self.other_user).seed(1)
+        self.client.force_authenticate(self.user)
+
+    def test_own_orders_only(self):
+        response = self.client.get("/airport/orders/history/")
+        self.assertCountEqual(
+            [order["id"] for order in response.data["results"]],
+            Order.objects.filter(user=self.user).values_list("id", flat=True),
+        )
+        response = self.client.get("/airport/orders/")
+        self.assertEqual([order["customer"] for order in response.data["results"]], [self.user.email] * 2)
+
+        other_order = Order.objects.get(user=self.other_user)
+        self.assertEqual(self.client.get(f"/airport/orders/{other_order.id}/").status_code, 404)
+
+    def test_nested_tickets(self):
+        response = self.client.get("/airport/orders/history/")
+        for order in response.data["results"]:
+            tickets = Ticket.objects.filter(order_id=order["id"]).order_by("id")
+            self.assertEqual([ticket["id"] for ticket in order["tickets"]], [ticket.id for ticket in tickets])
+
+
+class QueryBudgetTestCase(QueryBudgetMixin, APITestCase):
+    """Endpoints run the same number of SQL queries for a small and a larger data set."""
+
+    def setUp(self):
+        self.user = User.objects.create_user("user@airport.com", "password", is_staff=True)
+        self.client.force_authenticate(self.user)
+        self.factory = AirportDataFactory(self.user)
+
+    def seed(self, size):
+        return self.factory.seed(size)
+
+    def test_list_endpoints(self):
+        for prefix in ("airports", "routes", "airplane_types", "airplanes", "orders", "tickets", "flights", "crews"):
+            with self.subTest(prefix):
+                self.assertConstantQueries("get", lambda flights: f"/airport/{prefix}/")
+
+    def test_retrieve_endpoints(self):
+        lookups = {
+            "airports": lambda flight: flight.route.source_id,
+            "routes": lambda flight: flight.route_id,
+            "airplane_types": lambda flight: flight.airplane.airplane_type_id,
+            "airplanes": lambda flight: flight.airplane_id,
+            "orders": lambda flight: flight.tickets.first().order_id,
+            "tickets": lambda flight: flight.tickets.first().id,
+            "flights": lambda flight: flight.id,
+            "crews": lambda flight: Crew.objects.order_by("-id").first().id,
+        }
+        for prefix, lookup in lookups.items():
+            with self.subTest(prefix):
+                self.assertConstantQueries("get", lambda flights: f"/airport/{prefix}/{lookup(flights[-1])}/")
+
+    def test_expanded_endpoints(self):
+        paths = {
+            "flights": "/airport/flights/?expand=route.source,airplane.airplane_type",
+            "tickets": "/airport/tickets/?expand=flight.route,order",
+            "crews": "/airport/crews/?expand=flight.route&fields=id,flight.route",
+            "routes": "/airport/routes/?expand=source,destination&fields=id,source.name,destination.name",
+        }
+        for name, path in paths.items():
+            with self.subTest(name):
+                self.assertConstantQueries("get", lambda flights: path)
+
+    def test_order_history(self):
+        self.assertConstantQueries("get", lambda flights: "/airport/orders/history/")
+
+    def test_order_create(self):
+        self.assertConstantQueries(
+            "post",
+            lambda flights: (
+                "/airport/orders/",
+                {"tickets": [{"flight": flight.id, "row": 5, "seat": 1} for flight in flights]},
+            ),
+        )
+
+    def test_seat_map(self):
+        self.assertConstantQueries("get", lambda flights: f"/airport/flights/{flights[-1].id}/seats/")
+
+    def test_itineraries(self):
+        self.assertConstantQueries(
+            "get",
+            lambda flights: (
+                f"/airport/itineraries/?source={flights[-1].route.source_id}"
+                f"&destination={flights[-1].route.destination_id}&departure_before=2100-01-01"
+            ),
+        )
+
+    def test_exports(self):
+        for kind in ("tickets", "orders", "flights"):
+            for output_format in ("ndjson", "csv"):
+                with self.subTest(f"{kind}.{output_format}"):
+                    self.assertConstantQueries("get", lambda flights: f"/airport/exports/{kind}.{output_format}")
+
+    def test_route_occupancy_report(self):
+        self.assertConstantQueries("get", lambda flights: "/airport/reports/route-occupancy/")
+
+    def test_async_flight_endpoints(self):
+        # the async views authenticate the JWT themselves, force_authenticate() does not reach them
+        self.client.force_authenticate(None)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+        paths = {
+            "list": lambda flights: "/airport/async/flights/?page_size=2",
+            "detail": lambda flights: f"/airport/async/flights/{flights[-1].id}/",
+            "seats": lambda flights: f"/airport/async/flights/{flights[-1].id}/seats/",
+        }
+        for name, build_request in paths.items():
+            with self.subTest(name):
+                self.assertConstantQueries("get", build_request)
+
+
+class TicketWriteTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("user@airport.com", "password", is_staff=True)
+        self.client.force_authenticate(self.user)
+        self.flight = AirportDataFactory(self.user).seed(1)[0]
+        self.ticket = self.flight.tickets.order_by("id").first()
+
+    def ticket_data(self, **values):
+        return {"flight": self.flight.id, "order": self.ticket.order_id, "row": 5, "seat": 1, **values}
+
+    def test_create(self):
+        response = self.client.post("/airport/tickets/", self.ticket_data(), format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["flight"], self.flight.id)
+
+        response = self.client.post("/airport/tickets/", self.ticket_data(row=999, seat=999), format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.data), {"row", "seat"})
+        response = self.client.post("/airport/tickets/", self.ticket_data(), format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["seat"], ["This seat is already taken."])
+        response = self.client.post("/airport/tickets/", self.ticket_data(flight=0, order=0), format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.data), {"flight", "order"})
+
+    def test_update(self):
+        path = f"/airport/tickets/{self.ticket.id}/"
+        self.assertEqual(self.client.patch(path, {"seat": self.ticket.seat}, format="json").status_code, 200)
+        self.assertEqual(self.client.patch(path, {"seat": self.ticket.seat + 1}, format="json").status_code, 400)
+        self.assertEqual(self.client.patch(path, {"row": 11}, format="json").status_code, 400)
+        response = self.client.patch(path, {"row": 10}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["row"], 10)
+
+
+class ScheduleImportTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("user@airport.com", "password", is_staff=True)
+        self.client.force_authenticate(self.user)
+        self.flight = AirportDataFactory(self.user).seed(1)[0]
+        self.start = self.flight.departure_time
+
+    def moment(self, hours):
+        return (self.start + datetime.timedelta(hours=hours)).isoformat()
+
+    def upload(self, name, content, **data):
+        return self.client.post(
+            "/airport/flights/import/", {"file": SimpleUploadedFile(name, content), **data}, format="multipart"
+        )
+
+    def test_csv(self):
+        rows = [
+            "source,destination,airplane,departure_time,arrival_time",
+            f"Airport 1a,Airport 1b,Airplane 1,{self.moment(3)},{self.moment(5)}",
+            f"Airport 1a,Nowhere,Airplane 1,{self.moment(6)},{self.moment(8)}",
+            f"Airport 1a,Airport 1b,Airplane 1,{self.moment(1)},{self.moment(2)}",
+            f"Airport 1a,Airport 1b,Airplane 1,{self.moment(7)},{self.moment(6)}",
+            f"Airport 1a,Airport 1b,Airplane 1,{self.moment(4)},{self.moment(6)}",
+            f"Airport 1a,Airport 1b,{self.flight.airplane_id},{self.moment(5)},{self.moment(7)}",
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.upload("schedule.csv", "\n".join(rows).encode())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["created"], 2)
+        busy = "The airplane is already assigned to {} at that time."
+        self.assertEqual(
+            response.data["errors"],
+            [
+                {"line": 3, "errors": {"destination": "'Nowhere' does not exist."}},
+                {"line": 4, "errors": {"airplane": busy.format(f"flight {self.flight.id}")}},
+                {"line": 5, "errors": {"arrival_time": "Arrival must be after departure."}},
+                {"line": 6, "errors": {"airplane": busy.format("the flight on line 2")}},
+            ],
+        )
+        self.assertEqual(
+            list(Flight.objects.order_by("departure_time").values_list("departure_time", flat=True)[1:]),
+            [self.start + datetime.timedelta(hours=3), self.start + datetime.timedelta(hours=5)],
+        )
+        self.assertEqual(FlightSearchIndex.objects.count(), 3)
+
+    def test_ndjson(self):
+        lines = [
+            json.dumps({
+                "route": self.flight.route_id, "airplane": "Airplane 1",
+                "departure_time": self.moment(3), "arrival_time": self.moment(5),
+            }),
+            "",
+            "not json",
+            json.dumps({"route": "x", "airplane": "Airplane 1"}),
+        ]
+        response = self.upload("schedule.ndjson", "\n".join(lines).encode())
+        self.assertEqual(response.data["created"], 1)
+        self.assertEqual([error["line"] for error in response.data["errors"]], [3, 4])
+        self.assertEqual(response.data["errors"][0]["errors"], {"row": "Expected a JSON object."})
+        self.assertEqual(
+            set(response.data["errors"][1]["errors"]), {"route", "departure_time", "arrival_time"}
+        )
+
+    def test_bad_encoding(self):
+        content = f"route,airplane,departure_time,arrival_time\n{self.flight.route_id},Airplane 1,".encode()
+        response = self.upload("schedule.csv", content + "é\n".encode("latin-1"))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {"file": "Line 2 is not valid UTF-8."})
+        self.assertEqual(Flight.objects.count(), 1)
+
+    def test_dry_run_checks_earlier_batches(self):
+        rows = [
+            (line, {"route": self.flight.route_id, "airplane": "Airplane 1",
+                    "departure_time": self.moment(hours), "arrival_time": self.moment(hours + 2)})
+            for line, hours in ((1, 3), (2, 4), (3, 5))
+        ]
+        importer = ScheduleImporter(batch_size=1, dry_run=True).run(rows)
+        self.assertEqual(importer.created, 2)
+        self.assertEqual([error["line"] for error in importer.errors], [2])
+        self.assertEqual(Flight.objects.count(), 1)
+
+    @skipUnless(connection.vendor == "postgresql", "COPY needs PostgreSQL")
+    def test_copy(self):
+        rows = [
+            (line, {"route": self.flight.route_id, "airplane": "Airplane 1",
+                    "departure_time": self.moment(hours), "arrival_time": self.moment(hours + 1)})
+            for line, hours in ((1, 3), (2, 5))
+        ]
+        importer = ScheduleImporter().run(rows)
+        self.assertEqual(importer.created, 2)
+        self.assertEqual(Flight.objects.filter(airplane=self.flight.airplane).count(), 3)
+
+
+class RequestMetricsTestCase(APITestCase):
+    def setUp(self):
+        registry.reset()
+        self.user = User.objects.create_user("user@airport.com", "password")
+        self.client.force_authenticate(self.user)
+        AirportDataFactory(self.user).seed(1)
+
+    def test_server_timing(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get("/airport/orders/")
+        self.assertRegex(
+            response.headers["Server-Timing"],
+            rf'^app;dur=[\d.]+, db;dur=[\d.]+;desc="{len(context.captured_queries)} queries"$',
+        )
+
+    def test_metrics(self):
+        for _ in range(2):
+            self.client.get("/airport/orders/")
+        self.client.get("/airport/orders/0/")
+        self.client.logout()
+        staff = User.objects.create_user("staff@airport.com", "password", is_staff=True)
+        self.client.force_login(staff)
+
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        metrics = response.content.decode()
+        self.assertIn('http_requests_total{view="OrderViewSet.list",method="GET",status="200"} 2', metrics)
+        self.assertIn('http_requests_total{view="OrderViewSet.retrieve",method="GET",status="404"} 1', metrics)
+        self.assertIn('http_request_duration_seconds_count{view="OrderViewSet.list",method="GET"} 2', metrics)
+        self.assertIn(
+            'http_request_duration_seconds_bucket{view="OrderViewSet.list",method="GET",le="+Inf"} 2', metrics
+        )
+        self.assertRegex(metrics, r'db_queries_total\{view="OrderViewSet.list",method="GET"\} [1-9]')
+
+    def test_access(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 403)
+        with self.settings(METRICS_TOKEN="secret"):
+            self.assertEqual(self.client.get("/metrics").status_code, 403)
+            self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer wrong").status_code, 403)
+            self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer secret").status_code, 200)
+        with self.settings(METRICS_TOKEN=""):
+            self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer ").status_code, 403)
+
+
+class RowListTestCase(APITestCase):
+    """The ``values()`` list path must render the same bytes as the model serializers."""
+
+    def setUp(self):
+        self.user = User.objects.create_user("user@airport.com", "password", is_staff=True)
+        self.client.force_authenticate(self.user)
+        AirportDataFactory(self.user).seed(3)
+
+    def assertSameResults(self, path, serializer_class, queryset):
+        expected = JSONRenderer().render(serializer_class(queryset, many=True).data)
+        for query in ("", "?offset=0"):
+            with self.subTest(path + query):
+                response = self.client.get(path + query)
+                self.assertIn(b'"results":' + expected, response.content)
+
+    def test_tickets(self):
+        self.assertSameResults("/airport/tickets/", TicketListSerializer, Ticket.objects.order_by("id"))
+
+    def test_flights(self):
+        Ticket.objects.filter(flight=Flight.objects.order_by("id").first()).delete()
+        self.assertSameResults(
+            "/airport/flights/", FlightListSerializer, Flight.objects.with_occupancy().order_by("departure_time", "id")
+        )
+
+
+class CrewPictureVariantsTestCase(APITestCase):
+    """Crew pictures get resized variants, and the variants of replaced or removed pictures are deleted."""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media_settings = self.settings(MEDIA_ROOT=media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        # render in the test's thread and transaction instead of the pool
+        renderer = mock.patch("airport.signals.schedule_variants", side_effect=generate_variants)
+        renderer.start()
+        self.addCleanup(renderer.stop)
+        self.storage = Crew._meta.get_field("picture_member").storage
+        self.crew = Crew.objects.create(first_name="Anna", last_name="Crew")
+
+    def set_picture(self, picture):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.crew.picture_member = picture
+            self.crew.save()
+        self.crew.refresh_from_db()
+        return self.crew.picture_variants
+
+    @staticmethod
+    def picture(color):
+        output = io.BytesIO()
+        Image.new("RGB", (400, 200), color).save(output, "PNG")
+        return SimpleUploadedFile("anna.png", output.getvalue(), content_type="image/png")
+
+    @staticmethod
+    def file_names(picture_variants):
+        return [name for formats in picture_variants["files"].values() for name in formats.values()]
+
+    def assertFilesExist(self, names, exist=True):
+        for name in names:
+            self.assertEqual(self.storage.exists(name), exist, name)
+
+    def test_generate(self):
+        picture_variants = self.set_picture(self.picture("red"))
+        self.assertEqual(picture_variants["source"], self.crew.picture_member.name)
+        self.assertEqual(set(picture_variants["files"]), set(PICTURE_VARIANTS))
+        self.assertFilesExist(self.file_names(picture_variants))
+        with self.storage.open(picture_variants["files"]["thumbnail"]["webp"]) as thumbnail:
+            with Image.open(thumbnail) as image:
+                self.assertEqual((image.format, image.size), ("WEBP", (96, 48)))
+
+    def test_replaced_picture(self):
+        old_names = self.file_names(self.set_picture(self.picture("red")))
+        new_names = self.file_names(self.set_picture(self.picture("blue")))
+        self.assertFilesExist(old_names, exist=False)
+        self.assertFilesExist(new_names)
+
+    def test_removed_picture(self):
+        names = self.file_names(self.set_picture(self.picture("red")))
+        self.assertEqual(self.set_picture(Crew._meta.get_field("picture_member").default), {})
+        self.assertFilesExist(names, exist=False)
+
+    def test_deleted_crew(self):
+        names = self.file_names(self.set_picture(self.picture("red")))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.crew.delete()
+        self.assertFilesExist(names, exist=False)
+
+    def test_queue_is_bounded(self):
+        executor = mock.Mock()
+        executor.submit.side_effect = lambda *args: Future()
+        with mock.patch("airport.thumbnails.get_executor", return_value=executor):
+            with mock.patch("airport.thumbnails._queue_slots", threading.BoundedSemaphore(2)):
+                first = schedule_variants(self.crew.pk)
+                self.assertIsNotNone(schedule_variants(self.crew.pk))
+                with self.assertLogs("airport.thumbnails", "WARNING"):
+                    self.assertIsNone(schedule_variants(self.crew.pk))
+                first.set_result(True)
+                self.assertIsNotNone(schedule_variants(self.crew.pk))
+        self.assertEqual(executor.submit.call_count, 3)
+
+
+class RouteOccupancyTestCase(APITestCase):
+    """``RouteDailyOccupancy`` maintained from signals must match totals computed from scratch."""
+
+    def setUp(self):
+        self.user = User.objects.create_user("user@airport.com", "password", is_staff=True)
+        self.client.force_authenticate(self.user)
+        self.flights = AirportDataFactory(self.user).seed(3)
+
+    def assertOccupancyMatches(self):
+        expected = {key: totals for key, totals in occupancy_totals(Flight.objects.all()).items() if any(totals)}
+        stored = {
+            (row.route_id, row.date): [row.flights, row.capacity, row.tickets_sold]
+            for row in RouteDailyOccupancy.objects.all()
+            if row.flights or row.capacity or row.tickets_sold
+        }
+        self.assertEqual(stored, expected)
+
+    def test_incremental_updates(self):
+        self.assertOccupancyMatches()
+        first, second, third = self.flights
+
+        response = self.client.post(
+            "/airport/orders/", {"tickets": [{"flight": first.id, "row": 5, "seat": seat} for seat in (1, 2)]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertOccupancyMatches()
+
+        first.tickets.first().delete()
+        self.assertOccupancyMatches()
+
+        first.departure_time += datetime.timedelta(days=2)
+        first.route = second.route
+        first.save()
+        self.assertOccupancyMatches()
+
+        airplane = second.airplane
+        airplane.rows = 20
+        airplane.save()
+        self.assertOccupancyMatches()
+
+        ticket = third.tickets.first()
+        ticket.flight = second
+        ticket.row = 9
+        ticket.save()
+        self.assertOccupancyMatches()
+
+        second.delete()
+        self.assertOccupancyMatches()
+
+        third.route.delete()
+        self.assertOccupancyMatches()
+
+    def test_rows_are_locked_in_key_order(self):
+        first, second, _ = (flight.route_id for flight in self.flights)
+        today = timezone.localdate()
+        tomorrow = today + datetime.timedelta(days=1)
+        deltas = {(second, today): (1, 0, 0), (first, tomorrow): (1, 0, 0), (first, today): (1, 0, 0)}
+        with CaptureQueriesContext(connection) as queries:
+            apply_deltas(deltas)
+        upsert = next(query["sql"] for query in queries if RouteDailyOccupancy._meta.db_table in query["sql"])
+        self.assertEqual(
+            re.findall(r"\((\d+), '([\d-]+)'", upsert),
+            [(str(route_id), date.isoformat()) for route_id, date in sorted(deltas)],
+        )
+
+    def test_report(self):
+        response = self.client.get(f"/airport/reports/route-occupancy/?route={self.flights[0].route_id}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.data["results"],
+            [{
+                "route": self.flights[0].route_id,
+                "date": timezone.localdate(self.flights[0].departure_time).isoformat(),
+                "flights": 1,
+                "capacity": 60,
+                "tickets_sold": 3,
+                "load_factor": 0.05,
+            }],
+        )
+
+
+class FlightSearchIndexTestCase(APITestCase):
+    """``FlightSearchIndex`` maintained from signals must match rows computed from the source tables."""
+
+    def setUp(self):
+        self.user = User.objects.create_user("user@airport.com", "password", is_staff=True)
+        self.client.force_authenticate(self.user)
+        self.flights = AirportDataFactory(self.user).seed(3)
+
+    def assertIndexMatches(self):
+        self.assertEqual(check_index(), ([], [], []))
+
+    def test_incremental_updates(self):
+        self.assertIndexMatches()
+        first, second, third = self.flights
+
+        response = self.client.post(
+            "/airport/orders/", {"tickets": [{"flight": first.id, "row": 5, "seat": seat} for seat in (1, 2)]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertIndexMatches()
+
+        first.tickets.first().delete()
+        first.departure_time += datetime.timedelta(days=2)
+        first.route = second.route
+        first.save()
+        self.assertIndexMatches()
+
+        ticket = third.tickets.first()
+        ticket.flight = second
+        ticket.row = 9
+        ticket.save()
+        self.assertIndexMatches()
+
+        airport = second.route.source
+        airport.closest_big_city = "Lviv"
+        airport.save()
+        route = third.route
+        route.destination = airport
+        route.save()
+        airplane = second.airplane
+        airplane.rows = 20
+        airplane.airplane_type = third.airplane.airplane_type
+        airplane.save()
+        airplane_type = airplane.airplane_type
+        airplane_type.name = "Airbus A380"
+        airplane_type.save()
+        self.assertIndexMatches()
+
+        second.delete()
+        third.route.delete()
+        self.assertIndexMatches()
+        self.assertEqual(FlightSearchIndex.objects.count(), 1)
+
+    def test_check_and_fix(self):
+        first, second, third = self.flights
+        FlightSearchIndex.objects.filter(flight=first).delete()
+        FlightSearchIndex.objects.filter(flight=second).update(tickets_sold=50)
+        self.assertEqual(check_index(fix=True), ([first.id], [second.id], []))
+        self.assertIndexMatches()
+
+    def test_search(self):
+        first = self.flights[0]
+        response = self.client.get(f"/airport/flights/?source_city={first.route.source.closest_big_city.upper()}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([flight["id"] for flight in response.data["results"]], [first.id])
+
+
+class AirportGeoTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("user@airport.com", "password")
+        self.client.force_authenticate(self.user)
+        self.london = Airport.objects.create(name="Heathrow", closest_big_city="London", latitude=51.47, longitude=-0.4543)
+        self.paris = Airport.objects.create(name="Orly", closest_big_city="Paris", latitude=48.7262, longitude=2.3652)
+        self.kyiv = Airport.objects.create(name="Boryspil", closest_big_city="Kyiv", latitude=50.345, longitude=30.8947)
+        Airport.objects.create(name="Unknown", closest_big_city="Nowhere")
+        cache.clear()
+
+    def test_route_distances(self):
+        route = Route.objects.create(source=self.london, destination=self.paris, distance=1)
+        Route.objects.create(source=self.paris, destination=Airport.objects.get(name="Unknown"), distance=7)
+        self.assertEqual(update_route_distances(), (1, 1))
+        route.refresh_from_db()
+        self.assertEqual(route.distance, 365)
+
+    def test_nearest(self):
+        response = self.client.get("/airport/airports/nearest/?latitude=50.45&longitude=30.52&limit=2")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([airport["id"] for airport in response.data], [self.kyiv.id, self.paris.id])
+        self.assertEqual(response.data[0]["distance"], 29.0)
+
+        response = self.client.get("/airport/airports/nearest/?latitude=50.45&longitude=30.52&max_distance=100")
+        self.assertEqual([airport["id"] for airport in response.data], [self.kyiv.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.kyiv.delete()
+        response = self.client.get("/airport/airports/nearest/?latitude=50.45&longitude=30.52&limit=1")
+        self.assertEqual([airport["id"] for airport in response.data], [self.paris.id])
+
+        self.assertEqual(self.client.get("/airport/airports/nearest/?latitude=91&longitude=0").status_code, 400)
+
+    def test_autocomplete(self):
+        zurich = Airport.objects.create(name="Zürich-Kloten", closest_big_city="Zurich")
+        gatwick = Airport.objects.create(name="Gatwick", closest_big_city="London")
+        cache.clear()
+
+        self.client.get("/airport/airports/autocomplete/?q=l")
+        with self.assertNumQueries(0):
+            response = self.client.get("/airport/airports/autocomplete/?q=LOND")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([airport["id"] for airport in response.data], [gatwick.id, self.london.id])
+        self.assertEqual(response.data[0]["closest_big_city"], "London")
+
+        response = self.client.get("/airport/airports/autocomplete/?q=zurich klo")
+        self.assertEqual([airport["id"] for airport in response.data], [zurich.id])
+        response = self.client.get("/airport/airports/autocomplete/?q=KLOTEN")
+        self.assertEqual([airport["id"] for airport in response.data], [zurich.id])
+        response = self.client.get("/airport/airports/autocomplete/?q=k&limit=2")
+        self.assertEqual([airport["id"] for airport in response.data], [self.kyiv.id, zurich.id])
+        self.assertEqual(self.client.get("/airport/airports/autocomplete/?q=").data, [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            gatwick.delete()
+        response = self.client.get("/airport/airports/autocomplete/?q=lon")
+        self.assertEqual([airport["id"] for airport in response.data], [self.london.id])
+
+
+class IdempotencyTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("user@airport.com", "password")
+        self.client.force_authenticate(self.user)
+        self.flight = AirportDataFactory(self.user).seed(1)[0]
+
+    def order(self, seat, key="order-1"):
+        return self.client.post(
+            "/airport/orders/", {"tickets": [{"flight": self.flight.id, "row": 5, "seat": seat}]},
+            format="json", headers={"Idempotency-Key": key},
+        )
+
+    def test_retry_replays_response(self):
+        response = self.order(1)
+        self.assertEqual(response.status_code, 201)
+        orders = Order.objects.count()
+
+        with CaptureQueriesContext(connection) as queries:
+            retry = self.order(1)
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.headers["Idempotent-Replayed"], "true")
+        self.assertEqual(retry.content, response.content)
+        self.assertEqual(Order.objects.count(), orders)
+        self.assertFalse([query for query in queries if query["sql"].startswith(("UPDATE", "DELETE"))])
+
+        self.assertEqual(self.order(2).status_code, 422)
+        self.assertEqual(self.order(2, key="order-2").status_code, 201)
+
+    def test_batch_actions(self):
+        self.user.is_staff = True
+        self.user.save()
+        tickets = [{"flight": self.flight.id, "order": Order.objects.first().id, "row": 6, "seat": 1}]
+        response = self.client.post(
+            "/airport/tickets/batch/", tickets, format="json", headers={"Idempotency-Key": "batch-1"}
+        )
+        self.assertEqual(response.status_code, 201)
+        retry = self.client.post(
+            "/airport/tickets/batch/", tickets, format="json", headers={"Idempotency-Key": "batch-1"}
+        )
+        self.assertEqual(retry.headers["Idempotent-Replayed"], "true")
+        self.assertEqual(retry.content, response.content)
+        response = self.client.post(
+            "/airport/tickets/batch/", [{**tickets[0], "seat": 2}], format="json",
+            headers={"Idempotency-Key": "batch-1"},
+        )
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Ticket.objects.filter(row=6).count(), 1)
+
+        flight = {
+            "route": self.flight.route_id, "airplane": self.flight.airplane_id,
+            "departure_time": self.flight.departure_time + datetime.timedelta(days=1),
+            "arrival_time": self.flight.arrival_time + datetime.timedelta(days=1),
+        }
+        for _ in range(2):
+            response = self.client.post(
+                "/airport/flights/", flight, format="json", headers={"Idempotency-Key": "flight-1"}
+            )
+            self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.headers["Idempotent-Replayed"], "true")
+        self.assertEqual(Flight.objects.count(), 2)
+
+    def test_uploads(self):
+        self.user.is_staff = True
+        self.user.save()
+        rows = (
+            "route,airplane,departure_time,arrival_time\n"
+            f"{self.flight.route_id},{self.flight.airplane_id},2100-01-01T10:00:00Z,2100-01-01T12:00:00Z\n"
+        )
+
+        def upload(content):
+            return self.client.post(
+                "/airport/flights/import/", {"file": SimpleUploadedFile("schedule.csv", content.encode())},
+                format="multipart", headers={"Idempotency-Key": "import-1"},
+            )
+
+        self.assertEqual(upload(rows).status_code, 200)
+        self.assertEqual(upload(rows).headers["Idempotent-Replayed"], "true")
+        self.assertEqual(upload(rows.replace("10:00", "09:00")).status_code, 422)
+        self.assertEqual(Flight.objects.count(), 2)
+
+    def test_running_request(self):
+        IdempotencyKey.objects.create(
+            user=self.user, key="order-1", method="POST", path="/airport/orders/", fingerprint="",
+            expires_at=timezone.now() + datetime.timedelta(hours=1),
+        )
+        with mock.patch("airport.idempotency.request_fingerprint", return_value=""), \
+                mock.patch("airport.idempotency.IDEMPOTENCY_WAIT", 0):
+            self.assertEqual(self.order(1).status_code, 409)
+
+    def test_stale_request_is_taken_over(self):
+        locked_at = timezone.now() - datetime.timedelta(seconds=61)
+        IdempotencyKey.objects.create(
+            user=self.user, key="order-1", method="POST", path="/airport/orders/", fingerprint="",
+            locked_at=locked_at, expires_at=timezone.now() + datetime.timedelta(hours=1),
+        )
+        with mock.patch("airport.idempotency.IDEMPOTENCY_LOCK_TIMEOUT", 60):
+            response = self.order(1)
+        self.assertEqual(response.status_code, 201)
+        claim = IdempotencyKey.objects.get(user=self.user, key="order-1")
+        self.assertEqual(claim.status_code, 201)
+        self.assertGreater(claim.locked_at, locked_at)
+        self.assertEqual(self.order(1).headers["Idempotent-Replayed"], "true")
+
+    def test_failed_request_releases_key(self):
+        self.assertEqual(self.order(99).status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_expired_keys(self):
+        self.order(1)
+        IdempotencyKey.objects.update(expires_at=timezone.now() - datetime.timedelta(seconds=1))
+        self.assertEqual(self.order(2).status_code, 201)
+        IdempotencyKey.objects.update(expires_at=timezone.now() - datetime.timedelta(seconds=1))
+        self.assertEqual(sweep_expired_keys(batch_size=1), 1)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+
+class ScheduleConflictTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("user@airport.com", "password", is_staff=True)
+        self.client.force_authenticate(self.user)
+        self.flights = AirportDataFactory(self.user).seed(3)
+
+    def flight_data(self, start, hours=2, flight=None):
+        flight = flight or self.flights[0]
+        departure_time = flight.departure_time + datetime.timedelta(hours=start)
+        return {
+            "route": flight.route_id,
+            "airplane": flight.airplane_id,
+            "departure_time": departure_time,
+            "arrival_time": departure_time + datetime.timedelta(hours=hours),
+        }
+
+    def test_flight_validation(self):
+        response = self.client.post("/airport/flights/", self.flight_data(1), format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(str(self.flights[0].id), response.data["airplane"])
+        self.assertEqual(self.client.post("/airport/flights/", self.flight_data(1, -1), format="json").status_code, 400)
+
+        response = self.client.post("/airport/flights/", self.flight_data(2), format="json")
+        self.assertEqual(response.status_code, 201)
+        flight_id = response.data["id"]
+        moved = self.flight_data(1)
+        response = self.client.patch(f"/airport/flights/{flight_id}/", {"departure_time": moved["departure_time"]})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.patch(
+            f"/airport/flights/{flight_id}/", {"arrival_time": self.flight_data(5)["departure_time"]}
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_retimed_flight_crew_validation(self):
+        first, second, third = self.flights
+        response = self.client.post("/airport/flights/", self.flight_data(10, flight=third), format="json")
+        flight_id = response.data["id"]
+        crew = Crew.objects.create(first_name="Anna", last_name="Crew")
+        crew.flight.set([first, flight_id])
+
+        moved = {"departure_time": first.departure_time, "arrival_time": first.arrival_time}
+        response = self.client.patch(f"/airport/flights/{flight_id}/", moved, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(str(first.id), response.data["crew"])
+        moved = self.flight_data(20, flight=third)
+        response = self.client.patch(f"/airport/flights/{flight_id}/", moved, format="json")
+        self.assertEqual(response.status_code, 200)
+
+    def test_crew_validation(self):
+        first, second, third = self.flights
+        response = self.client.post(
+            "/airport/crews/", {"first_name": "Anna", "last_name": "Crew", "flight": [first.id, second.id]}
+        )
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(
+            "/airport/crews/", {"first_name": "Anna", "last_name": "Crew", "flight": [first.id, third.id]}
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(sorted(response.data["flight"]), [first.id, third.id])
+
+    def test_report(self):
+        first, second, third = self.flights
+        overlapping = Flight.objects.create(
+            route=first.route, airplane=first.airplane,
+            departure_time=first.departure_time + datetime.timedelta(minutes=30),
+            arrival_time=first.arrival_time,
+        )
+        window = f"departure_after={first.departure_time.date()}&departure_before={third.arrival_time.date()}"
+        response = self.client.get(f"/airport/reports/schedule-conflicts/?{window}&kind=airplane")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(conflict["resource"], conflict["flight"], conflict["conflicting_flight"]) for conflict in response.data],
+            [(first.airplane_id, first.id, overlapping.id)],
+        )
+
+        crews = self.client.get(f"/airport/reports/schedule-conflicts/?{window}&kind=crew").data
+        # every factory crew member is assigned to all of its flights, which overlap by an hour in a chain
+        self.assertEqual(
+            {(conflict["flight"], conflict["conflicting_flight"]) for conflict in crews},
+            {(first.id, second.id), (second.id, third.id)},
+        )
+        second_departure = self.client.get(f"/airport/flights/{second.id}/").data["departure_time"]
+        self.assertEqual(crews[0]["overlap_start"], second_departure)
+
+        earliest = self.client.get(f"/airport/reports/schedule-conflicts/?{window}&limit=1").data
+        self.assertEqual(
+            [(conflict["kind"], conflict["conflicting_flight"]) for conflict in earliest],
+            [("airplane", overlapping.id)],
+        )
+
+
+class BatchWriteTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("user@airport.com", "password", is_staff=True)
+        self.client.force_authenticate(self.user)
+        self.flights = AirportDataFactory(self.user).seed(3)
+        self.order = Order.objects.create(user=self.user)
+
+    def assertDerivedDataMatches(self):
+        self.assertEqual(check_index(), ([], [], []))
+        expected = {key: totals for key, totals in occupancy_totals(Flight.objects.all()).items() if any(totals)}
+        stored = {
+            (row.route_id, row.date): [row.flights, row.capacity, row.tickets_sold]
+            for row in RouteDailyOccupancy.objects.all()
+            if row.flights or row.capacity or row.tickets_sold
+        }
+        self.assertEqual(stored, expected)
+
+    def flight_item(self, flight, days):
+        return {
+            "route": flight.route_id,
+            "airplane": flight.airplane_id,
+            "departure_time": flight.departure_time + datetime.timedelta(days=days),
+            "arrival_time": flight.arrival_time + datetime.timedelta(days=days),
+        }
+
+    def test_flights(self):
+        first, second, third = self.flights
+        response = self.client.post(
+            "/airport/flights/batch/", [self.flight_item(first, 1), self.flight_item(first, 1)], format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.data["errors"][0], {"airplane": "The airplane is already assigned to item 1 at that time."}
+        )
+
+        response = self.client.post(
+            "/airport/flights/batch/", [self.flight_item(first, 1), self.flight_item(second, 2)], format="json"
+        )
+        self.assertEqual(response.status_code, 201)
+        created = [flight["id"] for flight in response.data]
+        self.assertDerivedDataMatches()
+
+        response = self.client.patch(
+            "/airport/flights/batch/",
+            [{"id": first.id, "airplane": second.airplane_id}, {"id": created[1], "route": third.route_id}],
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["errors"][1], {})
+        self.assertIn(str(second.id), response.data["errors"][0]["airplane"])
+
+        moved = self.flight_item(first, 3)
+        response = self.client.patch(
+            "/airport/flights/batch/",
+            [{"id": first.id, "departure_time": moved["departure_time"], "arrival_time": moved["arrival_time"]},
+             {"id": created[1], "route": third.route_id, "airplane": third.airplane_id}],
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[1]["route"], third.route_id)
+        self.assertDerivedDataMatches()
+
+        response = self.client.delete("/airport/flights/batch/", [first.id, created[1], 0], format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(Flight.objects.filter(id=first.id).exists())
+        response = self.client.delete("/airport/flights/batch/", [first.id, created[1]], format="json")
+        self.assertEqual(response.data, {"deleted": [first.id, created[1]]})
+        self.assertFalse(Ticket.objects.filter(flight_id=first.id).exists())
+        self.assertDerivedDataMatches()
+
+    def test_retimed_flight_crew(self):
+        first, second, _ = self.flights
+        response = self.client.post(
+            "/airport/flights/batch/", [self.flight_item(first, 1), self.flight_item(second, 2)], format="json"
+        )
+        created = [flight["id"] for flight in response.data]
+        crew = Crew.objects.create(first_name="Anna", last_name="Crew")
+        crew.flight.set(created)
+
+        def retimed(flight_id, days):
+            item = self.flight_item(second, days)
+            return {"id": flight_id, "departure_time": item["departure_time"], "arrival_time": item["arrival_time"]}
+
+        response = self.client.patch("/airport/flights/batch/", [retimed(created[0], 2)], format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.data["errors"][0],
+            {"crew": f"Crew member {crew.id} is already assigned to flight {created[1]} at that time."},
+        )
+        response = self.client.patch(
+            "/airport/flights/batch/", [retimed(created[0], 2), retimed(created[1], 3)], format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        response = self.client.patch(
+            "/airport/flights/batch/", [retimed(created[0], 4), retimed(created[1], 4)], format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.data["errors"][1]["crew"], f"Crew member {crew.id} is already assigned to item 0 at that time."
+        )
+
+    def test_airplane_swap(self):
+        first, second, _ = self.flights
+        small = Airplane.objects.create(
+            name="Small", rows=1, seats_in_row=2, airplane_type=first.airplane.airplane_type
+        )
+        stranded = list(Ticket.objects.filter(flight=first, seat__gt=2).order_by("id").values_list("id", flat=True))
+        self.assertTrue(stranded)
+
+        response = self.client.patch(
+            "/airport/flights/batch/", [{"id": first.id, "airplane": small.id}, {"id": second.id}], format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(", ".join(map(str, stranded)), response.data["errors"][0]["airplane"])
+        response = self.client.patch(f"/airport/flights/{first.id}/", {"airplane": small.id}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(str(stranded[0]), response.data["airplane"])
+
+        Ticket.objects.filter(id__in=stranded).delete()
+        response = self.client.patch(f"/airport/flights/{first.id}/", {"airplane": small.id}, format="json")
+        self.assertEqual(response.status_code, 200)
+
+    def test_deletes_leave_no_references(self):
+        """Batch deletes skip the collector, so every relation to flights and tickets must be handled by hand."""
+        first, second, _ = self.flights
+        tickets = list(Ticket.objects.filter(flight=second).values_list("id", flat=True))
+        self.client.delete("/airport/flights/batch/", [first.id], format="json")
+        self.client.delete("/airport/tickets/batch/", tickets, format="json")
+        for model, ids in ((Flight, [first.id]), (Ticket, tickets)):
+            for relation in model._meta.get_fields(include_hidden=True):
+                if relation.auto_created and not relation.concrete and relation.field.concrete:
+                    with self.subTest(model=model.__name__, relation=relation.field.model.__name__):
+                        self.assertFalse(
+                            relation.field.model.objects.filter(**{f"{relation.field.name}__in": ids}).exists()
+                        )
+
+    def test_tickets(self):
+        first, second, _ = self.flights
+
+        def items(count):
+            return [
+                {"flight": first.id, "order": self.order.id, "row": 7, "seat": seat} for seat in range(1, count + 1)
+            ]
+
+        with CaptureQueriesContext(connection) as one:
+            response = self.client.post("/airport/tickets/batch/", items(1), format="json")
+        self.assertEqual(response.status_code, 201)
+        Ticket.objects.filter(row=7).delete()
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.post("/airport/tickets/batch/", items(4), format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(many), len(one))
+        self.assertDerivedDataMatches()
+
+        response = self.client.post("/airport/tickets/batch/", items(1) + [{**items(1)[0], "row": 99}], format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(response.data["errors"][0]), ["seat"])
+        self.assertEqual(list(response.data["errors"][1]), ["row"])
+
+        tickets = list(Ticket.objects.filter(row=7).order_by("id").values_list("id", flat=True))
+        response = self.client.patch(
+            "/airport/tickets/batch/",
+            [{"id": tickets[0], "flight": second.id}, {"id": tickets[1], "seat": 6}],
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]["flight"], second.id)
+        self.assertDerivedDataMatches()
+
+        response = self.client.delete("/airport/tickets/batch/", tickets[:3], format="json")
+        self.assertEqual(response.data, {"deleted": tickets[:3]})
+        self.assertEqual(Ticket.objects.filter(row=7).count(), 1)
+        self.assertDerivedDataMatches()
+
+
+class FieldSetTestCase(APITestCase):
+    """``?fields=`` and ``?expand=`` shape the response and the columns the query loads."""
+
+    def setUp(self):
+        self.user = User.objects.create_user("user@airport.com", "password", is_staff=True)
+        self.client.force_authenticate(self.user)
+        self.flights = AirportDataFactory(self.user).seed(2)
+
+    def get(self, path):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(path)
+        return response, "\n".join(query["sql"] for query in context.captured_queries)
+
+    def test_sparse_fields(self):
+        response, sql = self.get("/airport/flights/?fields=id,route")
+        self.assertEqual(
+            response.data["results"], [{"id": flight.id, "route": flight.route_id} for flight in self.flights]
+        )
+        self.assertNotIn("arrival_time", sql)
+
+        response, sql = self.get("/airport/tickets/?fields=seat")
+        self.assertEqual(response.data["results"][:3], [{"seat": 1}, {"seat": 2}, {"seat": 3}])
+        self.assertNotIn("order_id", sql)
+
+        flight = self.flights[0]
+        response, sql = self.get(f"/airport/flights/{flight.id}/?fields=id,route.source.name,tickets_available")
+        self.assertEqual(
+            response.data, {"id": flight.id, "route": {"source": {"name": "Airport 1a"}}, "tickets_available": 57}
+        )
+        self.assertNotIn("closest_big_city", sql)
+        self.assertNotIn("airplane_type", sql)
+
+    def test_expand(self):
+        flight = self.flights[0]
+        response, sql = self.get("/airport/flights/?expand=route.source,airplane.airplane_type&page_size=1")
+        result = response.data["results"][0]
+        self.assertEqual(
+            result["route"],
+            {**RouteListSerializer(flight.route).data, "source": AirportSerializer(flight.route.source).data},
+        )
+        self.assertEqual(
+            result["airplane"]["airplane_type"], AirplaneTypeSerializer(flight.airplane.airplane_type).data
+        )
+        self.assertEqual(result["tickets_sold"], 3)
+        self.assertEqual(sql.count("SELECT"), 2)
+
+        response, _ = self.get("/airport/tickets/?expand=flight.route&fields=id,flight.route.distance&page_size=1")
+        self.assertEqual(
+            response.data["results"],
+            [{"id": flight.tickets.order_by("id").first().id, "flight": {"route": {"distance": 100}}}],
+        )
+
+        response, sql = self.get("/airport/crews/?expand=flight&fields=id,flight.departure_time")
+        self.assertEqual(len(response.data["results"][-1]["flight"]), 2)
+        self.assertNotIn("route_id", sql)
+
+    def test_invalid_fieldsets(self):
+        for query, error in (
+            ("fields=id,nope", {"fields": "Unknown field nope."}),
+            ("expand=route.distance", {"expand": "route.distance cannot be expanded."}),
+            ("fields=departure_time.day", {"fields": "Expand departure_time to pick its fields."}),
+            ("expand=route..source", {"expand": "Invalid field path 'route..source'."}),
+        ):
+            with self.subTest(query):
+                response = self.client.get(f"/airport/flights/?{query}")
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.data, error)
@@ -0,0 +1,145 @@
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection
+from PIL import Image, ImageOps
+
+from airport.models import Crew
+
+# name: (max width, max height); pictures keep their aspect ratio and are never upscaled
+PICTURE_VARIANTS = getattr(settings, "CREW_PICTURE_VARIANTS", {
+    "thumbnail": (96, 96),
+    "small": (320, 320),
+    "medium": (800, 800),
+})
+PICTURE_FORMATS = {"webp": ("WEBP", {"quality": 80, "method": 4}), "jpeg": ("JPEG", {"quality": 85, "optimize": True})}
+THUMBNAIL_WORKERS = getattr(settings, "THUMBNAIL_WORKERS", 2)
+# pictures waiting for or being rendered by the pool at most; more are left to ``manage.py generate_crew_variants``
+THUMBNAIL_QUEUE_SIZE = getattr(settings, "THUMBNAIL_QUEUE_SIZE", THUMBNAIL_WORKERS * 32)
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+_queue_slots = threading.BoundedSemaphore(THUMBNAIL_QUEUE_SIZE)
+
+
+def has_picture(crew):
+    return bool(crew.picture_member) and crew.picture_member.name != Crew._meta.get_field("picture_member").default
+
+
+def variant_name(name, variant, extension):
+    """``crews/anna_smith_<uuid>.png`` -> ``crews/variants/anna_smith_<uuid>_small.webp``."""
+    directory, filename = os.path.split(name)
+    return os.path.join(directory, "variants", f"{os.path.splitext(filename)[0]}_{variant}.{extension}")
+
+
+def render_variants(picture):
+    """Yield ``(variant, extension, bytes)`` for every variant of an open picture file."""
+    with Image.open(picture) as image:
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+    for variant, size in PICTURE_VARIANTS.items():
+        resized = image.copy()
+        resized.thumbnail(size, Image.Resampling.LANCZOS)
+        for extension, (image_format, options) in PICTURE_FORMATS.items():
+            if image_format == "JPEG" or not has_alpha:
+                converted = resized.convert("RGB")
+            else:
+                converted = resized.convert("RGBA")
+            output = io.BytesIO()
+            converted.save(output, image_format, **options)
+            yield variant, extension, output.getvalue()
+
+
+def generate_variants(crew_id):
+    """Write the variants of a crew member's picture and record their names in ``picture_variants``.
+
+    Returns ``False`` when there is nothing to do. Variants of a replaced
+    picture are deleted once the new ones are recorded.
+    """
+    try:
+        crew = Crew.objects.only("picture_member", "picture_variants").get(pk=crew_id)
+        if not has_picture(crew):
+            return False
+        field = crew.picture_member
+        storage = field.storage
+        source = field.name
+        files = {}
+        with field.open("rb") as picture:
+            for variant, extension, content in render_variants(picture):
+                name = variant_name(source, variant, extension)
+                if storage.exists(name):
+                    storage.delete(name)
+                files.setdefault(variant, {})[extension] = storage.save(name, ContentFile(content))
+
+        # the picture may have been replaced while the variants were rendered
+        if not Crew.objects.filter(pk=crew_id, picture_member=source).update(
+            picture_variants={"source": source, "files": files}
+        ):
+            delete_variant_files({"files": files})
+        elif crew.picture_variants.get("source") != source:
+            delete_variant_files(crew.picture_variants)
+        return True
+    finally:
+        # worker threads open their own database connection
+        if threading.current_thread() is not threading.main_thread():
+            connection.close()
+
+
+def delete_variant_files(picture_variants):
+    """Delete the files named in a ``picture_variants`` value."""
+    storage = Crew._meta.get_field("picture_member").storage
+    for formats in picture_variants.get("files", {}).values():
+        for name in formats.values():
+            storage.delete(name)
+
+
+def clear_variants(crew_id):
+    """Forget and delete the variants of a crew member whose picture was removed."""
+    crew = Crew.objects.only("picture_member", "picture_variants").filter(pk=crew_id).first()
+    if crew is None or has_picture(crew) or not crew.picture_variants:
+        return False
+    if Crew.objects.filter(pk=crew_id, picture_variants=crew.picture_variants).update(picture_variants={}):
+        delete_variant_files(crew.picture_variants)
+    return True
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS, thread_name_prefix="thumbnails")
+    return _executor
+
+
+def _finish(crew_id, future):
+    _queue_slots.release()
+    if future.exception() is not None:
+        logger.error("Picture variants of crew %s failed", crew_id, exc_info=future.exception())
+
+
+def schedule_variants(crew_id):
+    """Render the variants in the background pool, outside of the request.
+
+    At most ``THUMBNAIL_QUEUE_SIZE`` pictures are queued or rendered at a
+    time. When the queue is full the picture is skipped and ``None`` is
+    returned; ``manage.py generate_crew_variants`` renders it later.
+    """
+    if not _queue_slots.acquire(blocking=False):
+        logger.warning("Picture variants of crew %s skipped, the thumbnail queue is full", crew_id)
+        return None
+    try:
+        future = get_executor().submit(generate_variants, crew_id)
+    except BaseException:
+        _queue_slots.release()
+        raise
+    future.add_done_callback(partial(_finish, crew_id))
+    return future
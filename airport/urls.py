@@ -1,7 +1,7 @@
 from rest_framework.routers import DefaultRouter
-from django.urls import path, include
+from django.urls import path, include, re_path
 
-from airport import views
+from airport import async_views, views
 
 router = DefaultRouter()
 router.register('airports', views.AirportViewSet)
@@ -14,6 +14,21 @@ router.register("flights", views.FlightViewSet)
 router.register("crews", views.CrewViewSet)
 urlpatterns = [
     path("", include(router.urls)),
+    path("itineraries/", views.ItineraryView.as_view(), name="itineraries"),
+    re_path(
+        r"^exports/(?P<kind>tickets|orders|flights)\.(?P<output_format>ndjson|csv)$",
+        views.ExportView.as_view(),
+        name="exports",
+    ),
+    path(
+        "reports/route-occupancy/", views.RouteOccupancyReportView.as_view(), name="route-occupancy-report"
+    ),
+    path(
+        "reports/schedule-conflicts/", views.ScheduleConflictReportView.as_view(), name="schedule-conflict-report"
+    ),
+    path("async/flights/", async_views.flight_list, name="async-flight-list"),
+    path("async/flights/<int:pk>/", async_views.flight_detail, name="async-flight-detail"),
+    path("async/flights/<int:pk>/seats/", async_views.flight_seats, name="async-flight-seats"),
 ]
 
 app_name = 'airport'
@@ -1,22 +1,96 @@
-from rest_framework import viewsets
+import io
+import os
 
-from airport.models import Airport, Route, AirplaneType, Airplane, Order, Ticket, Flight, Crew
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema, OpenApiParameter
+from rest_framework import generics, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.renderers import JSONRenderer, BrowsableAPIRenderer
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from airport.autocomplete import autocomplete_index
+from airport.batch import (create_flights, create_tickets, delete_flights, delete_tickets, update_flights,
+                           update_tickets)
+from airport.exports import export_lines
+from airport.fieldsets import FieldSetMixin
+from airport.filters import (autocomplete_params, export_params, flight_search_params, itinerary_search_params,
+                             nearest_airports_params, occupancy_report_params, schedule_conflict_params)
+from airport.geo import airport_grid
+from airport.idempotency import IdempotencyMixin
+from airport.itinerary import find_itineraries
+from airport.models import (Airport, Route, AirplaneType, Airplane, Order, Ticket, Flight, Crew, RouteDailyOccupancy,
+                            FlightSearchIndex)
+from airport.pagination import FlightCursorPagination, OccupancyCursorPagination
 from airport.permissions import IsAdminOrIfAuthenticatedReadOnly
+from airport.renderers import SeatMapRenderer
+from airport.response_cache import ReferenceCacheMixin
+from airport.row_serializers import RowListMixin, RowSerializer
+from airport.schedule_import import IMPORT_FORMATS, ScheduleImporter, find_encoding_error
+from airport.scheduling import find_conflicts
+from airport.seat_map import get_seat_map
 from airport.serializers import (AirportSerializer, RouteListSerializer, AirplaneTypeSerializer, AirplaneListSerializer,
                                  TicketListSerializer, FlightListSerializer, CrewListSerializer, RouteDetailSerializer,
                                  AirplaneDetailSerializer, OrderListSerializer, TicketDetailSerializer,
-                                 FlightDetailSerializer, CrewDetailSerializer)
+                                 FlightDetailSerializer, CrewDetailSerializer, SeatMapSerializer,
+                                 OrderCreateSerializer, ItinerarySerializer, OrderHistorySerializer,
+                                 ScheduleImportSerializer, RouteOccupancySerializer, NearestAirportSerializer,
+                                 FlightSerializer, CrewSerializer, ScheduleConflictSerializer, TicketSerializer)
 
 
-class AirportViewSet(viewsets.ModelViewSet):
+class AirportViewSet(ReferenceCacheMixin, FieldSetMixin, viewsets.ModelViewSet):
     queryset = Airport.objects.all()
-    serializer_class = AirportSerializer
     permission_classes = (IsAdminOrIfAuthenticatedReadOnly,)
+    cache_models = (Airport,)
+
+    def get_serializer_class(self):
+        if self.action == 'nearest':
+            return NearestAirportSerializer
+        return AirportSerializer
 
+    @extend_schema(
+        parameters=[
+            OpenApiParameter("q", OpenApiTypes.STR, description="Start of an airport name or city"),
+            OpenApiParameter("limit", OpenApiTypes.INT, description="1-50, default 10"),
+        ],
+        responses=AirportSerializer(many=True),
+    )
+    @action(detail=False, methods=["get"])
+    def autocomplete(self, request):
+        """Type-ahead answered from the in-memory prefix index; case and accents are ignored."""
+        return Response(autocomplete_index.get().search(**autocomplete_params(request.query_params)))
 
-class RouteViewSet(viewsets.ModelViewSet):
+    @extend_schema(
+        parameters=[
+            OpenApiParameter("latitude", OpenApiTypes.FLOAT, required=True),
+            OpenApiParameter("longitude", OpenApiTypes.FLOAT, required=True),
+            OpenApiParameter("limit", OpenApiTypes.INT, description="1-100, default 10"),
+            OpenApiParameter("max_distance", OpenApiTypes.FLOAT, description="Kilometres"),
+        ]
+    )
+    @action(detail=False, methods=["get"])
+    def nearest(self, request):
+        """Airports nearest to a point, nearest first; airports without coordinates are skipped."""
+        nearest = airport_grid.get().nearest(**nearest_airports_params(request.query_params))
+        airports = Airport.objects.in_bulk([airport_id for airport_id, _ in nearest])
+        results = []
+        for airport_id, distance in nearest:
+            if airport_id in airports:
+                airport = airports[airport_id]
+                airport.distance = round(distance, 1)
+                results.append(airport)
+        return Response(NearestAirportSerializer(results, many=True).data)
+
+
+class RouteViewSet(ReferenceCacheMixin, FieldSetMixin, viewsets.ModelViewSet):
     queryset = Route.objects.select_related('source', 'destination')
     permission_classes = (IsAdminOrIfAuthenticatedReadOnly,)
+    cache_models = (Route, Airport)
 
     def get_serializer_class(self):
         if self.action == 'retrieve':
@@ -24,15 +98,23 @@ class RouteViewSet(viewsets.ModelViewSet):
         return RouteListSerializer
 
 
-class AirplaneTypeViewSet(viewsets.ModelViewSet):
+class AirplaneTypeViewSet(ReferenceCacheMixin, FieldSetMixin, viewsets.ModelViewSet):
     queryset = AirplaneType.objects.all()
     serializer_class = AirplaneTypeSerializer
     permission_classes = (IsAdminOrIfAuthenticatedReadOnly,)
+    cache_models = (AirplaneType,)
 
 
-class AirplaneViewSet(viewsets.ModelViewSet):
+class AirplaneViewSet(ReferenceCacheMixin, FieldSetMixin, viewsets.ModelViewSet):
     queryset = Airplane.objects.all()
     permission_classes = (IsAdminOrIfAuthenticatedReadOnly,)
+    cache_models = (Airplane, AirplaneType)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'retrieve':
+            queryset = queryset.select_related("airplane_type")
+        return queryset
 
     def get_serializer_class(self):
         if self.action == 'retrieve':
@@ -40,37 +122,305 @@ class AirplaneViewSet(viewsets.ModelViewSet):
         return AirplaneListSerializer
 
 
-class OrderViewSet(viewsets.ModelViewSet):
+class OrderViewSet(IdempotencyMixin, FieldSetMixin, viewsets.ModelViewSet):
     queryset = Order.objects.all().select_related("user")
-    serializer_class = OrderListSerializer
     permission_classes = (IsAdminOrIfAuthenticatedReadOnly,)
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'history' or not self.request.user.is_staff:
+            queryset = queryset.filter(user=self.request.user)
+        if self.action == 'history':
+            queryset = queryset.prefetch_related(
+                Prefetch(
+                    "tickets",
+                    queryset=Ticket.objects.select_related(
+                        "flight__route__source", "flight__route__destination"
+                    ).order_by("id"),
+                )
+            )
+        return queryset
+
+    def get_permissions(self):
+        if self.action in ('create', 'history'):
+            return (IsAuthenticated(),)
+        return super().get_permissions()
+
+    def get_serializer_class(self):
+        if self.action == 'create':
+            return OrderCreateSerializer
+        if self.action == 'history':
+            return OrderHistorySerializer
+        return OrderListSerializer
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+    @action(detail=False, methods=["get"])
+    def history(self, request):
+        """Orders of the current user with their tickets, flights, routes and airports."""
+        return self.list(request)
 
-class TicketViewSet(viewsets.ModelViewSet):
-    queryset = Ticket.objects.all().select_related("flight__route__source", "flight__route__destination", "order__user")
+
+class TicketViewSet(IdempotencyMixin, RowListMixin, FieldSetMixin, viewsets.ModelViewSet):
+    queryset = Ticket.objects.all()
     permission_classes = (IsAdminOrIfAuthenticatedReadOnly,)
+    row_serializer = RowSerializer(TicketListSerializer)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'retrieve':
+            queryset = queryset.select_related("order__user").prefetch_related(
+                Prefetch(
+                    "flight",
+                    queryset=Flight.objects.select_related(
+                        "route__source", "route__destination", "airplane__airplane_type"
+                    ).with_occupancy(),
+                )
+            )
+        return queryset
 
     def get_serializer_class(self):
         if self.action == 'retrieve':
             return TicketDetailSerializer
+        if self.action in ('create', 'update', 'partial_update'):
+            return TicketSerializer
         return TicketListSerializer
 
+    @action(detail=False, methods=["post"], url_path="batch")
+    def batch_create(self, request):
+        """Create a list of tickets in one transaction; nothing is written if any item is invalid."""
+        tickets = create_tickets(request.data)
+        return Response(TicketListSerializer(tickets, many=True).data, status=status.HTTP_201_CREATED)
+
+    @batch_create.mapping.patch
+    def batch_update(self, request):
+        """Update a list of tickets given with their ``id``; omitted fields keep their values."""
+        return Response(TicketListSerializer(update_tickets(request.data), many=True).data)
+
+    @batch_create.mapping.delete
+    def batch_delete(self, request):
+        """Delete a list of ticket ids."""
+        return Response({"deleted": delete_tickets(request.data)})
+
 
-class FlightViewSet(viewsets.ModelViewSet):
-    queryset = Flight.objects.all().select_related("route__destination", "airplane")
+class FlightViewSet(IdempotencyMixin, RowListMixin, FieldSetMixin, viewsets.ModelViewSet):
+    queryset = Flight.objects.all().select_related("airplane")
     permission_classes = (IsAdminOrIfAuthenticatedReadOnly,)
+    pagination_class = FlightCursorPagination
+    row_serializer = RowSerializer(FlightListSerializer, computed=("tickets_available", "load_factor"))
+
+    def get_queryset(self):
+        if self.action == 'list':
+            params = flight_search_params(self.request.query_params)
+            if self.get_row_serializer() is None:
+                # expanded relations are loaded with the flights
+                return Flight.objects.search(**params).with_occupancy()
+            # searches read the denormalized index, which already carries the occupancy
+            return FlightSearchIndex.objects.search(**params)
+        queryset = super().get_queryset()
+        if self.action == 'retrieve':
+            queryset = queryset.select_related(
+                "route__source", "route__destination", "airplane__airplane_type"
+            ).with_occupancy()
+        return queryset
 
     def get_serializer_class(self):
         if self.action == 'retrieve':
             return FlightDetailSerializer
+        if self.action == 'seats':
+            return SeatMapSerializer
+        if self.action == 'import_schedule':
+            return ScheduleImportSerializer
+        if self.action in ('create', 'update', 'partial_update', 'batch_create', 'batch_update'):
+            return FlightSerializer
         return FlightListSerializer
 
+    @extend_schema(
+        parameters=[
+            OpenApiParameter("source", OpenApiTypes.INT, description="Source airport id"),
+            OpenApiParameter("destination", OpenApiTypes.INT, description="Destination airport id"),
+            OpenApiParameter("source_city", OpenApiTypes.STR, description="Closest big city of the source airport"),
+            OpenApiParameter(
+                "destination_city", OpenApiTypes.STR, description="Closest big city of the destination airport"
+            ),
+            OpenApiParameter(
+                "departure_after", OpenApiTypes.DATETIME, description="Earliest departure, date or datetime"
+            ),
+            OpenApiParameter(
+                "departure_before", OpenApiTypes.DATETIME, description="Latest departure, a date includes the whole day"
+            ),
+        ]
+    )
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @action(detail=True, methods=["get"], renderer_classes=(JSONRenderer, BrowsableAPIRenderer, SeatMapRenderer))
+    def seats(self, request, pk=None):
+        """Seat grid of the flight; ``application/octet-stream`` returns only the packed bitmap."""
+        seat_map = get_seat_map(self.get_object())
+        if request.accepted_renderer.format == SeatMapRenderer.format:
+            return Response(
+                seat_map.to_bytes(),
+                headers={"X-Seat-Rows": seat_map.rows, "X-Seats-In-Row": seat_map.seats_in_row},
+            )
+        return Response(SeatMapSerializer(seat_map).data)
+
+    @action(detail=False, methods=["post"], url_path="batch")
+    def batch_create(self, request):
+        """Create a list of flights in one transaction; nothing is written if any item is invalid."""
+        flights = create_flights(request.data)
+        return Response(FlightSerializer(flights, many=True).data, status=status.HTTP_201_CREATED)
+
+    @batch_create.mapping.patch
+    def batch_update(self, request):
+        """Update a list of flights given with their ``id``, e.g. to retime a route or swap an airplane."""
+        return Response(FlightSerializer(update_flights(request.data), many=True).data)
 
-class CrewViewSet(viewsets.ModelViewSet):
-    queryset = Crew.objects.all().prefetch_related("flight__route__destination")
+    @batch_create.mapping.delete
+    def batch_delete(self, request):
+        """Delete a list of flight ids with their tickets and crew assignments."""
+        return Response({"deleted": delete_flights(request.data)})
+
+    @action(detail=False, methods=["post"], url_path="import", parser_classes=(MultiPartParser,))
+    def import_schedule(self, request):
+        """Bulk import flights from an uploaded CSV or NDJSON file; invalid rows are reported by line."""
+        upload = request.FILES.get("file")
+        if upload is None:
+            raise ValidationError({"file": "Upload a CSV or NDJSON schedule file."})
+        import_format = request.data.get("format") or (
+            "csv" if os.path.splitext(upload.name)[1].lower() == ".csv" else "ndjson"
+        )
+        if import_format not in IMPORT_FORMATS:
+            raise ValidationError({"format": f"Expected one of {', '.join(IMPORT_FORMATS)}."})
+
+        line_number = find_encoding_error(upload.chunks())
+        if line_number is not None:
+            raise ValidationError({"file": f"Line {line_number} is not valid UTF-8."})
+        upload.seek(0)
+
+        importer = ScheduleImporter()
+        stream = io.TextIOWrapper(upload.file, encoding="utf-8", newline="")
+        importer.run(importer.read_rows(stream, import_format))
+        return Response(ScheduleImportSerializer(importer).data)
+
+
+class CrewViewSet(FieldSetMixin, viewsets.ModelViewSet):
+    queryset = Crew.objects.all()
     permission_classes = (IsAdminOrIfAuthenticatedReadOnly,)
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'retrieve':
+            return queryset.prefetch_related(
+                Prefetch(
+                    "flight",
+                    queryset=Flight.objects.select_related(
+                        "route__source", "route__destination", "airplane__airplane_type"
+                    ).with_occupancy(),
+                )
+            )
+        return queryset.prefetch_related("flight")
+
     def get_serializer_class(self):
         if self.action == 'retrieve':
             return CrewDetailSerializer
+        if self.action in ('create', 'update', 'partial_update'):
+            return CrewSerializer
         return CrewListSerializer
+
+
+class ItineraryView(generics.GenericAPIView):
+    serializer_class = ItinerarySerializer
+    permission_classes = (IsAdminOrIfAuthenticatedReadOnly,)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter("source", OpenApiTypes.INT, required=True, description="Source airport id"),
+            OpenApiParameter("destination", OpenApiTypes.INT, required=True, description="Destination airport id"),
+            OpenApiParameter(
+                "departure_after", OpenApiTypes.DATETIME, description="Earliest first departure, defaults to now"
+            ),
+            OpenApiParameter(
+                "departure_before", OpenApiTypes.DATETIME, description="Latest first departure, defaults to +24h"
+            ),
+            OpenApiParameter("max_legs", OpenApiTypes.INT, description="1 to 3, defaults to 3"),
+            OpenApiParameter("min_connection", OpenApiTypes.INT, description="Minutes between legs, defaults to 45"),
+            OpenApiParameter("sort", OpenApiTypes.STR, enum=("distance", "duration"), description="Ranking"),
+            OpenApiParameter("limit", OpenApiTypes.INT, description="1 to 50, defaults to 10"),
+        ]
+    )
+    def get(self, request, *args, **kwargs):
+        itineraries = find_itineraries(**itinerary_search_params(request.query_params))
+        return Response(self.get_serializer(itineraries, many=True).data)
+
+
+class RouteOccupancyReportView(generics.ListAPIView):
+    """Flights, seats, sold tickets and load factor per route and departure day, read from the aggregate table."""
+
+    serializer_class = RouteOccupancySerializer
+    permission_classes = (IsAdminUser,)
+    pagination_class = OccupancyCursorPagination
+
+    def get_queryset(self):
+        return RouteDailyOccupancy.objects.filter(**occupancy_report_params(self.request.query_params))
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter("route", OpenApiTypes.INT, description="Route id"),
+            OpenApiParameter("source", OpenApiTypes.INT, description="Source airport id"),
+            OpenApiParameter("destination", OpenApiTypes.INT, description="Destination airport id"),
+            OpenApiParameter("date_after", OpenApiTypes.DATE, description="First departure day, inclusive"),
+            OpenApiParameter("date_before", OpenApiTypes.DATE, description="Last departure day, inclusive"),
+        ]
+    )
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+
+class ScheduleConflictReportView(generics.GenericAPIView):
+    """Pairs of flights that share an airplane or a crew member while both are in the air."""
+
+    serializer_class = ScheduleConflictSerializer
+    permission_classes = (IsAdminUser,)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                "departure_after", OpenApiTypes.DATETIME, description="Start of the window, defaults to now"
+            ),
+            OpenApiParameter(
+                "departure_before", OpenApiTypes.DATETIME, description="End of the window, defaults to +7 days"
+            ),
+            OpenApiParameter("kind", OpenApiTypes.STR, enum=("airplane", "crew"), description="Both by default"),
+            OpenApiParameter(
+                "limit", OpenApiTypes.INT,
+                description="Earliest conflicts listed, 100 by default and 1000 at most; narrow the window for more",
+            ),
+        ]
+    )
+    def get(self, request, *args, **kwargs):
+        conflicts = find_conflicts(**schedule_conflict_params(request.query_params))
+        return Response(self.get_serializer(conflicts, many=True).data)
+
+
+class ExportView(APIView):
+    permission_classes = (IsAdminUser,)
+    content_types = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter("departure_after", OpenApiTypes.DATETIME, description="Earliest flight departure"),
+            OpenApiParameter(
+                "departure_before", OpenApiTypes.DATETIME, description="Latest flight departure, a date includes the whole day"
+            ),
+            OpenApiParameter("since_id", OpenApiTypes.INT, description="Only rows with a greater id"),
+            OpenApiParameter("since", OpenApiTypes.DATETIME, description="Only orders/tickets created from this moment"),
+        ],
+        responses={(200, "application/x-ndjson"): OpenApiTypes.STR, (200, "text/csv"): OpenApiTypes.STR},
+    )
+    def get(self, request, kind, output_format):
+        lines = export_lines(kind, output_format, **export_params(request.query_params))
+        response = StreamingHttpResponse(lines, content_type=self.content_types[output_format])
+        response["Content-Disposition"] = f'attachment; filename="{kind}.{output_format}"'
+        return response
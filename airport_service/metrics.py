@@ -0,0 +1,211 @@
+"""Per-endpoint request metrics.
+
+``RequestMetricsMiddleware`` records request latency histograms, SQL query
+counts and SQL time per endpoint. It adds a ``Server-Timing`` header to
+every response, and ``metrics_view`` serves the totals in the Prometheus
+text format. Endpoints are labelled with the DRF viewset and action, e.g.
+``FlightViewSet.list``, so the number of series stays bounded.
+
+The numbers are kept in memory per process: with several workers, every
+worker has to be scraped on its own.
+"""
+import bisect
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from hmac import compare_digest
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class EndpointMetrics:
+    __slots__ = ("buckets", "duration", "requests", "queries", "query_duration", "statuses")
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.duration = 0.0
+        self.requests = 0
+        self.queries = 0
+        self.query_duration = 0.0
+        self.statuses = defaultdict(int)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = defaultdict(EndpointMetrics)
+
+    def observe(self, view, method, status, duration, queries, query_duration):
+        with self.lock:
+            metrics = self.endpoints[view, method]
+            metrics.buckets[bisect.bisect_left(LATENCY_BUCKETS, duration)] += 1
+            metrics.duration += duration
+            metrics.requests += 1
+            metrics.queries += queries
+            metrics.query_duration += query_duration
+            metrics.statuses[status] += 1
+
+    def reset(self):
+        with self.lock:
+            self.endpoints.clear()
+
+    def render(self):
+        """Return the metrics in the Prometheus text exposition format."""
+        with self.lock:
+            endpoints = sorted(self.endpoints.items())
+            lines = [
+                "# HELP http_request_duration_seconds Request latency by endpoint.",
+                "# TYPE http_request_duration_seconds histogram",
+            ]
+            for (view, method), metrics in endpoints:
+                labels = f'view="{_escape(view)}",method="{method}"'
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), metrics.buckets):
+                    cumulative += count
+                    lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f"http_request_duration_seconds_sum{{{labels}}} {metrics.duration:.6f}")
+                lines.append(f"http_request_duration_seconds_count{{{labels}}} {metrics.requests}")
+
+            lines += ["# HELP http_requests_total Requests by endpoint and status.", "# TYPE http_requests_total counter"]
+            for (view, method), metrics in endpoints:
+                for status, count in sorted(metrics.statuses.items()):
+                    lines.append(
+                        f'http_requests_total{{view="{_escape(view)}",method="{method}",status="{status}"}} {count}'
+                    )
+
+            lines += ["# HELP db_queries_total SQL queries by endpoint.", "# TYPE db_queries_total counter"]
+            lines += [
+                f'db_queries_total{{view="{_escape(view)}",method="{method}"}} {metrics.queries}'
+                for (view, method), metrics in endpoints
+            ]
+            lines += [
+                "# HELP db_query_duration_seconds_total Time spent in SQL queries by endpoint.",
+                "# TYPE db_query_duration_seconds_total counter",
+            ]
+            lines += [
+                f'db_query_duration_seconds_total{{view="{_escape(view)}",method="{method}"}} '
+                f"{metrics.query_duration:.6f}"
+                for (view, method), metrics in endpoints
+            ]
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+registry = MetricsRegistry()
+
+
+def view_label(request):
+    """``ViewSet.action`` for DRF viewsets, the view class or function name otherwise."""
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unmatched"
+    view = match.func
+    view_class = getattr(view, "cls", None) or getattr(view, "view_class", None)
+    if view_class is None:
+        return getattr(view, "__name__", match.view_name)
+    action = (getattr(view, "actions", None) or {}).get(request.method.lower())
+    return f"{view_class.__name__}.{action}" if action else view_class.__name__
+
+
+class QueryTimer:
+    def __init__(self):
+        self.queries = 0
+        self.duration = 0.0
+
+
+# the timer of the current request; a context variable also reaches the thread
+# that runs the ORM calls of async views
+current_timer = ContextVar("current_timer", default=None)
+
+
+def time_query(execute, sql, params, many, context):
+    """Execute wrapper that adds the query to the current request's timer."""
+    timer = current_timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timer.duration += time.perf_counter() - started
+        timer.queries += 1
+
+
+def install_query_timer(sender=None, connection=connection, **kwargs):
+    """Install ``time_query`` on the connection once, instead of per request with ``connection.execute_wrapper()``.
+
+    Database connections belong to a thread, and async views run their
+    queries in another thread than the middleware, so the wrapper is added
+    to every connection as it is opened rather than around each request.
+    """
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+connection_created.connect(install_query_timer, dispatch_uid="install_query_timer")
+
+
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        # connections opened before this module was imported missed connection_created
+        install_query_timer()
+        timer = QueryTimer()
+        token = current_timer.set(timer)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_timer.reset(token)
+        return self.finish(request, response, time.perf_counter() - started, timer)
+
+    async def __acall__(self, request):
+        timer = QueryTimer()
+        token = current_timer.set(timer)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_timer.reset(token)
+        return self.finish(request, response, time.perf_counter() - started, timer)
+
+    @staticmethod
+    def finish(request, response, duration, timer):
+        # streaming responses are timed until their headers are ready
+        registry.observe(
+            view_label(request), request.method, response.status_code, duration, timer.queries, timer.duration
+        )
+        response.headers["Server-Timing"] = (
+            f'app;dur={duration * 1000:.1f}, db;dur={timer.duration * 1000:.1f};desc="{timer.queries} queries"'
+        )
+        return response
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint for ``Authorization: Bearer <METRICS_TOKEN>`` or signed-in staff users."""
+    token = getattr(settings, "METRICS_TOKEN", None)
+    authorization = request.headers.get("Authorization", "").encode()
+    has_token = bool(token) and compare_digest(authorization, f"Bearer {token}".encode())
+    user = getattr(request, "user", None)
+    if not has_token and not (user is not None and user.is_staff):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
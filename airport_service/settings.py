@@ -23,7 +23,7 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = 'django-insecure-(i4-z6mut@2b78z6uhk@-=lbm5l(cexbh@af#!i5a%5cq!vj49'
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = os.environ.get("DJANGO_DEBUG", "true").lower() in ("1", "true", "yes")
 
 ALLOWED_HOSTS = []
 
@@ -38,7 +38,6 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
 
     "rest_framework",
-    "debug_toolbar",
     "drf_spectacular",
     'rest_framework_simplejwt',
 
@@ -47,8 +46,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "airport_service.metrics.RequestMetricsMiddleware",
     'django.middleware.security.SecurityMiddleware',
-    "debug_toolbar.middleware.DebugToolbarMiddleware",
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -57,6 +56,12 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# the toolbar slows every request down, so it is only enabled for local development
+if DEBUG:
+    INSTALLED_APPS.append("debug_toolbar")
+    MIDDLEWARE.insert(MIDDLEWARE.index('django.middleware.security.SecurityMiddleware') + 1,
+                      "debug_toolbar.middleware.DebugToolbarMiddleware")
+
 ROOT_URLCONF = 'airport_service.urls'
 
 TEMPLATES = [
@@ -99,6 +104,26 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get("CACHE_BACKEND") or "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": os.environ.get("CACHE_LOCATION", ""),
+    }
+}
+
+REFERENCE_CACHE_ALIAS = "default"
+
+REFERENCE_CACHE_TIMEOUT = 60 * 60
+
+# seconds an Idempotency-Key and its response are kept, and seconds a retry waits for the original request
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+IDEMPOTENCY_WAIT = 5
+# seconds after which a request that claimed a key and never answered is presumed dead and a retry takes the key over
+IDEMPOTENCY_LOCK_TIMEOUT = 60
+
+# bearer token for scraping /metrics; without it only signed-in staff users can read it
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -120,15 +145,24 @@ AUTH_PASSWORD_VALIDATORS = [
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',)
+        'user.authentication.CachedJWTAuthentication',),
+    'DEFAULT_PAGINATION_CLASS': 'airport.pagination.IdCursorPagination',
+    'PAGE_SIZE': 100,
 }
 
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(days=7),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
+    "TOKEN_OBTAIN_SERIALIZER": "user.serializers.TokenObtainPairSerializer",
 
 }
 
+# seconds CachedJWTAuthentication keeps a user in the cache
+USER_CACHE_TIMEOUT = 60
+
+# build the user from the token claims without any lookup, is_staff changes apply to new tokens only
+JWT_STATELESS_USER = os.environ.get("JWT_STATELESS_USER", "false").lower() in ("1", "true", "yes")
+
 INTERNAL_IPS = [
     '127.0.0.1',
 ]
@@ -0,0 +1,109 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+USER_CACHE_TIMEOUT = getattr(settings, "USER_CACHE_TIMEOUT", 60)
+JWT_STATELESS_USER = getattr(settings, "JWT_STATELESS_USER", False)
+# the columns authentication and permission checks read; other fields are loaded on access
+CACHED_USER_FIELDS = ("email", "is_active", "is_staff", "is_superuser")
+
+
+def user_cache_key(user_id):
+    return f"user:auth:{user_id}"
+
+
+def invalidate_cached_user(user_id):
+    cache.delete(user_cache_key(user_id))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """``JWTAuthentication`` that loads the user from a short-lived cache instead of the database.
+
+    Only ``CACHED_USER_FIELDS`` are cached, plus a hash of the password hash
+    when ``CHECK_REVOKE_TOKEN`` is on. Saving or deleting a user drops the
+    entry on commit. Processes that share the cache see that on their next
+    request; with a process-local cache (see the ``airport.W001`` deploy
+    check) other processes keep the old user for up to
+    ``USER_CACHE_TIMEOUT`` seconds.
+
+    With ``JWT_STATELESS_USER`` the user is built from the ``email`` and
+    ``is_staff`` claims of the token without any lookup; tokens without
+    these claims fall back to the cache. Such users are not saved rows, and
+    ``is_staff`` stays as it was when the token was issued.
+    """
+
+    def get_user_id(self, validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+    def get_stateless_user(self, validated_token):
+        if not JWT_STATELESS_USER or "email" not in validated_token or "is_staff" not in validated_token:
+            return None
+        return self.user_model(**{
+            api_settings.USER_ID_FIELD: self.get_user_id(validated_token),
+            "email": validated_token["email"],
+            "is_staff": validated_token["is_staff"],
+            "is_active": True,
+        })
+
+    def cache_entry(self, user):
+        """Return ``(field names, values, password hash)``, what the cache keeps of ``user``."""
+        names = [
+            field.attname for field in self.user_model._meta.concrete_fields
+            if field.primary_key or field.attname in CACHED_USER_FIELDS
+        ]
+        password_hash = get_md5_hash_password(user.password) if api_settings.CHECK_REVOKE_TOKEN else None
+        return names, [getattr(user, name) for name in names], password_hash
+
+    def user_from_entry(self, entry):
+        """Return ``(user, password hash)`` for a cache entry; the user's other fields are deferred."""
+        names, values, password_hash = entry
+        return self.user_model.from_db(DEFAULT_DB_ALIAS, names, values), password_hash
+
+    def check_user(self, user, password_hash, validated_token):
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != password_hash:
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+        return user
+
+    def get_user(self, validated_token):
+        user = self.get_stateless_user(validated_token)
+        if user is not None:
+            return user
+        user_id = self.get_user_id(validated_token)
+        entry = cache.get(user_cache_key(user_id))
+        if entry is not None:
+            return self.check_user(*self.user_from_entry(entry), validated_token)
+        user = self.user_model.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).first()
+        if user is None:
+            return self.check_user(None, None, validated_token)
+        entry = self.cache_entry(user)
+        cache.set(user_cache_key(user_id), entry, USER_CACHE_TIMEOUT)
+        return self.check_user(user, entry[2], validated_token)
+
+    async def aget_user(self, validated_token):
+        """Async version of ``get_user`` for the async views."""
+        user = self.get_stateless_user(validated_token)
+        if user is not None:
+            return user
+        user_id = self.get_user_id(validated_token)
+        entry = await cache.aget(user_cache_key(user_id))
+        if entry is not None:
+            return self.check_user(*self.user_from_entry(entry), validated_token)
+        user = await self.user_model.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).afirst()
+        if user is None:
+            return self.check_user(None, None, validated_token)
+        entry = self.cache_entry(user)
+        await cache.aset(user_cache_key(user_id), entry, USER_CACHE_TIMEOUT)
+        return self.check_user(user, entry[2], validated_token)
@@ -1,3 +1,115 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.settings import api_settings
+
+from user.authentication import user_cache_key
+from user.models import User
+
+
+class UserEndpointsTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("login@airport.com", "password")
+
+    def obtain_tokens(self, password="password"):
+        return self.client.post("/user/api/token/", {"email": "login@airport.com", "password": password}, format="json")
+
+    def test_register(self):
+        response = self.client.post(
+            "/user/register/", {"email": "new@airport.com", "password": "password"}, format="json"
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn("password", response.data)
+        self.assertTrue(User.objects.get(email="new@airport.com").check_password("password"))
+
+        response = self.client.post(
+            "/user/register/", {"email": "new@airport.com", "password": "password"}, format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_token_obtain(self):
+        self.assertEqual(self.obtain_tokens("wrong").status_code, 401)
+
+        response = self.obtain_tokens()
+        self.assertEqual(response.status_code, 200)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+        self.assertEqual(self.client.get("/airport/orders/").status_code, 200)
+
+    def test_token_refresh(self):
+        refresh = self.obtain_tokens().data["refresh"]
+        response = self.client.post("/user/api/token/refresh/", {"refresh": refresh}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+        self.assertEqual(self.client.get("/airport/orders/").status_code, 200)
+
+        response = self.client.post("/user/api/token/refresh/", {"refresh": refresh[:-1]}, format="json")
+        self.assertEqual(response.status_code, 401)
+
+    def test_token_verify(self):
+        access = self.obtain_tokens().data["access"]
+        self.assertEqual(self.client.post("/user/api/token/verify/", {"token": access}, format="json").status_code, 200)
+        response = self.client.post("/user/api/token/verify/", {"token": access[:-1]}, format="json")
+        self.assertEqual(response.status_code, 401)
+
+
+class CachedJWTAuthenticationTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("cached@airport.com", "password")
+        response = self.client.post(
+            "/user/api/token/", {"email": "cached@airport.com", "password": "password"}, format="json"
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+
+    def user_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get("/airport/orders/")
+        return response, [query["sql"] for query in context.captured_queries if 'FROM "user_user"' in query["sql"]]
+
+    def test_user_is_cached_until_saved(self):
+        self.assertEqual(len(self.user_queries()[1]), 1)
+        self.assertEqual(len(self.user_queries()[1]), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        response, queries = self.user_queries()
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(len(queries), 1)
+
+    def test_cache_keeps_no_password(self):
+        self.user.is_staff = True
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.user_queries()
+        entry = cache.get(user_cache_key(self.user.id))
+        self.assertNotIn(self.user.password, repr(entry))
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post("/airport/airports/", {"name": "New", "closest_big_city": "City"})
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse([query for query in context.captured_queries if 'FROM "user_user"' in query["sql"]])
+
+    def test_token_revoked_by_password_change(self):
+        with mock.patch.object(api_settings, "CHECK_REVOKE_TOKEN", True):
+            response = self.client.post(
+                "/user/api/token/", {"email": "cached@airport.com", "password": "password"}, format="json"
+            )
+            self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+            self.assertEqual(self.user_queries()[0].status_code, 200)
+            self.assertEqual(self.user_queries()[0].status_code, 200)
+
+            self.user.set_password("changed")
+            with self.captureOnCommitCallbacks(execute=True):
+                self.user.save()
+            self.assertEqual(self.user_queries()[0].status_code, 401)
+
+    def test_stateless_user(self):
+        with mock.patch("user.authentication.JWT_STATELESS_USER", True):
+            response, queries = self.user_queries()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(queries, [])